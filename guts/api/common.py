@@ -218,6 +218,20 @@ def get_sort_params(params, default_key='created_at', default_dir='desc'):
     return sort_keys, sort_dirs
 
 
+def get_filters(params, allowed_filters):
+    """Retrieves the equality filters supported by a collection.
+
+    :param params: webob.multidict of request parameters (from
+                   guts.api.openstack.wsgi.Request.params)
+    :param allowed_filters: dict mapping each supported request parameter to
+                            the column it filters on
+    :returns: dict of column name to requested value
+    """
+    return dict((column, params[name])
+                for name, column in allowed_filters.items()
+                if name in params)
+
+
 def get_request_url(request):
     url = request.application_url
     headers = request.headers
@@ -270,6 +284,15 @@ class ViewBuilder(object):
                 {"rel": "bookmark",
                  "href": self._get_bookmark_link(request, identifier), }]
 
+    def _get_collection(self, request, items, collection_name, item_list):
+        """Wrap item_list with the 'next' link of a paginated collection."""
+        collection = {collection_name: item_list}
+        links = self._get_collection_links(request, items, collection_name,
+                                           id_key='id')
+        if links:
+            collection['%s_links' % collection_name] = links
+        return collection
+
     def _get_next_link(self, request, identifier, collection_name):
         """Return href string with proper limit and marker params."""
         params = request.params.copy()
@@ -18,20 +18,32 @@
 import six
 import webob
 
+from oslo_config import cfg
 from oslo_log import log as logging
+from oslo_utils import strutils
 
+from guts.api import common
 from guts.api import extensions
 from guts.api.openstack import wsgi
 from guts.api.views import migrations as views_migrations
 from guts import exception
+from guts.i18n import _
+from guts.migration import conversion
+from guts.migration import events
 from guts.migration import migrations
+from guts.migration import target
 from guts import rpc
 from guts import utils
 
+CONF = cfg.CONF
 LOG = logging.getLogger(__name__)
 
 authorize = extensions.extension_authorizer('migration', 'migrations_manage')
 
+# Request parameters accepted as filters, mapped to the column they match.
+MIGRATION_FILTERS = {'status': 'migration_status',
+                     'source_instance_id': 'source_instance_id'}
+
 
 class MigrationsController(wsgi.Controller):
     """The migration API controller for the OpenStack API."""
@@ -54,8 +66,17 @@ class MigrationsController(wsgi.Controller):
     def index(self, req):
         """Returns the list of Migrations."""
         context = req.environ['guts.context']
-        mgts = migrations.get_all_migrations(context)
-        mgts = list(mgts.values())
+        params = req.params.copy()
+        marker, limit, __ = common.get_pagination_params(params)
+        sort_keys, sort_dirs = common.get_sort_params(params,
+                                                      default_key='name',
+                                                      default_dir='asc')
+        sort_keys = [MIGRATION_FILTERS.get(key, key) for key in sort_keys]
+        filters = common.get_filters(params, MIGRATION_FILTERS)
+        mgts = migrations.get_all_migrations(context, filters=filters,
+                                             marker=marker, limit=limit,
+                                             sort_keys=sort_keys,
+                                             sort_dirs=sort_dirs)
         req.cache_resource(mgts, name='migrations')
         return self._view_builder.index(req, mgts)
 
@@ -70,6 +91,45 @@ class MigrationsController(wsgi.Controller):
 
         return self._view_builder.show(req, migration)
 
+    def events(self, req, id):
+        """Returns the events of a migration after the since cursor.
+
+        Waits up to timeout seconds, bounded by migration_events_max_timeout,
+        for an event when there is none yet. Without since, returns the
+        current status of the migration right away.
+        """
+        context = req.environ['guts.context']
+        migrations.check_policy(context, 'get_migration')
+        try:
+            since = req.params.get('since')
+            since = int(since) if since is not None else None
+            timeout = int(req.params.get('timeout',
+                                         CONF.migration_events_max_timeout))
+        except ValueError:
+            msg = _("since and timeout must be integers")
+            raise webob.exc.HTTPBadRequest(explanation=msg)
+        timeout = max(0, min(timeout, CONF.migration_events_max_timeout))
+
+        event_log = events.get_event_log()
+        if not event_log.has_events(id):
+            # Nothing heard of the migration by this worker yet, check it
+            # exists before waiting on it.
+            try:
+                migration = migrations.get_migration(context, id)
+            except exception.NotFound:
+                raise webob.exc.HTTPNotFound()
+            if since is None:
+                # Start the client off the stored status.
+                return self._view_builder.events(req, [
+                    {'cursor': 0,
+                     'migration_status': migration.get('migration_status'),
+                     'migration_event': migration.get('migration_event')}],
+                    0)
+
+        found = event_log.wait(id, since, timeout)
+        cursor = found[-1]['cursor'] if found else since
+        return self._view_builder.events(req, found, cursor)
+
     def create(self, req, body):
         """Creates a migration process."""
         ctxt = req.environ['guts.context']
@@ -80,16 +140,30 @@ class MigrationsController(wsgi.Controller):
         name = migration.get('name', None)
         source_instance_id = migration.get('source_instance_id')
         description = migration.get('description')
+        conversion_profile = migration.get('conversion_profile')
 
         if description is not None:
             utils.check_string_length(description, 'Migration description',
                                       min_length=0, max_length=255)
+        # Checked against the target here too, so a profile the target
+        # can't convert with fails the request rather than the migration.
+        conversion.get_profile(conversion_profile,
+                               target.get_output_format())
+        try:
+            warm = strutils.bool_from_string(migration.get('warm', False),
+                                             strict=True)
+        except ValueError:
+            msg = _("Invalid value '%s' for warm") % migration.get('warm')
+            raise webob.exc.HTTPBadRequest(explanation=msg)
 
         try:
             migration = migrations.create(ctxt,
                                           name,
                                           source_instance_id,
-                                          description=description)
+                                          description=description,
+                                          conversion_profile=(
+                                              conversion_profile),
+                                          warm=warm)
             req.cache_resource(migration, name='migrations')
             self._notify_migration_info(
                 ctxt, 'migration.create', migration)
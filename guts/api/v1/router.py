@@ -41,7 +41,7 @@ class APIRouter(guts.api.openstack.APIRouter):
         mapper.resource("migration", "migrations",
                         controller=self.resources['migrations'],
                         collection={'detail': 'GET'},
-                        member={'action': 'POST'})
+                        member={'action': 'POST', 'events': 'GET'})
 
         self.resources['types'] = types.create_resource(ext_mgr)
         mapper.resource("type", "types",
@@ -20,6 +20,7 @@ import webob
 
 from oslo_log import log as logging
 
+from guts.api import common
 from guts.api import extensions
 from guts.api.openstack import wsgi
 from guts.api.views import sources as views_sources
@@ -33,6 +34,9 @@ LOG = logging.getLogger(__name__)
 
 authorize = extensions.extension_authorizer('migration', 'sources_manage')
 
+# Request parameters accepted as filters, mapped to the column they match.
+SOURCE_FILTERS = {'source_type_id': 'source_type_id'}
+
 
 class SourcesController(wsgi.Controller):
     """The source hypervisor API controller for the OpenStack API."""
@@ -54,8 +58,16 @@ class SourcesController(wsgi.Controller):
     def index(self, req):
         """Returns the list of Source Hypervisors."""
         context = req.environ['guts.context']
-        hsources = sources.get_all_sources(context)
-        hsources = list(hsources.values())
+        params = req.params.copy()
+        marker, limit, __ = common.get_pagination_params(params)
+        sort_keys, sort_dirs = common.get_sort_params(params,
+                                                      default_key='name',
+                                                      default_dir='asc')
+        filters = common.get_filters(params, SOURCE_FILTERS)
+        hsources = sources.get_all_sources(context, filters=filters,
+                                           marker=marker, limit=limit,
+                                           sort_keys=sort_keys,
+                                           sort_dirs=sort_dirs)
         req.cache_resource(hsources, name='sources')
         return self._view_builder.index(req, context, hsources)
 
@@ -19,11 +19,14 @@ import webob
 from webob import exc
 
 from oslo_log import log as logging
+from oslo_utils import strutils
 
+from guts.api import common
 from guts.api import extensions
 from guts.api.openstack import wsgi
 from guts.api.views import vms as views_vms
 from guts import exception
+from guts.i18n import _
 from guts.migration import vms
 from guts import rpc
 
@@ -31,6 +34,9 @@ LOG = logging.getLogger(__name__)
 
 authorize = extensions.extension_authorizer('migration', 'vms_manage')
 
+# Request parameters accepted as filters, mapped to the column they match.
+VM_FILTERS = {'source_id': 'source_id', 'migrated': 'migrated'}
+
 
 class VMsController(wsgi.Controller):
     """The source VM API controller for the OpenStack API."""
@@ -52,8 +58,23 @@ class VMsController(wsgi.Controller):
     def index(self, req):
         """Returns the list of Source VMs."""
         context = req.environ['guts.context']
-        svms = vms.get_all_vms(context)
-        svms = list(svms.values())
+        params = req.params.copy()
+        marker, limit, __ = common.get_pagination_params(params)
+        sort_keys, sort_dirs = common.get_sort_params(params,
+                                                      default_key='name',
+                                                      default_dir='asc')
+        filters = common.get_filters(params, VM_FILTERS)
+        if 'migrated' in filters:
+            try:
+                filters['migrated'] = strutils.bool_from_string(
+                    filters['migrated'], strict=True)
+            except ValueError:
+                msg = _("Invalid value '%s' for migrated filter"
+                        ) % filters['migrated']
+                raise webob.exc.HTTPBadRequest(explanation=msg)
+        svms = vms.get_all_vms(context, filters=filters, marker=marker,
+                               limit=limit, sort_keys=sort_keys,
+                               sort_dirs=sort_dirs)
         req.cache_resource(svms, name='vms')
         return self._view_builder.index(req, context, svms)
 
@@ -14,11 +14,16 @@
 #    under the License.
 
 
+from oslo_serialization import jsonutils
+
 from guts.api import common
+from guts.migration import progress
 
 
 class ViewBuilder(common.ViewBuilder):
 
+    _collection_name = 'migrations'
+
     def show(self, request, migration, brief=False):
         """Trim away extraneous migration attributes."""
         trimmed = dict(id=migration.get('id'),
@@ -27,10 +32,27 @@ class ViewBuilder(common.ViewBuilder):
                        status=migration.get('migration_status'),
                        event=migration.get('migration_event'),
                        description=migration.get('description'))
-        return trimmed if brief else dict(migration=trimmed)
+        if brief:
+            return trimmed
+        trimmed['conversion_profile'] = migration.get('conversion_profile')
+        trimmed['warm'] = bool(migration.get('warm'))
+        disk_details = migration.get('disk_details')
+        trimmed['disks'] = jsonutils.loads(disk_details or '{}')
+        trimmed['progress'] = progress.summarize(trimmed['disks'])
+        return dict(migration=trimmed)
 
     def index(self, request, migrations):
         """Index over trimmed migrations."""
         migration_list = [self.show(request, migration, True)
                           for migration in migrations]
-        return dict(migrations=migration_list)
+        return self._get_collection(request, migrations,
+                                    self._collection_name, migration_list)
+
+    def events(self, request, events, cursor):
+        """Events of a migration, with the cursor to wait for the next."""
+        event_list = [dict(cursor=event.get('cursor'),
+                           timestamp=event.get('timestamp'),
+                           status=event.get('migration_status'),
+                           event=event.get('migration_event'))
+                      for event in events]
+        return dict(events=event_list, cursor=cursor)
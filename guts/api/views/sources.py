@@ -20,6 +20,8 @@ from guts.migration import types
 
 class ViewBuilder(common.ViewBuilder):
 
+    _collection_name = 'sources'
+
     def show(self, request, context, source, brief=False):
         """Trim away extraneous source hypervisor attributes."""
         trimmed = dict(id=source.get('id'),
@@ -27,13 +29,29 @@ class ViewBuilder(common.ViewBuilder):
                        connection_params=source.get('connection_params'),
                        description=source.get('description'))
 
-        source_type = types.get_source_type(context, source.source_type_id)
+        source_type = self._get_source_type(request, context,
+                                            source.source_type_id)
         trimmed['source_type_name'] = source_type.get('name')
 
         return trimmed if brief else dict(source=trimmed)
 
+    def _get_source_type(self, request, context, source_type_id):
+        """Return a source type, from the request cache when it was loaded."""
+        source_type = request.cached_resource_by_id(source_type_id,
+                                                    name='types')
+        if source_type is None:
+            source_type = types.get_source_type(context, source_type_id)
+            request.cache_db_items('types', [source_type], 'id')
+        return source_type
+
     def index(self, request, context, sources):
         """Index over trimmed source hypervisors."""
+        type_ids = set(source.source_type_id for source in sources)
+        if type_ids:
+            request.cache_db_items(
+                'types', types.get_source_types_by_ids(context, type_ids),
+                'id')
         source_list = [self.show(request, context, source, True)
                        for source in sources]
-        return dict(sources=source_list)
+        return self._get_collection(request, sources, self._collection_name,
+                                    source_list)
@@ -20,6 +20,8 @@ from guts.migration import sources
 
 class ViewBuilder(common.ViewBuilder):
 
+    _collection_name = 'vms'
+
     def show(self, request, context, vm, brief=False):
         """Trim away extraneous source vm attributes."""
         trimmed = dict(id=vm.get('id'),
@@ -30,11 +32,25 @@ class ViewBuilder(common.ViewBuilder):
                        vcpus=vm.get('vcpus'),
                        virtual_disks=vm.get('virtual_disks'),
                        destination_vm_id=vm.get('dest_id'))
-        src = sources.get_source(context, vm.get('source_id'))
+        src = self._get_source(request, context, vm.get('source_id'))
         trimmed['hypervisor_name'] = src.get('name')
         return trimmed if brief else dict(vm=trimmed)
 
+    def _get_source(self, request, context, source_id):
+        """Return a source, from the request cache when it was loaded."""
+        src = request.cached_resource_by_id(source_id, name='sources')
+        if src is None:
+            src = sources.get_source(context, source_id)
+            request.cache_db_items('sources', [src], 'id')
+        return src
+
     def index(self, request, context, vms):
         """Index over trimmed source vms."""
+        source_ids = set(vm.get('source_id') for vm in vms)
+        if source_ids:
+            request.cache_db_items(
+                'sources', sources.get_sources_by_ids(context, source_ids),
+                'id')
         vm_list = [self.show(request, context, vm, True) for vm in vms]
-        return dict(vms=vm_list)
+        return self._get_collection(request, vms, self._collection_name,
+                                    vm_list)
@@ -92,3 +92,58 @@ class NovaAPI(object):
     def create_volumes(self, volumes, server):
         for volume in volumes:
             self._create_volume_and_attach(volume, server)
+
+    def _wait_for_volume(self, volume_id, status, timeout=180):
+        v = self._nc.volumes.find(id=volume_id)
+        while v.status != status:
+            if timeout < 0 or v.status == 'error':
+                raise Exception("Volume %s did not become %s." %
+                                (volume_id, status))
+            time.sleep(5)
+            v = self._nc.volumes.find(id=volume_id)
+            timeout -= 5
+
+    def create_volume(self, size, name):
+        """Create an empty volume of size bytes, returns its id."""
+        size_gb = int((size + units.Gi - 1) // units.Gi) or 1
+        vol = self._nc.volumes.create(size_gb, display_name=name)
+        self._wait_for_volume(vol.id, 'available')
+        return vol.id
+
+    def delete_volume(self, volume_id):
+        self._nc.volumes.delete(volume_id)
+
+    def attach_volume(self, server_id, volume_id):
+        """Attach a volume to a server, returns the reported device."""
+        attachment = self._nc.volumes.create_server_volume(server_id,
+                                                           volume_id)
+        self._wait_for_volume(volume_id, 'in-use')
+        return attachment.device
+
+    def detach_volume(self, server_id, volume_id):
+        self._nc.volumes.delete_server_volume(server_id, volume_id)
+        self._wait_for_volume(volume_id, 'available')
+
+    def create_from_volumes(self, ctxt, disks, vm_name, flavor):
+        """Boot a server from the volume of its root disk.
+
+        The volumes of the other disks are attached when it boots.
+        """
+        block_devices = []
+        for disk in disks:
+            boot_index = 0 if disk['index'] == '0' else -1
+            block_devices.append({'uuid': disk['volume_id'],
+                                  'source_type': 'volume',
+                                  'destination_type': 'volume',
+                                  'boot_index': boot_index,
+                                  'delete_on_termination': False})
+        if not any(bdm['boot_index'] == 0 for bdm in block_devices):
+            raise Exception("Root Volume Not Found.")
+        block_devices.sort(key=lambda bdm: bdm['boot_index'] != 0)
+
+        network = self._nc.networks.find(label="private")
+        server = self._nc.servers.create(name=vm_name, image=None,
+                                         flavor=flavor.id,
+                                         block_device_mapping_v2=block_devices,
+                                         nics=[{'net-id': network.id}])
+        return server.id
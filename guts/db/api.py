@@ -69,17 +69,31 @@ def purge_deleted_rows(context, age_in_days):
     return IMPL.purge_deleted_rows(context, age_in_days=age_in_days)
 
 
+def cache_invalidate(kind, id):
+    """Drop a source or source type from the cache of this process.
+
+    :param kind: 'source' or 'source_type'
+    """
+    return IMPL.cache_invalidate(kind, id)
+
+
+def cache_stats():
+    """Return the size and hit/miss counters of the caches by kind."""
+    return IMPL.cache_stats()
+
+
 # Source Types
 
-def source_type_get_all(context, inactive=False):
+def source_type_get_all(context, inactive=False, filters=None):
     """Get all source hypervisor types.
 
     :param context: context to query under
     :param inactive: Include inactive source types to the result set
+    :param filters: dict of column to value, or list of values, to match
 
-    :returns: list of source hypervisor types
+    :returns: dict of source hypervisor types with id as key
     """
-    return IMPL.source_type_get_all(context, inactive)
+    return IMPL.source_type_get_all(context, inactive, filters=filters)
 
 
 def source_type_get(context, id):
@@ -115,15 +129,23 @@ def source_type_delete(context, type_id):
 
 # Sources
 
-def source_get_all(context, inactive=False):
-    """Get all source hypervisors.
+def source_get_all(context, inactive=False, filters=None, marker=None,
+                   limit=None, sort_keys=None, sort_dirs=None):
+    """Get a page of source hypervisors.
 
     :param context: context to query under
     :param inactive: Include inactive sources to the result set
+    :param filters: dict of column name to value the rows must match
+    :param marker: id of the last item of the previous page
+    :param limit: maximum number of items to return
+    :param sort_keys: list of columns to sort on, name by default
+    :param sort_dirs: list of sort directions, 'asc' or 'desc'
 
     :returns: list of source hypervisors
     """
-    return IMPL.source_get_all(context, inactive)
+    return IMPL.source_get_all(context, inactive, filters=filters,
+                               marker=marker, limit=limit,
+                               sort_keys=sort_keys, sort_dirs=sort_dirs)
 
 
 def source_get(context, id):
@@ -153,21 +175,32 @@ def source_get_by_name(context, name):
 
 
 def source_delete(context, source_id):
-    """Deletes the given source."""
+    """Deletes the given source along with its VMs and their migrations.
+
+    :returns: number of deleted rows
+    """
     return IMPL.source_delete(context, source_id)
 
 
 # VMs
 
-def vm_get_all(context, inactive=False):
-    """Get all source vms.
+def vm_get_all(context, inactive=False, filters=None, marker=None,
+               limit=None, sort_keys=None, sort_dirs=None):
+    """Get a page of source vms.
 
     :param context: context to query under
     :param inactive: Include inactive sources to the result set
+    :param filters: dict of column name to value the rows must match
+    :param marker: id of the last item of the previous page
+    :param limit: maximum number of items to return
+    :param sort_keys: list of columns to sort on, name by default
+    :param sort_dirs: list of sort directions, 'asc' or 'desc'
 
     :returns: list of source vms
     """
-    return IMPL.vm_get_all(context, inactive)
+    return IMPL.vm_get_all(context, inactive, filters=filters, marker=marker,
+                           limit=limit, sort_keys=sort_keys,
+                           sort_dirs=sort_dirs)
 
 
 def vm_get(context, id):
@@ -186,16 +219,46 @@ def vm_create(context, vm):
     return IMPL.vm_create(context, vm)
 
 
+def vm_create_many(context, vms):
+    """Create VMs in bulk.
+
+    :returns: list of the ids of the created VMs
+    """
+    return IMPL.vm_create_many(context, vms)
+
+
+def vm_upsert_many(context, vms):
+    """Create or update VMs in bulk, matched on source and uuid_at_source.
+
+    :returns: dict with the number of created and updated VMs
+    """
+    return IMPL.vm_upsert_many(context, vms)
+
+
 def vm_delete(context, vm_id):
     """Deletes the given source vm."""
     return IMPL.vm_delete(context, vm_id)
 
 
 def delete_vms_by_source_id(context, source_id):
-    """Deletes all VMs list from the given source hypervisor."""
+    """Deletes all VMs of the given source hypervisor and their migrations.
+
+    :returns: number of deleted rows
+    """
     return IMPL.delete_vms_by_source_id(context, source_id)
 
 
+def vm_sync_by_source_id(context, source_id, vms):
+    """Make the VMs of a source match the given inventory.
+
+    VMs missing from the inventory are deleted along with their migrations.
+
+    :returns: dict with the number of created, updated and deleted VMs and
+              of deleted migrations
+    """
+    return IMPL.vm_sync_by_source_id(context, source_id, vms)
+
+
 def vm_update(context, vm_id, values):
     """Set the given properties on an vm and update it.
 
@@ -213,9 +276,15 @@ def vm_get_by_name(context, name):
 # Migrations
 
 
-def migration_get_all(context, inactive=False):
-    """Get all migrations."""
-    return IMPL.migration_get_all(context, inactive)
+def migration_get_all(context, inactive=False, filters=None, marker=None,
+                      limit=None, sort_keys=None, sort_dirs=None):
+    """Get a page of migrations.
+
+    Takes the same filtering and pagination arguments as vm_get_all.
+    """
+    return IMPL.migration_get_all(context, inactive, filters=filters,
+                                  marker=marker, limit=limit,
+                                  sort_keys=sort_keys, sort_dirs=sort_dirs)
 
 
 def migration_get(context, id):
@@ -246,6 +315,14 @@ def migration_update(context, migration_id, values):
     return IMPL.migration_update(context, migration_id, values)
 
 
+def migration_update_many(context, updates):
+    """Update many migrations in a single transaction.
+
+    :param updates: dict of migration id to the values to set on it
+    """
+    return IMPL.migration_update_many(context, updates)
+
+
 # Service
 
 def service_destroy(context, service_id):
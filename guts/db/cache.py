@@ -0,0 +1,102 @@
+# Copyright (c) 2015 Aptira Pty Ltd.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Keeps the source and source type caches of guts processes coherent.
+
+Every API worker and service caches the sources and source types it reads
+(see db_cache_ttl). The process changing one drops it from its own cache and
+casts the change on a fanout topic, which every other process listens to.
+"""
+
+from oslo_config import cfg
+from oslo_log import log as logging
+import oslo_messaging as messaging
+from oslo_service import loopingcall
+
+from guts import db
+from guts.i18n import _LI
+from guts.i18n import _LW
+from guts import rpc
+
+
+db_cache_opts = [
+    cfg.IntOpt('db_cache_ttl',
+               default=60,
+               help='Number of seconds a source or source type read from '
+                    'the database is cached for. 0 disables the cache.'),
+    cfg.IntOpt('db_cache_size',
+               default=1000,
+               help='Maximum number of sources and of source types kept in '
+                    'the cache.'),
+    cfg.IntOpt('db_cache_report_interval',
+               default=600,
+               min=0,
+               help='Interval in seconds between logging the size, hit and '
+                    'miss counters of the cache. 0 disables the reports.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(db_cache_opts)
+LOG = logging.getLogger(__name__)
+
+CACHE_TOPIC = 'guts-db-cache'
+
+
+class CacheEndpoint(object):
+    """Drops the objects changed by other processes from the local cache."""
+
+    target = messaging.Target(version='1.0')
+
+    def invalidate(self, ctxt, kind, id):
+        db.cache_invalidate(kind, id)
+
+
+def notify_invalidate(ctxt, kind, id):
+    """Tell every other process to drop an object from its cache."""
+    if not rpc.initialized():
+        return
+    target = messaging.Target(topic=CACHE_TOPIC, version='1.0', fanout=True)
+    try:
+        rpc.get_client(target).cast(ctxt, 'invalidate', kind=kind, id=id)
+    except Exception:
+        # Other processes still drop it once their cached copy expires.
+        LOG.warning(_LW('Failed to notify the cache invalidation of '
+                        '%(kind)s %(id)s.'), {'kind': kind, 'id': id},
+                    exc_info=True)
+
+
+def report_stats():
+    """Log the counters of the caches of this process."""
+    for kind, stats in sorted(db.cache_stats().items()):
+        LOG.info(_LI('DB cache of %(kind)s: %(size)d entries, %(hits)d '
+                     'hits, %(misses)d misses.'), dict(stats, kind=kind))
+
+
+def start_reporter():
+    """Start logging the cache counters periodically, returns the timer."""
+    if not (CONF.db_cache_ttl and CONF.db_cache_report_interval):
+        return None
+    timer = loopingcall.FixedIntervalLoopingCall(report_stats)
+    timer.start(interval=CONF.db_cache_report_interval,
+                initial_delay=CONF.db_cache_report_interval)
+    return timer
+
+
+def start_listener(host):
+    """Start listening for cache invalidations, returns the RPC server."""
+    target = messaging.Target(topic=CACHE_TOPIC, server=host)
+    server = rpc.get_server(target, [CacheEndpoint()])
+    server.start()
+    return server
@@ -27,16 +27,21 @@ from oslo_config import cfg
 from oslo_db import exception as db_exc
 from oslo_db import options
 from oslo_db.sqlalchemy import session as db_session
+from oslo_db.sqlalchemy import utils as sqlalchemyutils
 from oslo_log import log as logging
 from oslo_utils import timeutils
+import six
+from sqlalchemy import bindparam
 from sqlalchemy.orm import joinedload
 from sqlalchemy.sql.expression import literal_column
 
 
+from guts.db import cache as db_cache
 from guts.db.sqlalchemy import models
 from guts import exception
 from guts.i18n import _
 from guts.i18n import _LW
+from guts import utils
 
 
 CONF = cfg.CONF
@@ -46,6 +51,7 @@ options.set_defaults(CONF, connection='sqlite:///$state_path/guts.sqlite')
 
 _LOCK = threading.Lock()
 _FACADE = None
+_CACHES = {}
 
 
 def _create_facade_lazily():
@@ -202,6 +208,103 @@ def model_query(context, *args, **kwargs):
     return query
 
 
+def _get_cache(kind):
+    with _LOCK:
+        if kind not in _CACHES:
+            _CACHES[kind] = utils.LRUCache(CONF.db_cache_size,
+                                           CONF.db_cache_ttl)
+        return _CACHES[kind]
+
+
+def _cached_get(context, kind, id, load):
+    """Return the object of the given kind and id, loading it when needed.
+
+    Entries are keyed on the context's read_deleted too, as it changes which
+    rows the load sees.
+    """
+    if not CONF.db_cache_ttl:
+        return load()
+    return _get_cache(kind).get((id, context.read_deleted), load)
+
+
+def cache_invalidate(kind, id):
+    """Drop an object from the cache of this process."""
+    cache = _CACHES.get(kind)
+    if cache is not None:
+        for read_deleted in ('no', 'yes', 'only'):
+            cache.invalidate((id, read_deleted))
+
+
+def cache_stats():
+    """Return the size and hit/miss counters of each cache by kind."""
+    return dict((kind, cache.stats()) for kind, cache in _CACHES.items())
+
+
+def _invalidate(context, kind, id):
+    """Drop an object from the cache of every guts process."""
+    cache_invalidate(kind, id)
+    db_cache.notify_invalidate(context, kind, id)
+
+
+def _soft_delete(query):
+    """Soft delete every row matched by query with a single UPDATE.
+
+    :returns: number of rows soft deleted
+    """
+    return query.update({'deleted': True,
+                         'deleted_at': timeutils.utcnow(),
+                         'updated_at': literal_column('updated_at')},
+                        synchronize_session=False)
+
+
+def _paginate_query(context, query, model, filters=None, marker=None,
+                    limit=None, sort_keys=None, sort_dirs=None):
+    """Apply equality filters and keyset pagination to a query.
+
+    Rows are sorted on sort_keys (name by default) with id appended as the
+    tie breaker, so that the marker, the id of the last row of the previous
+    page, always resumes the listing at a unique position.
+
+    :raises InvalidInput: if a filter is not a column of model
+    :raises InvalidSortKey: if a sort key is not a column of model
+    :raises InvalidMarker: if marker does not match any row
+    """
+    columns = model.__table__.columns.keys()
+    for key, value in (filters or {}).items():
+        if key not in columns:
+            msg = _("Unsupported filter %s") % key
+            raise exception.InvalidInput(reason=msg)
+        if isinstance(value, (list, tuple, set, frozenset)):
+            query = query.filter(getattr(model, key).in_(value))
+        else:
+            query = query.filter(getattr(model, key) == value)
+
+    sort_keys = list(sort_keys or ['name'])
+    sort_dirs = list(sort_dirs or ['asc'] * len(sort_keys))
+    for key in sort_keys:
+        if key not in columns:
+            raise exception.InvalidSortKey(sort_key=key)
+    for sort_dir in sort_dirs:
+        if sort_dir not in ('asc', 'desc'):
+            msg = _("Unknown sort direction, must be 'asc' or 'desc'")
+            raise exception.InvalidInput(reason=msg)
+    if 'id' not in sort_keys:
+        sort_keys.append('id')
+        sort_dirs.append(sort_dirs[-1])
+
+    marker_row = None
+    if marker is not None:
+        marker_row = model_query(context, model, read_deleted='yes').\
+            filter_by(id=marker).\
+            first()
+        if not marker_row:
+            raise exception.InvalidMarker(marker=marker)
+
+    return sqlalchemyutils.paginate_query(query, model, limit, sort_keys,
+                                          marker=marker_row,
+                                          sort_dirs=sort_dirs)
+
+
 def _source_type_get_query(context, session=None, read_deleted=None,
                            expected_fields=None):
     expected_fields = expected_fields or []
@@ -217,12 +320,14 @@ def _source_type_get_query(context, session=None, read_deleted=None,
 
 
 @require_context
-def source_type_get_all(context, inactive=False):
-    """Returns a source hypervisor types with name as key."""
+def source_type_get_all(context, inactive=False, filters=None):
+    """Returns a source hypervisor types with id as key."""
     read_deleted = "yes" if inactive else "no"
     query = _source_type_get_query(context, read_deleted=read_deleted)
+    query = _paginate_query(context, query, models.SourceTypes,
+                            filters=filters)
 
-    rows = query.order_by("name").all()
+    rows = query.all()
 
     result = {}
     for row in rows:
@@ -247,7 +352,10 @@ def _source_type_get(context, id, session=None):
 @require_context
 def source_type_get(context, id, session=None):
     """Return a dict describing specific source type."""
-    return _source_type_get(context, id, session)
+    if session is not None:
+        return _source_type_get(context, id, session)
+    return _cached_get(context, 'source_type', id,
+                       lambda: _source_type_get(context, id))
 
 
 @require_context
@@ -313,9 +421,9 @@ def source_type_update(context, source_type_id, values):
 
         source_type_ref.update(values)
         source_type_ref.save(session=session)
-        source_type = source_type_get(context, source_type_id)
 
-        return source_type
+    _invalidate(context, 'source_type', source_type_id)
+    return source_type_get(context, source_type_id)
 
 
 @require_context
@@ -329,14 +437,13 @@ def source_type_get_by_name(context, name):
 def source_type_delete(context, type_id):
     session = get_session()
     with session.begin():
-        stype = source_type_get(context, type_id,
-                                session)
-        if not stype:
-            raise exception.SourceTypeNotFound(
-                type_id=type_id)
-        stype.update({'deleted': True,
-                      'deleted_at': timeutils.utcnow(),
-                      'updated_at': literal_column('updated_at')})
+        count = _soft_delete(
+            _source_type_get_query(context, session).filter_by(id=type_id))
+        if not count:
+            raise exception.SourceTypeNotFound(source_type_id=type_id)
+
+    _invalidate(context, 'source_type', type_id)
+    return count
 
 
 # Sources
@@ -356,18 +463,15 @@ def _source_get_query(context, session=None, read_deleted=None,
 
 
 @require_context
-def source_get_all(context, inactive=False):
-    """Returns a all source hypervisor with name as key."""
+def source_get_all(context, inactive=False, filters=None, marker=None,
+                   limit=None, sort_keys=None, sort_dirs=None):
+    """Returns a page of source hypervisors, sorted by name by default."""
     read_deleted = "yes" if inactive else "no"
     query = _source_get_query(context, read_deleted=read_deleted)
-
-    rows = query.order_by("name").all()
-
-    result = {}
-    for row in rows:
-        result[row['id']] = row
-
-    return result
+    query = _paginate_query(context, query, models.Sources, filters=filters,
+                            marker=marker, limit=limit, sort_keys=sort_keys,
+                            sort_dirs=sort_dirs)
+    return query.all()
 
 
 @require_context
@@ -386,7 +490,10 @@ def _source_get(context, id, session=None):
 @require_context
 def source_get(context, id, session=None):
     """Return a dict describing specific source."""
-    return _source_get(context, id, session)
+    if session is not None:
+        return _source_get(context, id, session)
+    return _cached_get(context, 'source', id,
+                       lambda: _source_get(context, id))
 
 
 @require_context
@@ -455,7 +562,9 @@ def source_update(context, source_id, values):
 
         source_ref.update(values)
         source_ref.save(session=session)
-        return source_ref
+
+    _invalidate(context, 'source', source_id)
+    return source_ref
 
 
 @require_context
@@ -467,16 +576,20 @@ def source_get_by_name(context, name):
 
 @require_admin_context
 def source_delete(context, source_id):
+    """Soft delete a source along with its VMs and their migrations.
+
+    :returns: number of soft deleted sources, VMs and migrations
+    """
     session = get_session()
     with session.begin():
-        source = source_get(context, source_id,
-                            session)
-        if not source:
-            raise exception.SourceNotFound(
-                source_id=source_id)
-        source.update({'deleted': True,
-                       'deleted_at': timeutils.utcnow(),
-                       'updated_at': literal_column('updated_at')})
+        count = _soft_delete(
+            _source_get_query(context, session).filter_by(id=source_id))
+        if not count:
+            raise exception.SourceNotFound(source_id=source_id)
+        count += _soft_delete_vms_by_source_id(context, source_id, session)
+
+    _invalidate(context, 'source', source_id)
+    return count
 
 
 # VMs
@@ -496,18 +609,15 @@ def _vm_get_query(context, session=None, read_deleted=None,
 
 
 @require_context
-def vm_get_all(context, inactive=False):
-    """Returns a dict describing all source vm with name as key."""
+def vm_get_all(context, inactive=False, filters=None, marker=None,
+               limit=None, sort_keys=None, sort_dirs=None):
+    """Returns a page of source VMs, sorted by name by default."""
     read_deleted = "yes" if inactive else "no"
     query = _vm_get_query(context, read_deleted=read_deleted)
-
-    rows = query.order_by("name").all()
-
-    result = {}
-    for row in rows:
-        result[row['id']] = row
-
-    return result
+    query = _paginate_query(context, query, models.VMs, filters=filters,
+                            marker=marker, limit=limit, sort_keys=sort_keys,
+                            sort_dirs=sort_dirs)
+    return query.all()
 
 
 @require_context
@@ -542,14 +652,6 @@ def _vm_get_by_name(context, name, session=None):
     return result
 
 
-@require_context
-def _vms_get_by_sorce_id(context, source_id, session=None):
-    result = model_query(context, models.VMs, session=session).\
-        filter_by(source_id=source_id)
-
-    return result
-
-
 @require_context
 def vm_get_by_name(context, name):
     """Return a dict describing specific source vm."""
@@ -579,27 +681,234 @@ def vm_create(context, values):
 def vm_delete(context, vm_id):
     session = get_session()
     with session.begin():
-        vm = vm_get(context, vm_id,
-                    session)
-        if not vm:
-            raise exception.VMNotFound(
-                vm_id=vm_id)
-        vm.update({'deleted': True,
-                   'deleted_at': timeutils.utcnow(),
-                   'updated_at': literal_column('updated_at')})
+        count = _soft_delete(
+            _vm_get_query(context, session).filter_by(id=vm_id))
+        if not count:
+            raise exception.VMNotFound(vm_id=vm_id)
+        return count
+
+
+def _soft_delete_vms_by_source_id(context, source_id, session):
+    vm_ids = model_query(context, models.VMs.id, session=session,
+                         read_deleted='no').\
+        filter_by(source_id=source_id).\
+        subquery()
+    count = _soft_delete(
+        _migration_get_query(context, session).
+        filter(models.Migrations.source_instance_id.in_(vm_ids)))
+    return count + _soft_delete(
+        _vm_get_query(context, session).filter_by(source_id=source_id))
 
 
 @require_admin_context
 def delete_vms_by_source_id(context, source_id):
+    """Soft delete the VMs of a source along with their migrations.
+
+    :returns: number of soft deleted VMs and migrations
+    """
     session = get_session()
     with session.begin():
-        vms = _vms_get_by_sorce_id(context, source_id,
-                                   session)
+        return _soft_delete_vms_by_source_id(context, source_id, session)
+
+
+# Inventory fields refreshed from the source hypervisor.
+_VM_SYNC_FIELDS = ('name', 'memory', 'vcpus', 'virtual_disks')
 
+# Keeps IN lists below the bound parameter limit of every backend.
+_IN_CHUNK_SIZE = 500
+
+# Rows sent per executemany call by the bulk helpers.
+_BULK_CHUNK_SIZE = 1000
+
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _bulk_execute(session, statement, rows):
+    """Run statement once per chunk of rows sharing the same keys.
+
+    executemany() compiles the statement from the keys of the first row, so
+    rows providing different columns are sent in separate batches.
+    """
+    groups = {}
+    for row in rows:
+        groups.setdefault(tuple(sorted(row)), []).append(row)
+    for group in groups.values():
+        for chunk in _chunks(group, _BULK_CHUNK_SIZE):
+            session.execute(statement, chunk)
+
+
+def _vm_insert_rows(session, vms):
+    """Insert vms with executemany INSERTs, returning the new VM ids."""
+    ids = [str(uuid.uuid4()) for _i in range(len(vms))]
+    rows = []
+    for vm, vm_id in zip(vms, ids):
+        row = dict(vm)
+        if not row.get('id'):
+            row['id'] = vm_id
+        rows.append(row)
+    _bulk_execute(session, models.VMs.__table__.insert(), rows)
+    return [row['id'] for row in rows]
+
+
+def _update_rows(session, model, updates):
+    """Update rows of model by id with executemany UPDATEs.
+
+    :param updates: list of (id, values) tuples
+    """
+    table = model.__table__
+    groups = {}
+    for row_id, values in updates:
+        groups.setdefault(tuple(sorted(values)), []).append((row_id, values))
+    for fields, group in groups.items():
+        # Bind names must not clash with the column names being set.
+        statement = table.update().\
+            where(table.c.id == bindparam('b_id')).\
+            values(**dict((field, bindparam('b_%s' % field))
+                          for field in fields))
+        rows = []
+        for row_id, values in group:
+            row = dict(('b_%s' % field, value)
+                       for field, value in values.items())
+            row['b_id'] = row_id
+            rows.append(row)
+        _bulk_execute(session, statement, rows)
+
+
+def _vm_sync_values(vm):
+    values = {}
+    for field in _VM_SYNC_FIELDS:
+        value = vm.get(field)
+        if value is not None and not isinstance(value, six.string_types):
+            value = six.text_type(value)
+        values[field] = value
+    return values
+
+
+@require_admin_context
+def vm_create_many(context, vms):
+    """Create VMs in bulk, in a single transaction.
+
+    :returns: list of the ids of the created VMs, in the order of vms
+    """
+    session = get_session()
+    with session.begin():
+        return _vm_insert_rows(session, vms)
+
+
+@require_admin_context
+def vm_upsert_many(context, vms):
+    """Create or update VMs in bulk, in a single transaction.
+
+    Each VM is matched on its source_id and uuid_at_source. Existing VMs
+    are updated in place with the given values, the others are created.
+
+    :returns: dict with the number of created and updated VMs
+    """
+    session = get_session()
+    with session.begin():
+        uuids_by_source = {}
+        for vm in vms:
+            uuids_by_source.setdefault(vm['source_id'], []).append(
+                vm['uuid_at_source'])
+
+        existing = {}
+        for source_id, uuids in uuids_by_source.items():
+            for chunk in _chunks(uuids, _IN_CHUNK_SIZE):
+                rows = model_query(context, models.VMs.id,
+                                   models.VMs.uuid_at_source,
+                                   session=session, read_deleted='no').\
+                    filter_by(source_id=source_id).\
+                    filter(models.VMs.uuid_at_source.in_(chunk)).\
+                    all()
+                for row in rows:
+                    existing.setdefault((source_id, row.uuid_at_source),
+                                        row.id)
+
+        created = []
+        updated = []
         for vm in vms:
-            vm.update({'deleted': True,
-                       'deleted_at': timeutils.utcnow(),
-                       'updated_at': literal_column('updated_at')})
+            vm_id = existing.get((vm['source_id'], vm['uuid_at_source']))
+            if vm_id is None:
+                created.append(vm)
+            else:
+                values = dict((field, value) for field, value in vm.items()
+                              if field not in ('id', 'source_id',
+                                               'uuid_at_source'))
+                updated.append((vm_id, values))
+
+        _vm_insert_rows(session, created)
+        _update_rows(session, models.VMs, updated)
+
+    return {'created': len(created), 'updated': len(updated)}
+
+
+@require_admin_context
+def vm_sync_by_source_id(context, source_id, vms):
+    """Make the VMs of a source match its current inventory.
+
+    VMs are matched on uuid_at_source. New VMs are inserted, VMs whose
+    inventory fields changed are updated in place, keeping their id and
+    migration state, and VMs no longer reported are soft deleted along
+    with their migrations. All changes are applied with bulk statements in
+    a single transaction.
+
+    :returns: dict with the number of created, updated and deleted VMs and
+              of deleted migrations
+    """
+    table = models.VMs.__table__
+    inventory = dict((vm['uuid_at_source'], vm) for vm in vms)
+    columns = [models.VMs.id, models.VMs.uuid_at_source]
+    columns.extend(getattr(models.VMs, field) for field in _VM_SYNC_FIELDS)
+
+    session = get_session()
+    with session.begin():
+        rows = model_query(context, *columns, session=session,
+                           read_deleted='no').\
+            filter_by(source_id=source_id).\
+            all()
+
+        current = {}
+        deleted_ids = []
+        for row in rows:
+            if (row.uuid_at_source in inventory and
+                    row.uuid_at_source not in current):
+                current[row.uuid_at_source] = row
+            else:
+                deleted_ids.append(row.id)
+
+        created = []
+        updated = []
+        for uuid_at_source, vm in inventory.items():
+            values = _vm_sync_values(vm)
+            row = current.get(uuid_at_source)
+            if row is None:
+                values.update(uuid_at_source=uuid_at_source,
+                              source_id=source_id)
+                created.append(values)
+            elif any(getattr(row, field) != values[field]
+                     for field in _VM_SYNC_FIELDS):
+                updated.append((row.id, values))
+
+        _vm_insert_rows(session, created)
+        _update_rows(session, models.VMs, updated)
+        deleted_migrations = 0
+        for chunk in _chunks(deleted_ids, _IN_CHUNK_SIZE):
+            deleted_migrations += _soft_delete(
+                _migration_get_query(context, session).
+                filter(models.Migrations.source_instance_id.in_(chunk)))
+            session.execute(table.update().
+                            where(table.c.id.in_(chunk)).
+                            values(deleted=True,
+                                   deleted_at=timeutils.utcnow(),
+                                   updated_at=table.c.updated_at))
+
+    return {'created': len(created),
+            'updated': len(updated),
+            'deleted': len(deleted_ids),
+            'deleted_migrations': deleted_migrations}
 
 
 @require_admin_context
@@ -628,17 +937,15 @@ def _migration_get_query(context, session=None, read_deleted=None,
 
 
 @require_context
-def migration_get_all(context, inactive=False):
+def migration_get_all(context, inactive=False, filters=None, marker=None,
+                      limit=None, sort_keys=None, sort_dirs=None):
+    """Returns a page of migrations, sorted by name by default."""
     read_deleted = "yes" if inactive else "no"
     query = _migration_get_query(context, read_deleted=read_deleted)
-
-    rows = query.order_by("name").all()
-
-    result = {}
-    for row in rows:
-        result[row['id']] = row
-
-    return result
+    query = _paginate_query(context, query, models.Migrations,
+                            filters=filters, marker=marker, limit=limit,
+                            sort_keys=sort_keys, sort_dirs=sort_dirs)
+    return query.all()
 
 
 @require_context
@@ -679,14 +986,11 @@ def migration_get_by_name(context, name):
 def migration_delete(context, migration_id):
     session = get_session()
     with session.begin():
-        migration = migration_get(context, migration_id,
-                                  session)
-        if not migration:
-            raise exception.MigrationNotFound(
-                migration_id=migration_id)
-        migration.update({'deleted': True,
-                          'deleted_at': timeutils.utcnow(),
-                          'updated_at': literal_column('updated_at')})
+        count = _soft_delete(
+            _migration_get_query(context, session).filter_by(id=migration_id))
+        if not count:
+            raise exception.MigrationNotFound(migration_id=migration_id)
+        return count
 
 
 @require_admin_context
@@ -724,6 +1028,17 @@ def migration_update(context, migration_id, values):
         return migration_ref
 
 
+@require_admin_context
+def migration_update_many(context, updates):
+    """Update many migrations in a single transaction.
+
+    :param updates: dict of migration id to the values to set on it
+    """
+    session = get_session()
+    with session.begin():
+        _update_rows(session, models.Migrations, list(updates.items()))
+
+
 # Service
 
 @require_admin_context
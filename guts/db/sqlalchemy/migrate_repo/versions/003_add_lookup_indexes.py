@@ -0,0 +1,70 @@
+# Copyright (c) 2015 Aptira Pty Ltd.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from sqlalchemy import false, Index, MetaData, Table
+
+
+# (table, index name, columns) matching the model_query lookups, which all
+# filter on deleted as well.
+INDEXES = [
+    ('source_types', 'source_types_name_idx', ['name']),
+    ('sources', 'sources_name_idx', ['name']),
+    ('sources', 'sources_source_type_id_idx', ['source_type_id']),
+    ('source_instances', 'source_instances_source_id_idx',
+     ['source_id', 'uuid_at_source']),
+    ('source_instances', 'source_instances_name_idx', ['name']),
+    ('migrations', 'migrations_source_instance_id_idx',
+     ['source_instance_id']),
+    ('migrations', 'migrations_name_idx', ['name']),
+    ('services', 'services_host_topic_idx', ['host', 'topic']),
+    ('services', 'services_host_binary_idx', ['host', 'binary']),
+]
+
+
+def _get_indexes(meta, migrate_engine):
+    tables = {}
+    indexes = []
+    for table_name, index_name, columns in INDEXES:
+        if table_name not in tables:
+            tables[table_name] = Table(table_name, meta, autoload=True)
+        table = tables[table_name]
+        columns = [table.c[column] for column in columns]
+        if migrate_engine.name == 'postgresql':
+            # Only live rows are ever looked up by these columns.
+            index = Index(index_name, *columns,
+                          postgresql_where=table.c.deleted == false())
+        else:
+            # SQLite can not match a partial index against the bound
+            # deleted parameter of our queries, MySQL has no partial
+            # indexes. Index deleted as the last column instead.
+            index = Index(index_name, *(columns + [table.c.deleted]))
+        indexes.append(index)
+    return indexes
+
+
+def upgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    for index in _get_indexes(meta, migrate_engine):
+        index.create(migrate_engine)
+
+
+def downgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    for index in _get_indexes(meta, migrate_engine):
+        index.drop(migrate_engine)
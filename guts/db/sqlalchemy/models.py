@@ -20,7 +20,7 @@ SQLAlchemy models for guts data.
 from oslo_config import cfg
 from oslo_db.sqlalchemy import models
 from oslo_utils import timeutils
-from sqlalchemy import Column, Integer, String, VARCHAR
+from sqlalchemy import Column, Integer, String, Text, VARCHAR
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy import ForeignKey, DateTime, Boolean
 
@@ -90,6 +90,10 @@ class Migrations(BASE, GutsBase):
     description = Column(String(255))
     migration_status = Column(String(255))
     migration_event = Column(String(255))
+    disk_details = Column(Text)
+    conversion_profile = Column(String(255))
+    warm = Column(Boolean, default=False)
+    host = Column(String(255))
     source_instance_id = Column(String(36),
                                 ForeignKey('source_instances.id'),
                                 nullable=False)
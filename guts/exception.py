@@ -244,6 +244,14 @@ class InvalidInput(Invalid):
     message = _("Invalid input received: %(reason)s")
 
 
+class InvalidSortKey(Invalid):
+    message = _("Sort key %(sort_key)s is not supported.")
+
+
+class InvalidMarker(Invalid):
+    message = _("Marker %(marker)s could not be found.")
+
+
 class InvalidSource(Invalid):
     message = _("Invalid source: %(reason)s.")
 
@@ -310,6 +318,11 @@ class ObjectActionError(GutsException):
     msg_fmt = _('Object action %(action)s failed because: %(reason)s')
 
 
+class InsufficientWorkspace(GutsException):
+    message = _("Not enough space to stage %(size)d bytes in the conversion "
+                "directories.")
+
+
 class InstanceNotReadyForMigration(GutsException):
     message = _("Failed to create migration %(name)s. %(reason)s")
     safe = True
@@ -322,3 +335,8 @@ class MigrationValidationFailed(Invalid):
 class InvalidPowerState(MigrationValidationFailed):
     message = _("Instance: %(instance_id)s cannot be migrated in its current "
                 "power state. Please shutdown virtual instance and retry.")
+
+
+class WarmMigrationNotSupported(MigrationValidationFailed):
+    message = _("Instance: %(instance_id)s cannot be migrated while "
+                "running, its source does not track changed blocks.")
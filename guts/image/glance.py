@@ -15,10 +15,45 @@
 
 
 from glanceclient import Client
+from glanceclient import exc as glance_exc
 
 from oslo_config import cfg
+import six
+
+glance_opts = [
+    cfg.IntOpt('glance_upload_chunk_size',
+               default=1024 * 1024,
+               min=4096,
+               help='Size in bytes of the chunks image data is read in '
+                    'when it is sent to glance by iterating over it.'),
+]
 
 CONF = cfg.CONF
+CONF.register_opts(glance_opts)
+
+
+class _ProgressFile(object):
+    """File-like object reporting the size of the image data read from it.
+
+    glanceclient sends image data by read()ing it and sizes it with seek()
+    and tell(), which are passed through to the wrapped file.
+    """
+
+    def __init__(self, data, progress_callback=None):
+        self._data = data
+        self._progress_callback = progress_callback
+
+    def __getattr__(self, name):
+        return getattr(self._data, name)
+
+    def read(self, size=-1):
+        chunk = self._data.read(size)
+        if chunk and self._progress_callback:
+            self._progress_callback(len(chunk))
+        return chunk
+
+    def __iter__(self):
+        return iter(lambda: self.read(CONF.glance_upload_chunk_size), b'')
 
 
 class GlanceAPI(object):
@@ -28,11 +63,26 @@ class GlanceAPI(object):
         self.glance_client = Client(version, endpoint=endpoint,
                                     token=context.auth_token)
 
-    def create(self, image_info, image_path):
-        """Creates a new image record."""
+    def create(self, image_info, data, progress_callback=None):
+        """Creates a new image record and uploads its data.
+
+        :param image_info: image properties.
+        :param data: path of the image file or a file-like object.
+        :param progress_callback: called with the size of every chunk read
+                                  to be sent.
+        """
+        if isinstance(data, six.string_types):
+            with open(data, 'rb') as image_file:
+                return self.create(image_info, image_file, progress_callback)
+
+        img = self.glance_client.images.create(**image_info)
+        img.update(data=_ProgressFile(data, progress_callback))
+        return img
+
+    def is_active(self, image_id):
+        """Whether the image exists and its data can be used."""
         try:
-            img = self.glance_client.images.create(**image_info)
-            img.update(data=open(image_path, 'rb'))
-            return img
-        except Exception:
-            raise
+            image = self.glance_client.images.get(image_id)
+        except glance_exc.HTTPNotFound:
+            return False
+        return image.status == 'active'
@@ -0,0 +1,154 @@
+# Copyright (c) 2015 Aptira Pty Ltd.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Named qemu-img conversion profiles.
+
+Each profile listed in enabled_conversion_profiles is configured in a
+guts.conf section of its own, for example:
+
+    [DEFAULT]
+    enabled_conversion_profiles = nvme,shared,wan
+    default_conversion_profile = nvme
+
+    [nvme]
+    coroutines = 16
+    out_of_order_writes = True
+    cache_mode = none
+    source_cache_mode = none
+
+    [shared]
+    coroutines = 2
+    cache_mode = none
+
+    [wan]
+    compress = True
+"""
+
+from oslo_config import cfg
+
+from guts import exception
+from guts.i18n import _
+
+
+conversion_opts = [
+    cfg.ListOpt('enabled_conversion_profiles',
+                default=[],
+                help='Names of the qemu-img conversion profiles migrations '
+                     'can select. Each one is configured in the section of '
+                     'the same name.'),
+    cfg.StrOpt('default_conversion_profile',
+               help='Conversion profile of the migrations not selecting '
+                    'one. Plain qemu-img defaults are used when unset.'),
+]
+
+CACHE_MODES = ['none', 'writeback', 'writethrough', 'directsync', 'unsafe']
+
+profile_opts = [
+    cfg.IntOpt('coroutines',
+               min=1,
+               max=16,
+               help='Number of parallel coroutines of the conversion '
+                    '(qemu-img -m).'),
+    cfg.BoolOpt('out_of_order_writes',
+                default=False,
+                help='Allow out of order writes to the destination '
+                     '(qemu-img -W).'),
+    cfg.StrOpt('cache_mode',
+               choices=CACHE_MODES,
+               help='Cache mode of the destination (qemu-img -t).'),
+    cfg.StrOpt('source_cache_mode',
+               choices=CACHE_MODES,
+               help='Cache mode of the source (qemu-img -T).'),
+    cfg.StrOpt('sparse_size',
+               help='Minimum run of zero bytes, e.g. 4k, skipped as a hole '
+                    'in the destination (qemu-img -S). 0 disables sparse '
+                    'detection.'),
+    cfg.BoolOpt('compress',
+                default=False,
+                help='Compress the destination image (qemu-img -c).'),
+    cfg.StrOpt('preallocation',
+               choices=['off', 'metadata', 'falloc', 'full'],
+               help='Preallocation mode of the destination image.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(conversion_opts)
+
+
+class ConversionProfile(object):
+    """qemu-img convert options of a named profile."""
+
+    def __init__(self, name, conf=None):
+        self.name = name
+        self.conf = conf
+
+    def convert_args(self):
+        """Return the qemu-img convert arguments of this profile."""
+        conf = self.conf
+        if conf is None:
+            return ()
+        args = []
+        if conf.coroutines:
+            args += ['-m', str(conf.coroutines)]
+        if conf.out_of_order_writes:
+            args.append('-W')
+        if conf.cache_mode:
+            args += ['-t', conf.cache_mode]
+        if conf.source_cache_mode:
+            args += ['-T', conf.source_cache_mode]
+        if conf.sparse_size:
+            args += ['-S', conf.sparse_size]
+        if conf.compress:
+            args.append('-c')
+        if conf.preallocation:
+            args += ['-o', 'preallocation=%s' % conf.preallocation]
+        return tuple(args)
+
+
+def get_profile(name=None, out_format=None):
+    """Return the named conversion profile, or the default one.
+
+    :param out_format: format of the destination the profile converts to,
+                       checked against the profile when given.
+    :raises InvalidInput: if the profile is not enabled, misconfigured or
+                          can not convert to out_format
+    """
+    name = name or CONF.default_conversion_profile
+    if not name:
+        return ConversionProfile(None)
+    if name not in CONF.enabled_conversion_profiles:
+        msg = _("Conversion profile %s is not enabled") % name
+        raise exception.InvalidInput(reason=msg)
+
+    CONF.register_opts(profile_opts, group=name)
+    conf = CONF[name]
+    if conf.compress and conf.preallocation not in (None, 'off'):
+        msg = _("Conversion profile %s cannot both compress and "
+                "preallocate") % name
+        raise exception.InvalidInput(reason=msg)
+    if out_format is not None and out_format != 'qcow2':
+        # Only qcow2 supports compression. The raw targets convert into
+        # existing destinations, which qemu-img -n can not preallocate.
+        params = {'name': name, 'format': out_format}
+        if conf.compress:
+            msg = _("Conversion profile %(name)s compresses, which "
+                    "%(format)s destinations do not support") % params
+            raise exception.InvalidInput(reason=msg)
+        if out_format == 'raw' and conf.preallocation not in (None, 'off'):
+            msg = _("Conversion profile %(name)s preallocates, which "
+                    "%(format)s destinations do not support") % params
+            raise exception.InvalidInput(reason=msg)
+    return ConversionProfile(name, conf)
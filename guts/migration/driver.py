@@ -14,7 +14,40 @@
 #    under the License.
 
 
+import os
+
 from guts.i18n import _
+from guts import utils
+
+
+def write_disk_areas(dest_path, size, areas, read_area, progress=None):
+    """Write areas of a disk into its staged raw image.
+
+    areas are (start, length) byte ranges of the disk and read_area(start,
+    length) yields their data. The image is created, sparse, if it does not
+    exist yet and always holds size bytes. progress, when given, is called
+    with the bytes written so far and the total of the areas. Returns the
+    number of bytes written.
+    """
+    total = sum(length for __, length in areas)
+    done = 0
+    exists = os.path.exists(dest_path)
+    with open(dest_path, 'r+b' if exists else 'wb') as f:
+        f.truncate(size)
+        # Zeros need not be written over the holes of a new image.
+        write = f.write if exists else utils.SparseFileWriter(f).write
+        if progress:
+            progress(done, total)
+        for start, length in areas:
+            f.seek(start)
+            for chunk in read_area(start, length):
+                write(chunk)
+                done += len(chunk)
+                if progress:
+                    progress(done, total)
+        f.flush()
+        os.fsync(f.fileno())
+    return done
 
 
 class MigrationDriver(object):
@@ -32,6 +65,18 @@ class MigrationDriver(object):
                 "implemented by the driver.")
         raise NotImplementedError(msg)
 
+    def is_connected(self):
+        """Check whether the session with the source is still usable.
+
+        Pooled drivers failing this check are disconnected and initialized
+        again. Drivers without a session to check always pass.
+        """
+        return True
+
+    def disconnect(self):
+        """Close the session with the source, if the driver keeps one."""
+        pass
+
     def get_vms_list(self):
         """Get all VMs stub.
 
@@ -41,11 +86,76 @@ class MigrationDriver(object):
                 "implemented by the driver.")
         raise NotImplementedError(msg)
 
-    def download_vm_disks(self, context, vm_uuid, base_path):
+    def get_vm_disk_capacities(self, context, vm_uuid):
+        """Return the capacity in bytes of each disk of the VM.
+
+        Drivers not reporting them return None, the capacities listed in
+        the inventory of the source are used instead.
+        """
+        return None
+
+    def download_vm_disks(self, context, vm_uuid, base_path,
+                          disk_fetched=None, disk_progress=None):
         """Download VM disks stub.
 
+        Drivers call disk_fetched(disk), when given, as soon as each disk is
+        fully written under base_path, so later stages can start on it while
+        the remaining disks are still downloading. They call
+        disk_progress(disk, done, total), when given, with the bytes of the
+        disk written so far and its size, or None if unknown. Drivers able
+        to set a 'checksum' of the content on each fetched disk let
+        identical disks be converted and uploaded only once.
+
         This is for drivers that don't implement download_vm_disks().
         """
         msg = _("Method to download VM disks from source hypervisor to "
                 "base_path is not implemented by the driver.")
         raise NotImplementedError(msg)
+
+    def stream_vm_disks(self, context, vm_uuid, base_path, convert_disk):
+        """Stream VM disks stub.
+
+        Drivers implementing this set a qemu-img readable 'source' on each
+        disk and call convert_disk(disk) while the source stays readable, so
+        the disk never has to be staged under base_path. Disks that can't
+        be read in place are downloaded to their 'path' and passed to
+        convert_disk(disk) without a 'source'.
+        """
+        msg = _("Method to stream VM disks from source hypervisor into "
+                "the converter is not implemented by the driver.")
+        raise NotImplementedError(msg)
+
+    def enable_change_tracking(self, context, vm_uuid):
+        """Enable tracking of the blocks the running VM changes.
+
+        Called before the first copy_vm_disks() of a warm migration.
+
+        This is for drivers that don't support warm migrations.
+        """
+        msg = _("Warm migration is not supported by the driver.")
+        raise NotImplementedError(msg)
+
+    def copy_vm_disks(self, context, vm_uuid, base_path, disks=None,
+                      disk_progress=None):
+        """Copy a consistent point in time of the VM disks to base_path.
+
+        The VM may be running. Without disks, every disk is copied in full
+        to a raw image under base_path. Otherwise disks are the ones
+        returned by the previous copy, and only the blocks changed since
+        then are written into their images. Returns the disks, each with
+        the 'copied_bytes' of this copy, for the next copy.
+        disk_progress(disk, done, total), when given, is called with the
+        bytes of the disk copied so far and the total to copy.
+
+        This is for drivers that don't support warm migrations.
+        """
+        msg = _("Warm migration is not supported by the driver.")
+        raise NotImplementedError(msg)
+
+    def power_off_vm(self, context, vm_uuid):
+        """Power off the VM, once it is close enough to its copy.
+
+        This is for drivers that don't support warm migrations.
+        """
+        msg = _("Warm migration is not supported by the driver.")
+        raise NotImplementedError(msg)
@@ -0,0 +1,120 @@
+# Copyright (c) 2015 Aptira Pty Ltd.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Per process pool of connected migration drivers.
+"""
+
+import contextlib
+import threading
+import time
+
+from oslo_log import log as logging
+
+from guts.i18n import _LW
+
+
+LOG = logging.getLogger(__name__)
+
+
+class _PoolEntry(object):
+    def __init__(self, driver):
+        self.driver = driver
+        self.users = 0
+        self.last_used = time.time()
+
+
+class DriverPool(object):
+    """Shares connected migration drivers between operations on a source.
+
+    Drivers are keyed by the caller, typically by source id and connection
+    parameters, so changing the connection parameters of a source opens a
+    new connection. A pooled driver unused for idle_ttl seconds is
+    disconnected, and one unused for check_interval seconds is health
+    checked before being handed out again.
+    """
+
+    def __init__(self, idle_ttl, check_interval):
+        self.idle_ttl = idle_ttl
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._entries = {}
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _disconnect(self, key, entry):
+        try:
+            entry.driver.disconnect()
+        except Exception:
+            LOG.warning(_LW("Failed to disconnect a pooled migration "
+                            "driver."))
+
+    def _acquire(self, key, create_driver):
+        with self._key_lock(key):
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    entry.users += 1
+            if (entry is not None and entry.users == 1 and
+                    time.time() - entry.last_used >= self.check_interval and
+                    not entry.driver.is_connected()):
+                # Session expired on the source, log in again.
+                with self._lock:
+                    del self._entries[key]
+                self._disconnect(key, entry)
+                entry = None
+            if entry is None:
+                entry = _PoolEntry(create_driver())
+                entry.users = 1
+                with self._lock:
+                    self._entries[key] = entry
+            return entry
+
+    def _release(self, entry):
+        with self._lock:
+            entry.users -= 1
+            entry.last_used = time.time()
+
+    @contextlib.contextmanager
+    def driver(self, key, create_driver):
+        """Yield the pooled driver for key, creating it if needed."""
+        entry = self._acquire(key, create_driver)
+        try:
+            yield entry.driver
+        finally:
+            self._release(entry)
+
+    def evict_idle(self):
+        """Disconnect drivers that have not been used for idle_ttl."""
+        now = time.time()
+        with self._lock:
+            idle = [(key, entry) for key, entry in self._entries.items()
+                    if not entry.users and
+                    now - entry.last_used >= self.idle_ttl]
+            for key, entry in idle:
+                del self._entries[key]
+        for key, entry in idle:
+            self._disconnect(key, entry)
+
+    def clear(self):
+        """Disconnect every pooled driver."""
+        with self._lock:
+            entries = list(self._entries.items())
+            self._entries.clear()
+        for key, entry in entries:
+            self._disconnect(key, entry)
@@ -0,0 +1,282 @@
+# Copyright (c) 2015 Aptira Pty Ltd.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Fake vSphere driver.
+
+Stands in for a vSphere source without one, serving VMs whose disks are
+held in memory. Guest writes to the disks of a running VM are simulated
+with FakeVM.write(), and are tracked per block the way changed block
+tracking does, so warm migrations can be run offline:
+
+    host = fake.get_fake_host('fake-vsphere')
+    vm = host.add_vm('vm-1', [64 * units.Mi])
+    vm.write(0, 4096, b'data')
+
+A source of this driver connects to the fake host named by its 'host'
+connection parameter.
+"""
+
+import functools
+import hashlib
+import os
+import threading
+
+from guts import exception
+from guts.migration import driver
+from guts import utils
+
+
+BLOCK_SIZE = 64 * 1024
+CHUNK_SIZE = 512 * 1024
+
+CONNECTION_PARAMS = {"host":
+                     {'message': 'Name of the fake host'}}
+
+_HOSTS_LOCK = threading.Lock()
+_HOSTS = {}
+
+
+class FakeSnapshot(object):
+    """Frozen copy of the disks of a FakeVM."""
+
+    def __init__(self, disks, change_id):
+        self.disks = [bytes(disk) for disk in disks]
+        self.change_id = change_id
+
+    def read(self, disk_index, start, length):
+        data = self.disks[disk_index]
+        for offset in range(start, start + length, CHUNK_SIZE):
+            yield data[offset:min(offset + CHUNK_SIZE, start + length)]
+
+
+class FakeVM(object):
+    """VM with in memory disks, tracking the blocks changed by writes."""
+
+    def __init__(self, uuid, name, disk_sizes, memory=1024, vcpus=1,
+                 powered_on=True, change_tracking_supported=True):
+        self.uuid = uuid
+        self.name = name
+        self.memory = memory
+        self.vcpus = vcpus
+        self.powered_on = powered_on
+        self.change_tracking_supported = change_tracking_supported
+        self.change_tracking = False
+        self.disks = [bytearray(size) for size in disk_sizes]
+        self.snapshots = []
+        self._lock = threading.Lock()
+        # Per disk, the generation of the last write to each block.
+        self._block_generations = [{} for __ in disk_sizes]
+        self._generation = 0
+
+    def write(self, disk_index, offset, data):
+        """Write data to a disk, as the guest would."""
+        with self._lock:
+            disk = self.disks[disk_index]
+            if offset + len(data) > len(disk):
+                raise IOError("Write beyond the end of disk %d" % disk_index)
+            disk[offset:offset + len(data)] = data
+            if self.change_tracking:
+                self._generation += 1
+                blocks = self._block_generations[disk_index]
+                first = offset // BLOCK_SIZE
+                last = (offset + max(len(data), 1) - 1) // BLOCK_SIZE
+                for block in range(first, last + 1):
+                    blocks[block] = self._generation
+
+    def create_snapshot(self):
+        with self._lock:
+            snapshot = FakeSnapshot(self.disks, str(self._generation))
+            self.snapshots.append(snapshot)
+            return snapshot
+
+    def remove_snapshot(self, snapshot):
+        with self._lock:
+            self.snapshots.remove(snapshot)
+
+    def _allocated_blocks(self, snapshot, disk_index):
+        data = snapshot.disks[disk_index]
+        return [offset // BLOCK_SIZE
+                for offset in range(0, len(data), BLOCK_SIZE)
+                if data[offset:offset + BLOCK_SIZE].strip(b'\0')]
+
+    def query_changed_areas(self, snapshot, disk_index, change_id):
+        """Return the (start, length) areas of a disk changed since a change.
+
+        For change_id '*', returns the areas of the disk holding data.
+        """
+        if not self.change_tracking:
+            raise exception.WarmMigrationNotSupported(instance_id=self.uuid)
+        if change_id == '*':
+            blocks = self._allocated_blocks(snapshot, disk_index)
+        else:
+            since = int(change_id)
+            until = int(snapshot.change_id)
+            with self._lock:
+                blocks = sorted(
+                    block for block, generation
+                    in self._block_generations[disk_index].items()
+                    if since < generation <= until)
+
+        size = len(snapshot.disks[disk_index])
+        areas = []
+        for block in blocks:
+            start = block * BLOCK_SIZE
+            length = min(BLOCK_SIZE, size - start)
+            if areas and areas[-1][0] + areas[-1][1] == start:
+                areas[-1] = (areas[-1][0], areas[-1][1] + length)
+            else:
+                areas.append((start, length))
+        return areas
+
+
+class FakeHost(object):
+    """Fake vSphere host, holding FakeVMs by uuid."""
+
+    def __init__(self):
+        self.vms = {}
+
+    def add_vm(self, uuid, disk_sizes, **kwargs):
+        kwargs.setdefault('name', uuid)
+        vm = self.vms[uuid] = FakeVM(uuid, disk_sizes=disk_sizes, **kwargs)
+        return vm
+
+
+def get_fake_host(name):
+    """Return the fake host of name, created on first use."""
+    with _HOSTS_LOCK:
+        if name not in _HOSTS:
+            _HOSTS[name] = FakeHost()
+        return _HOSTS[name]
+
+
+class FakeDriver(driver.MigrationDriver):
+    """Migration driver of fake vSphere hosts."""
+
+    def __init__(self, context):
+        super(FakeDriver, self).__init__()
+        self.context = context
+        self.host = None
+
+    def initialize(self, connection_dict):
+        self.host = get_fake_host(connection_dict['host'])
+
+    def _find_vm_by_uuid(self, vm_uuid):
+        vm = self.host.vms.get(vm_uuid)
+        if vm is None:
+            raise Exception("VM %s not found." % vm_uuid)
+        return vm
+
+    def get_vms_list(self):
+        vms_list = []
+        for vm in self.host.vms.values():
+            disks = ['Hard disk {} | {:.1f}GB | Thin: True | '
+                     '[fake] {}/disk-{}.vmdk'.format(
+                         index + 1, len(disk) / 1024.0 / 1024 / 1024,
+                         vm.name, index)
+                     for index, disk in enumerate(vm.disks)]
+            vms_list.append({'uuid_at_source': vm.uuid,
+                             'name': vm.name,
+                             'memory': vm.memory,
+                             'vcpus': vm.vcpus,
+                             'virtual_disks': '\n'.join(disks)})
+        return vms_list
+
+    def validate_for_migration(self, vm_uuid, warm=False):
+        vm = self._find_vm_by_uuid(vm_uuid)
+        if warm:
+            if not vm.change_tracking_supported:
+                return (False, exception.WarmMigrationNotSupported)
+            return (True, None)
+        if vm.powered_on:
+            return (False, exception.InvalidPowerState)
+        return (True, None)
+
+    def _new_disk(self, base_path, index):
+        target_id = 'disk-%d.raw' % index
+        return {'key': index,
+                'target_id': target_id,
+                'path': os.path.join(base_path, target_id),
+                'index': str(index),
+                'type': 'raw'}
+
+    def get_vm_disk_capacities(self, context, vm_uuid):
+        return [len(disk) for disk in self._find_vm_by_uuid(vm_uuid).disks]
+
+    def download_vm_disks(self, context, vm_uuid, base_path,
+                          disk_fetched=None, disk_progress=None):
+        vm = self._find_vm_by_uuid(vm_uuid)
+        disks = []
+        for index, data in enumerate(vm.disks):
+            disk = self._new_disk(base_path, index)
+            data = bytes(data)
+            with open(disk['path'], 'wb') as f:
+                writer = utils.SparseFileWriter(f)
+                for offset in range(0, len(data), CHUNK_SIZE):
+                    writer.write(data[offset:offset + CHUNK_SIZE])
+                    if disk_progress:
+                        disk_progress(disk, min(offset + CHUNK_SIZE,
+                                                len(data)), len(data))
+                writer.close()
+            disk['fetched_bytes'] = len(data)
+            disk['zero_bytes'] = writer.zero_bytes
+            disk['checksum'] = 'sha256:%s' % hashlib.sha256(data).hexdigest()
+            disks.append(disk)
+            if disk_fetched:
+                disk_fetched(disk)
+        return disks
+
+    def enable_change_tracking(self, context, vm_uuid):
+        vm = self._find_vm_by_uuid(vm_uuid)
+        if not vm.change_tracking_supported:
+            raise exception.WarmMigrationNotSupported(instance_id=vm_uuid)
+        vm.change_tracking = True
+
+    def copy_vm_disks(self, context, vm_uuid, base_path, disks=None,
+                      disk_progress=None):
+        vm = self._find_vm_by_uuid(vm_uuid)
+        previous = dict((disk['key'], disk) for disk in disks or [])
+        snapshot = vm.create_snapshot()
+        try:
+            copied = []
+            for index, data in enumerate(snapshot.disks):
+                disk = previous.get(index)
+                if disk is None:
+                    disk = self._new_disk(base_path, index)
+                    disk['change_id'] = '*'
+                areas = vm.query_changed_areas(snapshot, index,
+                                               disk['change_id'])
+                progress = None
+                if disk_progress:
+                    progress = functools.partial(disk_progress, disk)
+                disk['copied_bytes'] = driver.write_disk_areas(
+                    disk['path'], len(data), areas,
+                    functools.partial(snapshot.read, index), progress)
+                disk['change_id'] = snapshot.change_id
+                copied.append(disk)
+        finally:
+            vm.remove_snapshot(snapshot)
+        return copied
+
+    def power_off_vm(self, context, vm_uuid):
+        self._find_vm_by_uuid(vm_uuid).powered_on = False
+
+
+def get_migration_driver(context):
+    return FakeDriver(context)
+
+
+def get_connection_params_dict():
+    return CONNECTION_PARAMS
@@ -17,23 +17,94 @@
 VSphere based guts driver.
 """
 
-import atexit
+import functools
+import hashlib
+import json
 import os
+import posixpath
+import re
 import requests
+import threading
 import time
 
+import eventlet
+from eventlet import queue
+from oslo_config import cfg
+from oslo_log import log as logging
 from pyVim import connect
 from pyVmomi import vim
+from pyVmomi import vmodl
+from six.moves.urllib import parse as urlparse
 from threading import Thread
 
 
 from guts import exception
+from guts.i18n import _LW
 from guts.migration import driver
+from guts.migration import workspace
 from guts import utils
 
 
+vsphere_opts = [
+    cfg.IntOpt('vsphere_disk_exports_per_vm',
+               default=4,
+               min=1,
+               help='Maximum number of disks of a single VM exported '
+                    'concurrently from a vSphere source.'),
+    cfg.IntOpt('vsphere_disk_exports_per_host',
+               default=8,
+               min=1,
+               help='Maximum number of disks exported concurrently from a '
+                    'single vSphere host by this migration service.'),
+    cfg.IntOpt('vsphere_disk_download_retries',
+               default=5,
+               min=0,
+               help='Number of times an interrupted disk download is '
+                    'resumed from its last verified offset before the '
+                    'export fails.'),
+    cfg.IntOpt('vsphere_disk_download_retry_interval',
+               default=2,
+               min=1,
+               help='Initial interval in seconds between disk download '
+                    'retries, doubled on every consecutive failure.'),
+    cfg.IntOpt('vsphere_guest_shutdown_timeout',
+               default=300,
+               min=0,
+               help='Seconds to wait for the guest OS of a VM to shut down '
+                    'at the cutover of a warm migration before powering '
+                    'the VM off.'),
+    cfg.IntOpt('vsphere_inventory_page_size',
+               default=500,
+               min=1,
+               help='Maximum number of VMs returned by vSphere per page when '
+                    'listing the inventory of a source.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(vsphere_opts)
+
+LOG = logging.getLogger(__name__)
+
 CHUNK_SIZE = 512 * 1024
 
+# Persist download progress at most once per MANIFEST_INTERVAL bytes.
+MANIFEST_INTERVAL = 64 * 1024 * 1024
+MANIFEST_SUFFIX = workspace.MANIFEST_SUFFIX
+# Bytes before the resume offset fetched again and compared with the partial
+# disk, to check a resumed transfer continues the same disk.
+RESUME_OVERLAP = 1024 * 1024
+MAX_RETRY_INTERVAL = 60
+
+# Extent lines of a VMDK descriptor, e.g. 'RW 2097152 VMFS "disk-flat.vmdk"'.
+EXTENT_RE = re.compile(r'^\s*(RW|RDONLY|NOACCESS)\s+(\d+)\s+(\w+)\s+"([^"]+)"')
+# Extent types whose data is a plain file the datastore serves as is.
+FLAT_EXTENT_TYPES = ('VMFS', 'FLAT')
+# Datastores whose files are read over the datastore HTTP interface.
+WARM_DATASTORE_TYPES = ('VMFS', 'NFS', 'NFS41')
+
+_HOST_EXPORT_LOCK = threading.Lock()
+_HOST_EXPORT_SEMAPHORES = {}
+
 CONNECTION_PARAMS = {"host":
                      {'message': 'Host name/IP of VSphere server'},
                      "username":
@@ -47,15 +118,125 @@ CONNECTION_PARAMS = {"host":
                      }
 
 
-def get_obj(content, vimtype):
-    """Get VIMType Object.
+# VM properties read when listing the inventory of a source.
+VM_PROPERTIES = ['config.instanceUuid',
+                 'config.name',
+                 'config.hardware.memoryMB',
+                 'config.hardware.numCPU',
+                 'config.hardware.device']
 
-       Return an object by name, if name is None the
-       first found object is returned
+
+def retrieve_properties(content, vimtype, path_set, page_size):
+    """Retrieve properties of all objects of vimtype in bulk.
+
+    Only the properties in path_set are fetched, with one round trip per
+    page of page_size objects. Yields a dict of the properties of each
+    object.
+    """
+    collector = vmodl.query.PropertyCollector
+    view = content.viewManager.CreateContainerView(
+        content.rootFolder, [vimtype], True)
+    try:
+        traversal_spec = collector.TraversalSpec(name='traverseView',
+                                                 path='view', skip=False,
+                                                 type=vim.view.ContainerView)
+        obj_spec = collector.ObjectSpec(obj=view, skip=True,
+                                        selectSet=[traversal_spec])
+        prop_spec = collector.PropertySpec(type=vimtype, pathSet=path_set)
+        filter_spec = collector.FilterSpec(objectSet=[obj_spec],
+                                           propSet=[prop_spec])
+        options = collector.RetrieveOptions(maxObjects=page_size)
+
+        property_collector = content.propertyCollector
+        result = property_collector.RetrievePropertiesEx([filter_spec],
+                                                         options)
+        while result:
+            for obj in result.objects:
+                yield dict((prop.name, prop.val) for prop in obj.propSet)
+            if not result.token:
+                break
+            result = property_collector.ContinueRetrievePropertiesEx(
+                result.token)
+    finally:
+        view.Destroy()
+
+
+def _get_host_export_semaphore(host):
+    """Return the semaphore bounding concurrent disk exports from host."""
+    with _HOST_EXPORT_LOCK:
+        if host not in _HOST_EXPORT_SEMAPHORES:
+            _HOST_EXPORT_SEMAPHORES[host] = eventlet.semaphore.Semaphore(
+                CONF.vsphere_disk_exports_per_host)
+        return _HOST_EXPORT_SEMAPHORES[host]
+
+
+def _load_manifest(manifest_path, disk_path, source):
+    """Return the offset, zero byte count and size a download resumes from.
+
+    The partial disk is only trusted when the manifest was written for the
+    same source, the same disk of the same VM configuration.
     """
-    container = content.viewManager.CreateContainerView(
-        content.rootFolder, vimtype, True)
-    return container.view
+    if not (os.path.exists(manifest_path) and os.path.exists(disk_path)):
+        return 0, 0, None
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        ranges = manifest['ranges']
+        if manifest['source'] != source:
+            return 0, 0, None
+    except (IOError, ValueError, KeyError):
+        return 0, 0, None
+    # Downloads are sequential, so only a range starting at 0 is usable.
+    if not ranges or ranges[0][0] != 0:
+        return 0, 0, None
+    offset = min(ranges[0][1], os.path.getsize(disk_path))
+    return (offset, min(manifest.get('zero_bytes', 0), offset),
+            manifest.get('size'))
+
+
+class _DiskChecksum(object):
+    """SHA-256 of the leading bytes of a disk, fed as they are fetched."""
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self._digest = hashlib.sha256()
+        self.offset = 0
+
+    def update(self, data):
+        self._digest.update(data)
+        self.offset += len(data)
+
+    def catch_up(self, path, offset):
+        """Cover the bytes of path up to offset, fetched earlier.
+
+        Bytes hashed beyond offset by an interrupted transfer are dropped,
+        the disk is then hashed again from its start.
+        """
+        if offset < self.offset:
+            self._reset()
+        if offset == self.offset:
+            return
+        with open(path, 'rb') as f:
+            f.seek(self.offset)
+            while self.offset < offset:
+                data = f.read(min(CHUNK_SIZE, offset - self.offset))
+                if not data:
+                    raise IOError("%s is shorter than %d bytes" %
+                                  (path, offset))
+                self.update(data)
+
+    def hexdigest(self):
+        return 'sha256:%s' % self._digest.hexdigest()
+
+
+def _save_manifest(manifest_path, url, source, size, offset, zero_bytes):
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'url': url, 'source': source, 'size': size,
+                   'ranges': [[0, offset]], 'zero_bytes': zero_bytes}, f)
+    os.rename(tmp_path, manifest_path)
 
 
 class VSphereDriver(driver.MigrationDriver):
@@ -67,31 +248,52 @@ class VSphereDriver(driver.MigrationDriver):
 
     def initialize(self, connection_dict):
         try:
+            self.host = connection_dict['host']
+            self.port = int(connection_dict['port'])
             self.con = connect.SmartConnect(host=connection_dict['host'],
                                             user=connection_dict['user'],
                                             pwd=connection_dict['password'],
                                             port=int(connection_dict['port']))
-            atexit.register(connect.Disconnect, self.con)
             self.content = self.con.RetrieveContent()
+            self.http_session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_maxsize=CONF.vsphere_disk_exports_per_host)
+            self.http_session.mount('https://', adapter)
+            self.http_session.mount('http://', adapter)
         except Exception:
             raise
 
+    def is_connected(self):
+        try:
+            return self.content.sessionManager.currentSession is not None
+        except Exception:
+            return False
+
+    def disconnect(self):
+        self.http_session.close()
+        connect.Disconnect(self.con)
+
     def get_vms_list(self):
         """Get list of VMs available in source hypervisor."""
         if not self.con:
             self.initialize()
 
-        vms = get_obj(self.content, [vim.VirtualMachine])
+        vms = retrieve_properties(self.content, vim.VirtualMachine,
+                                  VM_PROPERTIES,
+                                  CONF.vsphere_inventory_page_size)
 
         vms_list = []
         for vm in vms:
+            if 'config.instanceUuid' not in vm:
+                # VM still being created, its config is not available yet.
+                continue
             vm_dict = {}
-            vm_dict["uuid_at_source"] = vm.config.instanceUuid
-            vm_dict["name"] = vm.config.name
-            vm_dict["memory"] = vm.config.hardware.memoryMB
-            vm_dict['vcpus'] = vm.config.hardware.numCPU
+            vm_dict["uuid_at_source"] = vm['config.instanceUuid']
+            vm_dict["name"] = vm['config.name']
+            vm_dict["memory"] = vm['config.hardware.memoryMB']
+            vm_dict['vcpus'] = vm['config.hardware.numCPU']
             vm_disks = []
-            for vm_hardware in vm.config.hardware.device:
+            for vm_hardware in vm.get('config.hardware.device', []):
                 if (vm_hardware.key >= 2000) and (vm_hardware.key < 3000):
                     vm_disks.append('{} | {:.1f}GB | Thin: {} | {}'.format(vm_hardware.deviceInfo.label,
                                                                  vm_hardware.capacityInKB/1024/1024,
@@ -111,16 +313,185 @@ class VSphereDriver(driver.MigrationDriver):
             raise Exception
         return vm
 
-    def _get_vm_disk(self, device_url, dest_disk_path):
+    def _resumes_disk(self, r, dest_disk_path, start, offset, size):
+        """Check the ranged response r continues the partial disk.
+
+        r starts at start, before offset. The bytes up to offset are read
+        from r and compared with dest_disk_path, and the disk size reported
+        by the source with size.
+        """
+        content_range = r.headers.get('content-range', '')
+        try:
+            total = int(content_range.rsplit('/', 1)[1])
+        except (IndexError, ValueError):
+            return False
+        if size is not None and total != size:
+            return False
+        with open(dest_disk_path, 'rb') as f:
+            f.seek(start)
+            local = f.read(offset - start)
+        remote = b''
+        while len(remote) < len(local):
+            data = r.raw.read(len(local) - len(remote))
+            if not data:
+                return False
+            remote += data
+        return remote == local
+
+    def _open_vm_disk(self, url, dest_disk_path, offset, size):
+        """GET the disk from offset, returns the response and its offset.
+
+        Resumed transfers restart from the beginning of the disk when the
+        source doesn't honour the range or serves another disk than the one
+        partially fetched.
+        """
+        if offset:
+            start = max(0, offset - RESUME_OVERLAP)
+            r = self.http_session.get(
+                url, headers={'Range': 'bytes=%d-' % start}, stream=True,
+                verify=False)
+            if (r.status_code == 206 and
+                    self._resumes_disk(r, dest_disk_path, start, offset,
+                                       size)):
+                return r, offset
+            r.close()
+            LOG.warning(_LW("Unable to resume download of %(path)s at byte "
+                            "%(offset)d, the source disk doesn't match the "
+                            "partial one. Restarting it."),
+                        {'path': dest_disk_path, 'offset': offset})
+        r = self.http_session.get(url, stream=True, verify=False)
+        r.raise_for_status()
+        return r, 0
+
+    def _fetch_vm_disk_range(self, url, source, dest_disk_path,
+                             manifest_path, offset, zero_bytes, size=None,
+                             progress=None, checksum=None):
+        """GET the disk from offset onwards, appending to dest_disk_path.
+
+        All-zero chunks are left as holes in dest_disk_path. Returns the
+        offset reached and the number of zero bytes in the disk so far. The
+        manifest is updated as data is persisted, including when the
+        transfer is interrupted. progress, when given, is called with the
+        offset reached and the disk size, or None if unknown. checksum,
+        when given, is fed every byte of the disk as it is fetched.
+        """
+        r, resumed_offset = self._open_vm_disk(url, dest_disk_path, offset,
+                                               size)
+        if resumed_offset != offset:
+            offset = zero_bytes = 0
+        if not offset and r.headers.get('content-length'):
+            size = int(r.headers['content-length'])
+        if progress:
+            progress(offset, size)
+        if checksum:
+            checksum.catch_up(dest_disk_path, offset)
+
+        mode = 'r+b' if os.path.exists(dest_disk_path) else 'wb'
+        with open(dest_disk_path, mode) as f:
+            f.seek(offset)
+            f.truncate()
+            writer = utils.SparseFileWriter(f)
+            saved_offset = offset
+            try:
+                for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                    if chunk:
+                        writer.write(chunk)
+                        if checksum:
+                            checksum.update(chunk)
+                        offset += len(chunk)
+                        if progress:
+                            progress(offset, size)
+                        if offset - saved_offset >= MANIFEST_INTERVAL:
+                            writer.close()
+                            os.fsync(f.fileno())
+                            _save_manifest(manifest_path, url, source, size,
+                                           offset,
+                                           zero_bytes + writer.zero_bytes)
+                            saved_offset = offset
+            finally:
+                writer.close()
+                os.fsync(f.fileno())
+                zero_bytes += writer.zero_bytes
+                _save_manifest(manifest_path, url, source, size, offset,
+                               zero_bytes)
+        return offset, zero_bytes
+
+    def _get_vm_disk(self, device_url, dest_disk_path, progress=None,
+                     change_version=None):
+        """Download a disk.
+
+        A download interrupted earlier is resumed if it was for the same
+        disk of the VM at the same change_version of its configuration.
+        Returns its size, its number of zero bytes and the checksum of its
+        content.
+        """
         url = device_url.url
-        r = requests.get(url, verify=False)
-        if os.path.exists(dest_disk_path):
-            utils.execute('rm', dest_disk_path)
-        f = open(dest_disk_path, "wb")
-        for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
-            if chunk:
-                f.write(chunk)
-        f.close()
+        source = {'target_id': device_url.targetId,
+                  'change_version': change_version}
+        manifest_path = dest_disk_path + MANIFEST_SUFFIX
+        offset, zero_bytes, size = _load_manifest(manifest_path,
+                                                  dest_disk_path, source)
+        checksum = _DiskChecksum()
+        retries = 0
+        while True:
+            try:
+                offset, zero_bytes = self._fetch_vm_disk_range(
+                    url, source, dest_disk_path, manifest_path, offset,
+                    zero_bytes, size, progress, checksum)
+                break
+            except (requests.exceptions.RequestException, IOError) as e:
+                if retries >= CONF.vsphere_disk_download_retries:
+                    raise
+                retries += 1
+                offset, zero_bytes, size = _load_manifest(
+                    manifest_path, dest_disk_path, source)
+                interval = min(CONF.vsphere_disk_download_retry_interval *
+                               2 ** (retries - 1), MAX_RETRY_INTERVAL)
+                LOG.warning(_LW("Download of %(path)s interrupted at byte "
+                                "%(offset)d: %(error)s. Resuming in "
+                                "%(interval)d seconds (retry %(retry)d)."),
+                            {'path': dest_disk_path, 'offset': offset,
+                             'error': e, 'interval': interval,
+                             'retry': retries})
+                time.sleep(interval)
+        os.remove(manifest_path)
+        # Everything up to the end was fetched by an earlier transfer.
+        checksum.catch_up(dest_disk_path, offset)
+        return offset, zero_bytes, checksum.hexdigest()
+
+    def _can_stream_disk(self, url):
+        """Check qemu's curl block driver is able to read the export at url.
+
+        The curl driver needs the size of the disk up front and random
+        access to it, which NFC exports don't reliably provide.
+        """
+        try:
+            r = self.http_session.head(url, verify=False)
+            size = int(r.headers.get('content-length', 0))
+            if (r.status_code != 200 or size <= 0 or
+                    r.headers.get('accept-ranges') != 'bytes'):
+                return False
+            # Read the last byte back, the VMDK footer lives there.
+            r = self.http_session.get(
+                url, headers={'Range': 'bytes=%d-%d' % (size - 1, size - 1)},
+                stream=True, verify=False)
+            r.close()
+            return r.status_code == 206
+        except (requests.RequestException, ValueError):
+            return False
+
+    def _get_disk_stream_source(self, device_url):
+        """Build a qemu-img readable source for a lease device URL.
+
+        The disk is read through qemu's curl block driver, so the VMDK is
+        consumed straight from the NFC export without being staged locally.
+        """
+        file_opts = {'driver': device_url.url.split(':')[0],
+                     'url': device_url.url,
+                     'sslverify': 'off',
+                     'readahead': CHUNK_SIZE}
+        return 'json:%s' % json.dumps({'driver': 'vmdk',
+                                       'file': file_opts})
 
     def _get_device_urls(self, lease):
         try:
@@ -140,21 +511,48 @@ class VSphereDriver(driver.MigrationDriver):
             count += 1
         return lease
 
-    def validate_for_migration(self, vm_uuid):
+    def validate_for_migration(self, vm_uuid, warm=False):
         """Validates for all instance migration conditions for this hypervisor
 
         Raises:
             InvalidPowerState: VMWare requires virtual instances to be
                 in poweredoff state for migration. Raises this error if
                 not the case.
+            WarmMigrationNotSupported: Warm migrations of running instances
+                need changed block tracking.
         """
         vm = self._find_vm_by_uuid(vm_uuid)
+        if warm:
+            if not vm.capability.changeTrackingSupported:
+                return (False, exception.WarmMigrationNotSupported)
+            for device in vm.config.hardware.device:
+                if (isinstance(device, vim.vm.device.VirtualDisk) and
+                        not self._is_flat_disk(device)):
+                    LOG.warning(_LW("%(disk)s of VM %(vm)s can not be "
+                                    "copied warm, only flat disks without "
+                                    "snapshots on VMFS or NFS datastores "
+                                    "can."),
+                                {'disk': device.deviceInfo.label,
+                                 'vm': vm_uuid})
+                    return (False, exception.WarmMigrationNotSupported)
+            return (True, None)
         POWERED_OFF = vim.VirtualMachine.PowerState.poweredOff
         if not vm.runtime.powerState == POWERED_OFF:
             return (False, exception.InvalidPowerState)
         return (True, None)
 
-    def download_vm_disks(self, context, vm_uuid, base_path):
+    def _export_disk(self, host_semaphore, disk_handler, device_url, disk):
+        with host_semaphore:
+            disk_handler(device_url, disk)
+
+    def _export_vm_disks(self, vm_uuid, base_path, disk_handler):
+        """Export the VM disks under a keepalive'd NFC lease.
+
+        disk_handler is called with the device URL and the disk dict of each
+        exported disk while the lease is held. Disks are exported in
+        parallel, bounded by the per VM and per host export limits. If any
+        disk fails the lease is aborted and the error is re-raised.
+        """
         vm = self._find_vm_by_uuid(vm_uuid)
         lease = self._get_vm_lease(vm)
 
@@ -182,16 +580,35 @@ class VSphereDriver(driver.MigrationDriver):
 
                 device_urls = self._get_device_urls(lease)
 
+                host_semaphore = _get_host_export_semaphore(self.host)
+                pool = eventlet.GreenPool(CONF.vsphere_disk_exports_per_vm)
+                finished = queue.LightQueue()
+                exports = []
                 for device_url in device_urls:
-                    data = {}
                     path = os.path.join(base_path, device_url.targetId)
-                    self._get_vm_disk(device_url, path)
                     data = {'target_id': device_url.targetId,
                             'path': path,
                             'index': device_url.key.split(':')[1],
-                            'type': 'vmdk'}
+                            'type': 'vmdk',
+                            'change_version': vm.config.changeVersion}
+                    export = pool.spawn(self._export_disk, host_semaphore,
+                                        disk_handler, device_url, data)
+                    export.link(finished.put)
+                    exports.append(export)
                     disks.append(data)
 
+                try:
+                    # Reap exports as they finish so the first failure
+                    # aborts the lease without waiting on the disks
+                    # listed before it.
+                    for _ in exports:
+                        finished.get().wait()
+                except Exception:
+                    for export in exports:
+                        export.kill()
+                    lease.HttpNfcLeaseAbort()
+                    raise
+
                 lease.HttpNfcLeaseComplete()
                 keepalive_thread.join()
             elif lease.state == vim.HttpNfcLease.State.error:
@@ -202,6 +619,213 @@ class VSphereDriver(driver.MigrationDriver):
             raise
         return disks
 
+    def get_vm_disk_capacities(self, context, vm_uuid):
+        vm = self._find_vm_by_uuid(vm_uuid)
+        return [device.capacityInKB * 1024
+                for device in vm.config.hardware.device
+                if isinstance(device, vim.vm.device.VirtualDisk)]
+
+    def download_vm_disks(self, context, vm_uuid, base_path,
+                          disk_fetched=None, disk_progress=None):
+        def _download(device_url, disk):
+            progress = None
+            if disk_progress:
+                progress = functools.partial(disk_progress, disk)
+            size, zero_bytes, checksum = self._get_vm_disk(
+                device_url, disk['path'], progress,
+                change_version=disk.get('change_version'))
+            disk['fetched_bytes'] = size
+            disk['zero_bytes'] = zero_bytes
+            disk['checksum'] = checksum
+            if disk_fetched:
+                disk_fetched(disk)
+
+        return self._export_vm_disks(vm_uuid, base_path, _download)
+
+    def stream_vm_disks(self, context, vm_uuid, base_path, convert_disk):
+        def _stream(device_url, disk):
+            if self._can_stream_disk(device_url.url):
+                disk['source'] = self._get_disk_stream_source(device_url)
+            else:
+                LOG.warning(_LW("Export of disk %(key)s of VM %(vm)s does "
+                                "not support range reads, downloading it "
+                                "before conversion."),
+                            {'key': device_url.key, 'vm': vm_uuid})
+                size, zero_bytes, checksum = self._get_vm_disk(
+                    device_url, disk['path'],
+                    change_version=disk.get('change_version'))
+                disk['fetched_bytes'] = size
+                disk['zero_bytes'] = zero_bytes
+                disk['checksum'] = checksum
+            convert_disk(disk)
+
+        return self._export_vm_disks(vm_uuid, base_path, _stream)
+
+    def _wait_for_task(self, task):
+        """Wait for a vSphere task to complete, returns its result."""
+        while task.info.state in (vim.TaskInfo.State.queued,
+                                  vim.TaskInfo.State.running):
+            time.sleep(1)
+        if task.info.state == vim.TaskInfo.State.error:
+            raise Exception(task.info.error.msg)
+        return task.info.result
+
+    def enable_change_tracking(self, context, vm_uuid):
+        vm = self._find_vm_by_uuid(vm_uuid)
+        if not vm.config.changeTrackingEnabled:
+            spec = vim.vm.ConfigSpec(changeTrackingEnabled=True)
+            self._wait_for_task(vm.ReconfigVM_Task(spec=spec))
+
+    def _query_changed_areas(self, vm, snapshot, device, change_id):
+        """Return the (start, length) areas of device changed since a change.
+
+        For change_id '*', returns all the allocated areas of device.
+        """
+        capacity = device.capacityInKB * 1024
+        areas = []
+        offset = 0
+        while offset < capacity:
+            info = vm.QueryChangedDiskAreas(snapshot=snapshot,
+                                            deviceKey=device.key,
+                                            startOffset=offset,
+                                            changeId=change_id)
+            areas.extend((area.start, area.length)
+                         for area in info.changedArea or [])
+            if not info.length:
+                break
+            offset = info.startOffset + info.length
+        return areas
+
+    def _get_datacenter(self, vm):
+        parent = vm.parent
+        while not isinstance(parent, vim.Datacenter):
+            parent = parent.parent
+        return parent
+
+    def _is_flat_disk(self, device):
+        """Whether the data of a disk is a single file of its datastore.
+
+        Disks with snapshots read through a chain of delta files, and vSAN
+        and VVol datastores don't serve disks as files.
+        """
+        backing = device.backing
+        return (isinstance(backing,
+                           vim.vm.device.VirtualDisk.FlatVer2BackingInfo) and
+                backing.parent is None and
+                backing.datastore.summary.type in WARM_DATASTORE_TYPES)
+
+    def _get_datastore_url(self, vm, file_name):
+        """Return the URL of a '[datastore] path' file on the datastore."""
+        datastore, path = file_name[1:].split('] ', 1)
+        query = urlparse.urlencode({'dcPath': self._get_datacenter(vm).name,
+                                    'dsName': datastore})
+        return 'https://%s:%d/folder/%s?%s' % (self.host, self.port,
+                                               urlparse.quote(path), query)
+
+    def _get_flat_file_url(self, vm, backing):
+        """Return the datastore URL of the data of a flat disk backing.
+
+        The data file is the extent named by the VMDK descriptor.
+        """
+        if (not isinstance(backing,
+                           vim.vm.device.VirtualDisk.FlatVer2BackingInfo) or
+                backing.parent is not None):
+            raise exception.WarmMigrationNotSupported(
+                instance_id=vm.config.uuid)
+        r = self.http_session.get(self._get_datastore_url(vm,
+                                                          backing.fileName),
+                                  headers={'Cookie': self.con._stub.cookie},
+                                  verify=False)
+        r.raise_for_status()
+        extents = [match.groups() for match in
+                   (EXTENT_RE.match(line) for line in r.text.splitlines())
+                   if match]
+        if len(extents) != 1 or extents[0][2] not in FLAT_EXTENT_TYPES:
+            raise exception.WarmMigrationNotSupported(
+                instance_id=vm.config.uuid)
+        # Extents are named relative to the descriptor.
+        datastore, path = backing.fileName[1:].split('] ', 1)
+        flat_path = posixpath.join(posixpath.dirname(path), extents[0][3])
+        return self._get_datastore_url(vm, '[%s] %s' % (datastore, flat_path))
+
+    def _read_area(self, url, start, length):
+        headers = {'Range': 'bytes=%d-%d' % (start, start + length - 1),
+                   'Cookie': self.con._stub.cookie}
+        r = self.http_session.get(url, headers=headers, stream=True,
+                                  verify=False)
+        r.raise_for_status()
+        for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+            if chunk:
+                yield chunk
+
+    def copy_vm_disks(self, context, vm_uuid, base_path, disks=None,
+                      disk_progress=None):
+        """Copy the VM disks from a snapshot, through their flat files.
+
+        While the snapshot exists the disks write to its delta files, so
+        their flat files hold the point in time of the snapshot and are
+        read over the datastore HTTP interface. The snapshot is removed
+        after every copy, the next one reads the flat files with the
+        changes consolidated into them.
+        """
+        vm = self._find_vm_by_uuid(vm_uuid)
+        previous = dict((disk['key'], disk) for disk in disks or [])
+        task = vm.CreateSnapshot_Task(name='guts-warm-migration',
+                                      description='Guts warm migration',
+                                      memory=False, quiesce=False)
+        snapshot = self._wait_for_task(task)
+        try:
+            devices = [device for device in snapshot.config.hardware.device
+                       if isinstance(device, vim.vm.device.VirtualDisk)]
+            copied = []
+            for index, device in enumerate(devices):
+                disk = previous.get(device.key)
+                if disk is None:
+                    target_id = 'disk-%d.raw' % index
+                    disk = {'key': device.key,
+                            'target_id': target_id,
+                            'path': os.path.join(base_path, target_id),
+                            'index': str(index),
+                            'type': 'raw',
+                            'change_id': '*'}
+                areas = self._query_changed_areas(vm, snapshot, device,
+                                                  disk['change_id'])
+                # The backing of the disk in the snapshot, which the running
+                # VM no longer writes to.
+                url = self._get_flat_file_url(vm, device.backing)
+                progress = None
+                if disk_progress:
+                    progress = functools.partial(disk_progress, disk)
+                disk['copied_bytes'] = driver.write_disk_areas(
+                    disk['path'], device.capacityInKB * 1024, areas,
+                    functools.partial(self._read_area, url), progress)
+                disk['change_id'] = device.backing.changeId
+                copied.append(disk)
+        finally:
+            self._wait_for_task(
+                snapshot.RemoveSnapshot_Task(removeChildren=False))
+        return copied
+
+    def power_off_vm(self, context, vm_uuid):
+        """Shut the guest OS down, powering the VM off if it does not."""
+        vm = self._find_vm_by_uuid(vm_uuid)
+        POWERED_OFF = vim.VirtualMachine.PowerState.poweredOff
+        if vm.runtime.powerState == POWERED_OFF:
+            return
+        try:
+            vm.ShutdownGuest()
+        except vim.fault.ToolsUnavailable:
+            pass
+        else:
+            deadline = time.time() + CONF.vsphere_guest_shutdown_timeout
+            while (vm.runtime.powerState != POWERED_OFF and
+                   time.time() < deadline):
+                time.sleep(5)
+        if vm.runtime.powerState != POWERED_OFF:
+            LOG.warning(_LW("Guest OS of VM %s did not shut down, powering "
+                            "it off."), vm_uuid)
+            self._wait_for_task(vm.PowerOffVM_Task())
+
 
 def get_migration_driver(context):
     return VSphereDriver(context)
@@ -0,0 +1,194 @@
+# Copyright (c) 2015 Aptira Pty Ltd.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Migration status events pushed from the migration service to the API.
+
+The migration service casts every status and event change of a migration
+on a fanout topic. Each API worker keeps the recent events of each
+migration in memory, so clients can wait for the next event of a migration
+without anyone polling the database.
+"""
+
+import collections
+import threading
+import time
+
+from oslo_config import cfg
+from oslo_log import log as logging
+import oslo_messaging as messaging
+
+from guts.i18n import _LW
+from guts import rpc
+
+
+migration_events_opts = [
+    cfg.IntOpt('migration_events_max_migrations',
+               default=1000,
+               min=1,
+               help='Maximum number of migrations whose recent events each '
+                    'API worker keeps in memory.'),
+    cfg.IntOpt('migration_events_per_migration',
+               default=100,
+               min=1,
+               help='Maximum number of recent events kept in memory for '
+                    'each migration.'),
+    cfg.IntOpt('migration_events_max_timeout',
+               default=60,
+               min=0,
+               help='Maximum number of seconds a request for the events of '
+                    'a migration waits for a new event.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(migration_events_opts)
+
+LOG = logging.getLogger(__name__)
+
+EVENTS_TOPIC = 'guts-migration-events'
+
+
+class _MigrationEvents(object):
+    def __init__(self, lock, size):
+        self.events = collections.deque(maxlen=size)
+        self.condition = threading.Condition(lock)
+
+
+class EventLog(object):
+    """Recent events of each migration, with waiting for new ones.
+
+    Events carry a cursor, increasing with each event of a migration.
+    Migrations whose events were least recently added or read are dropped
+    beyond max_migrations.
+    """
+
+    def __init__(self, max_migrations, events_per_migration):
+        self.max_migrations = max_migrations
+        self.events_per_migration = events_per_migration
+        self._lock = threading.Lock()
+        self._migrations = collections.OrderedDict()
+
+    def _get(self, migration_id):
+        entry = self._migrations.pop(migration_id, None)
+        if entry is None:
+            entry = _MigrationEvents(self._lock, self.events_per_migration)
+        self._migrations[migration_id] = entry
+        while len(self._migrations) > self.max_migrations:
+            self._migrations.popitem(last=False)
+        return entry
+
+    def add(self, migration_id, event):
+        """Record an event and wake up the clients waiting for it."""
+        with self._lock:
+            entry = self._get(migration_id)
+            last = entry.events[-1] if entry.events else None
+            if last is not None and last['cursor'] >= event['cursor']:
+                # Duplicate or late delivery.
+                return
+            entry.events.append(event)
+            entry.condition.notify_all()
+
+    def has_events(self, migration_id):
+        with self._lock:
+            entry = self._migrations.get(migration_id)
+            return bool(entry and entry.events)
+
+    def wait(self, migration_id, since=None, timeout=0):
+        """Return the events of a migration after the since cursor.
+
+        Blocks for up to timeout seconds until there is one. Without since,
+        returns the latest event right away if there is any.
+        """
+        deadline = time.time() + timeout
+        with self._lock:
+            entry = self._get(migration_id)
+            while True:
+                if since is None:
+                    events = list(entry.events)[-1:]
+                else:
+                    events = [event for event in entry.events
+                              if event['cursor'] > since]
+                remaining = deadline - time.time()
+                if events or remaining <= 0:
+                    return events
+                entry.condition.wait(remaining)
+
+
+_EVENT_LOG = None
+_EVENT_LOG_LOCK = threading.Lock()
+
+
+def get_event_log():
+    """Return the event log of this process."""
+    global _EVENT_LOG
+    with _EVENT_LOG_LOCK:
+        if _EVENT_LOG is None:
+            _EVENT_LOG = EventLog(CONF.migration_events_max_migrations,
+                                  CONF.migration_events_per_migration)
+        return _EVENT_LOG
+
+
+class EventsEndpoint(object):
+    """Records the events cast by the migration services."""
+
+    target = messaging.Target(version='1.0')
+
+    def __init__(self, event_log):
+        self.event_log = event_log
+
+    def migration_event(self, ctxt, migration_id, event):
+        self.event_log.add(migration_id, event)
+
+
+class EventPublisher(object):
+    """Casts the events of the migrations run by a migration service."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last_cursor = 0
+
+    def _next_cursor(self):
+        # Microseconds since the epoch, so that the cursors of a migration
+        # keep increasing across restarts of the service.
+        with self._lock:
+            self._last_cursor = max(self._last_cursor + 1,
+                                    int(time.time() * 1000000))
+            return self._last_cursor
+
+    def publish(self, ctxt, migration_id, values):
+        """Cast a status or event change of a migration."""
+        if not rpc.initialized():
+            return
+        event = dict(values, cursor=self._next_cursor(),
+                     timestamp=time.time())
+        target = messaging.Target(topic=EVENTS_TOPIC, version='1.0',
+                                  fanout=True)
+        try:
+            rpc.get_client(target).cast(ctxt, 'migration_event',
+                                        migration_id=migration_id,
+                                        event=event)
+        except Exception:
+            # Watchers catch up with the next event, or time out and fall
+            # back on reading the migration.
+            LOG.warning(_LW('Failed to publish an event of migration '
+                            '%s.'), migration_id, exc_info=True)
+
+
+def start_listener(host):
+    """Start recording migration events, returns the RPC server."""
+    target = messaging.Target(topic=EVENTS_TOPIC, server=host)
+    server = rpc.get_server(target, [EventsEndpoint(get_event_log())])
+    server.start()
+    return server
@@ -0,0 +1,220 @@
+# Copyright (c) 2015 Aptira Pty Ltd.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Content addressed cache of converted disks.
+
+VMs cloned from the same template, and retried migrations, fetch identical
+disks. Converted disks are kept on the conversion host under the checksum
+of the fetched disk, along with the image they were uploaded as, so an
+identical disk is neither converted nor uploaded again. The least recently
+used disks are evicted beyond image_cache_max_gb.
+"""
+
+import errno
+import os
+import threading
+import time
+
+from oslo_config import cfg
+from oslo_log import log as logging
+from oslo_serialization import jsonutils
+from oslo_utils import units
+
+from guts.i18n import _LI, _LW
+
+
+image_cache_opts = [
+    cfg.StrOpt('image_cache_dir',
+               default='$conversion_dir/_cache',
+               help='Directory of the cache of converted disks. It must be '
+                    'on the file system of conversion_dir.'),
+    cfg.IntOpt('image_cache_max_gb',
+               default=0,
+               min=0,
+               help='Maximum size, in GB, of the cache of converted disks. '
+                    '0 disables the cache.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(image_cache_opts)
+
+LOG = logging.getLogger(__name__)
+
+INDEX_FILE = 'index.json'
+
+
+class ImageCache(object):
+    """Converted disks and their image ids, keyed by content.
+
+    Disks are added by hard linking them into the cache directory, so
+    evicting a disk never pulls it from under a migration still using it.
+    The index is kept in the cache directory and survives restarts.
+    """
+
+    def __init__(self, path, max_size):
+        self.path = path
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._entries = None
+        self._stats = {'hits': 0, 'misses': 0,
+                       'converted_bytes_saved': 0,
+                       'uploaded_bytes_saved': 0}
+
+    @staticmethod
+    def key(checksum, out_format, profile_name):
+        """Return the key of a disk converted to out_format with a profile.
+
+        Returns None when the content of the disk is unknown.
+        """
+        if not checksum:
+            return None
+        return '%s-%s-%s' % (checksum.replace(':', '-'), out_format,
+                             profile_name or 'default')
+
+    def _load(self):
+        if self._entries is not None:
+            return
+        self._entries = {}
+        try:
+            with open(os.path.join(self.path, INDEX_FILE)) as f:
+                entries = jsonutils.loads(f.read())
+        except (IOError, ValueError):
+            return
+        for key, entry in entries.items():
+            if os.path.exists(entry['path']):
+                self._entries[key] = entry
+
+    def _save(self):
+        index_path = os.path.join(self.path, INDEX_FILE)
+        tmp_path = index_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(jsonutils.dumps(self._entries))
+        os.rename(tmp_path, index_path)
+
+    def _size(self):
+        return sum(entry['file_size'] for entry in self._entries.values())
+
+    def _evict(self):
+        entries = sorted(self._entries.items(),
+                         key=lambda item: item[1]['last_used'])
+        size = self._size()
+        for key, entry in entries:
+            if size <= self.max_size:
+                break
+            try:
+                os.unlink(entry['path'])
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+            del self._entries[key]
+            size -= entry['file_size']
+            LOG.info(_LI("Evicted converted disk %s from the cache."), key)
+
+    def get(self, key, dest_path):
+        """Link the cached disk of key to dest_path and return it.
+
+        The disk is a dict of its 'path', 'virtual_size', 'file_size' and
+        the 'image_id' it was uploaded as, if it was. Returns None when the
+        disk is not cached.
+        """
+        if key is None:
+            return None
+        with self._lock:
+            self._load()
+            entry = self._entries.get(key)
+            if entry is not None:
+                try:
+                    if os.path.exists(dest_path):
+                        os.unlink(dest_path)
+                    os.link(entry['path'], dest_path)
+                except OSError:
+                    LOG.warning(_LW("Failed to use cached disk %s."), key,
+                                exc_info=True)
+                    del self._entries[key]
+                    entry = None
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            self._stats['hits'] += 1
+            self._stats['converted_bytes_saved'] += entry['virtual_size']
+            entry['last_used'] = time.time()
+            self._save()
+            return dict(entry)
+
+    def add(self, key, path, virtual_size):
+        """Keep the converted disk at path under key."""
+        if key is None:
+            return
+        cache_path = os.path.join(self.path, key)
+        file_size = os.path.getsize(path)
+        if file_size > self.max_size:
+            return
+        with self._lock:
+            self._load()
+            if not os.path.isdir(self.path):
+                os.makedirs(self.path)
+            try:
+                if os.path.exists(cache_path):
+                    os.unlink(cache_path)
+                os.link(path, cache_path)
+            except OSError:
+                LOG.warning(_LW("Failed to add %(path)s to the cache of "
+                                "converted disks."), {'path': path},
+                            exc_info=True)
+                return
+            self._entries[key] = {'path': cache_path,
+                                  'virtual_size': virtual_size,
+                                  'file_size': file_size,
+                                  'image_id': None,
+                                  'last_used': time.time()}
+            self._evict()
+            self._save()
+
+    def set_image(self, key, image_id):
+        """Record the image a cached disk was uploaded as."""
+        with self._lock:
+            self._load()
+            entry = self._entries.get(key)
+            if entry is None or entry.get('image_id') == image_id:
+                return
+            entry['image_id'] = image_id
+            self._save()
+
+    def image_reused(self, key):
+        """Count the upload of a cached disk as saved."""
+        with self._lock:
+            self._load()
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._stats['uploaded_bytes_saved'] += entry['file_size']
+
+    def stats(self):
+        """Return the hit and miss counts and the bytes saved so far."""
+        with self._lock:
+            self._load()
+            stats = dict(self._stats, entries=len(self._entries),
+                         size=self._size())
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = (float(stats['hits']) / lookups
+                             if lookups else 0.0)
+        return stats
+
+
+def get_image_cache():
+    """Return the cache of converted disks, or None if it is disabled."""
+    if not CONF.image_cache_max_gb:
+        return None
+    return ImageCache(CONF.image_cache_dir, CONF.image_cache_max_gb * units.Gi)
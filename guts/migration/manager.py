@@ -18,19 +18,37 @@
 Migration Service
 """
 
+import atexit
+import contextlib
 import functools
-import os
+import re
+import time
 
+import eventlet
 from oslo_config import cfg
 from oslo_log import log as logging
 import oslo_messaging as messaging
+from oslo_serialization import jsonutils
+from oslo_service import periodic_task
 from oslo_utils import importutils
+from oslo_utils import units
 
-from guts.compute import nova
+from guts import context as guts_context
 from guts import db
 from guts import exception
-from guts.image import glance
+from guts.i18n import _LI
+from guts.i18n import _LW
 from guts import manager
+from guts.migration import conversion
+from guts.migration import driver_pool
+from guts.migration import events
+from guts.migration import image_cache
+from guts.migration import pipeline
+from guts.migration import progress
+from guts.migration import scheduler
+from guts.migration import status_writer
+from guts.migration import target
+from guts.migration import workspace
 from guts import rpc
 from guts import utils
 
@@ -38,7 +56,81 @@ from guts import utils
 migration_manager_opts = [
     cfg.StrOpt('conversion_dir',
                default='$state_path/migrations',
-               help='Disk conversion directory.'),
+               help='Disk conversion directory, used when conversion_dirs '
+                    'is not set.'),
+    cfg.StrOpt('disk_transfer_mode',
+               default='staged',
+               choices=['staged', 'streaming'],
+               help='How VM disks are moved into the converter. "staged" '
+                    'downloads every disk into conversion_dir before '
+                    'converting it, "streaming" lets qemu-img read the '
+                    'disk straight from the source so only the converted '
+                    'image is written locally. Streaming is opt-in, disks '
+                    'whose source export does not support range reads are '
+                    'still staged.'),
+    cfg.IntOpt('max_concurrent_conversions',
+               default=2,
+               min=1,
+               help='Maximum number of disks converted concurrently by '
+                    'this migration service.'),
+    cfg.IntOpt('max_concurrent_uploads',
+               default=4,
+               min=1,
+               help='Maximum number of converted disks finished by the '
+                    'migration target, such as uploaded to Glance, '
+                    'concurrently by this migration service.'),
+    cfg.IntOpt('max_concurrent_migrations',
+               default=10,
+               min=1,
+               help='Maximum number of migrations run concurrently by this '
+                    'migration service. Further migrations are queued.'),
+    cfg.IntOpt('max_concurrent_exports_per_source',
+               default=4,
+               min=1,
+               help='Maximum number of migrations exporting from the same '
+                    'source hypervisor concurrently on this migration '
+                    'service.'),
+    cfg.IntOpt('max_staged_gb',
+               default=0,
+               min=0,
+               help='Maximum disk capacity, in GB, of the migrations '
+                    'running concurrently on this migration service. '
+                    '0 means unlimited.'),
+    cfg.IntOpt('source_connection_idle_ttl',
+               default=600,
+               min=0,
+               help='Seconds an unused source hypervisor connection is '
+                    'kept open for reuse by later operations.'),
+    cfg.IntOpt('source_connection_check_interval',
+               default=60,
+               min=0,
+               help='Seconds after which an unused source hypervisor '
+                    'connection is checked for an expired session before '
+                    'being reused.'),
+    cfg.IntOpt('migration_progress_interval',
+               default=10,
+               min=1,
+               help='Minimum number of seconds between two writes of the '
+                    'disk progress of a migration to the database.'),
+    cfg.IntOpt('warm_migration_max_passes',
+               default=5,
+               min=1,
+               help='Maximum number of copies of the disks of a running VM '
+                    'made by a warm migration, the first one in full, '
+                    'before the VM is powered off for the final copy.'),
+    cfg.IntOpt('warm_migration_cutover_mb',
+               default=1024,
+               min=0,
+               help='A warm migration powers the VM off for the final copy '
+                    'as soon as a copy of its running disks changes less '
+                    'than this many MB.'),
+    cfg.IntOpt('migration_status_flush_interval',
+               default=2,
+               min=1,
+               help='Number of seconds migration status and event changes '
+                    'are queued for before being written to the database '
+                    'in one batch. Completion and errors are written right '
+                    'away.'),
 ]
 
 CONF = cfg.CONF
@@ -50,7 +142,8 @@ get_notifier = functools.partial(rpc.get_notifier, service='migration')
 wrap_exception = functools.partial(exception.wrap_exception,
                                    get_notifier=get_notifier)
 
-MIGRATION_STATUS = {'init': 'Initiating',
+MIGRATION_STATUS = {'queued': 'Queued',
+                    'init': 'Initiating',
                     'inprogress': 'Inprogress',
                     'complete': 'Completed',
                     'error': 'Error'}
@@ -58,10 +151,20 @@ MIGRATION_STATUS = {'init': 'Initiating',
 MIGRATION_EVENT = {'connect': 'Connecting to VM',
                    'fetch': 'Fetching VM Disk(s)',
                    'convert': 'Converting VM Disk(s)',
-                   'upload': 'Uploading to Glance',
+                   'stream': 'Streaming and Converting VM Disk(s)',
+                   'precopy': 'Copying Disk(s) of Running VM',
+                   'cutover': 'Powering off VM for Final Copy',
                    'boot': 'Booting Instance',
                    'done': '-'}
 
+DISK_SIZE_RE = re.compile(r"\|\s*(\d+(?:\.\d+)?)GB\s*\|")
+
+
+def _estimate_staged_bytes(vm):
+    """Estimate the bytes a migration of vm stages from its disk summary."""
+    sizes = DISK_SIZE_RE.findall(vm.get('virtual_disks') or '')
+    return int(sum(float(size) for size in sizes) * units.Gi)
+
 
 def locked_migration_operation(f):
     """Lock decorator for migration operations.
@@ -97,6 +200,85 @@ class MigrationManager(manager.Manager):
     def __init__(self, service_name=None,
                  *args, **kwargs):
         super(MigrationManager, self).__init__(*args, **kwargs)
+        self._convert_semaphore = eventlet.semaphore.Semaphore(
+            CONF.max_concurrent_conversions)
+        self._upload_semaphore = eventlet.semaphore.Semaphore(
+            CONF.max_concurrent_uploads)
+        self.scheduler = scheduler.MigrationScheduler(
+            CONF.max_concurrent_migrations,
+            CONF.max_concurrent_exports_per_source,
+            CONF.max_staged_gb * units.Gi)
+        self.driver_pool = driver_pool.DriverPool(
+            CONF.source_connection_idle_ttl,
+            CONF.source_connection_check_interval)
+        atexit.register(self.driver_pool.clear)
+        self.status_writer = status_writer.StatusWriter(
+            CONF.migration_status_flush_interval)
+        atexit.register(self.status_writer.stop)
+        self.event_publisher = events.EventPublisher()
+        self.image_cache = image_cache.get_image_cache()
+        self.workspaces = workspace.get_workspace_manager()
+
+    def init_host(self):
+        ctxt = guts_context.get_admin_context()
+        self.workspaces.reap_orphans(
+            functools.partial(self._is_orphan_workspace, ctxt))
+        self.status_writer.start()
+        self._recover_migrations(ctxt)
+
+    def _recover_migrations(self, context):
+        """Resume the migrations this host had before it was restarted.
+
+        Queued migrations only lived in the in memory scheduler and are
+        queued again. Migrations that were running when the service
+        stopped can not be resumed and are failed.
+        """
+        queued = db.migration_get_all(
+            context, filters={'host': self.host,
+                              'migration_status': MIGRATION_STATUS['queued']})
+        for migration_ref in queued:
+            LOG.info(_LI("Queueing migration %s again after a restart."),
+                     migration_ref.get('id'))
+            self.create_migration(context, migration_ref)
+
+        interrupted = db.migration_get_all(
+            context, filters={'host': self.host,
+                              'migration_status': [
+                                  MIGRATION_STATUS['init'],
+                                  MIGRATION_STATUS['inprogress']]})
+        for migration_ref in interrupted:
+            LOG.warning(_LW("Migration %s was interrupted by a restart of "
+                            "the migration service."),
+                        migration_ref.get('id'))
+            self._migration_status_update(context, migration_ref.get('id'),
+                                          None, MIGRATION_STATUS['error'])
+
+    def _is_orphan_workspace(self, context, vm_id):
+        """Whether no migration of the VM of a workspace can resume."""
+        try:
+            vm = db.vm_get(context, vm_id)
+        except exception.VMNotFound:
+            return True
+        return bool(vm.get('migrated'))
+
+    def _reserve_workspace(self, vm, capacities, migration_target, warm):
+        """Reserve the space the migration of vm stages, returns it.
+
+        capacities are the sizes of the VM disks reported by the driver.
+        Staged disks take up to their capacity once fetched and once
+        converted, when they are converted in the workspace.
+        """
+        if capacities is None:
+            capacity = _estimate_staged_bytes(vm)
+        else:
+            capacity = sum(capacities)
+        copies = 1
+        if CONF.disk_transfer_mode == 'streaming' and not warm:
+            copies = 0
+        if migration_target.converts_in_workspace:
+            copies += 1
+        return self.workspaces.reserve(vm.get('id'), capacity * copies,
+                                       CONF.workspace_reserve_timeout)
 
     def _prepare_connection_dict(self, con_string):
         con_dict = {}
@@ -116,15 +298,36 @@ class MigrationManager(manager.Manager):
         driver.initialize(con_dict)
         return driver
 
+    @contextlib.contextmanager
     def _get_driver_from_source(self, context, source):
+        """Yield a connected driver for source from the driver pool."""
         source_type_id = source.get('source_type_id')
         con_string = source.get('connection_params')
-        source_type = db.source_type_get(context, source_type_id)
-        source_driver_path = source_type.get('driver_class_path')
 
-        return self._get_migration_driver(context,
-                                          source_driver_path,
-                                          con_string)
+        def create_driver():
+            source_type = db.source_type_get(context, source_type_id)
+            source_driver_path = source_type.get('driver_class_path')
+            return self._get_migration_driver(context,
+                                              source_driver_path,
+                                              con_string)
+
+        key = (source.get('id'), source_type_id, con_string)
+        with self.driver_pool.driver(key, create_driver) as driver:
+            yield driver
+
+    @periodic_task.periodic_task
+    def _evict_idle_source_connections(self, context):
+        self.driver_pool.evict_idle()
+
+    @periodic_task.periodic_task(spacing=600)
+    def _report_image_cache_stats(self, context):
+        if self.image_cache is None:
+            return
+        LOG.info(_LI("Converted disk cache: %(entries)d disks, %(size)d "
+                     "bytes, hit rate %(hit_rate).2f (%(hits)d hits, "
+                     "%(misses)d misses), %(converted_bytes_saved)d bytes "
+                     "of conversion and %(uploaded_bytes_saved)d bytes of "
+                     "upload saved."), self.image_cache.stats())
 
     def fetch_vms(self, context, source_hypervisor_id):
         """Fetch VM list from source hypervisor"""
@@ -133,60 +336,260 @@ class MigrationManager(manager.Manager):
 
         source = db.source_get(context, source_hypervisor_id)
 
-        driver = self._get_driver_from_source(context, source)
-        vms = driver.get_vms_list()
+        with self._get_driver_from_source(context, source) as driver:
+            vms = driver.get_vms_list()
 
-        db.delete_vms_by_source_id(context, source_hypervisor_id)
+        result = db.vm_sync_by_source_id(context, source_hypervisor_id, vms)
+        LOG.info(_LI("Synchronized VMs of source %(source)s: %(created)d "
+                     "created, %(updated)d updated, %(deleted)d deleted "
+                     "with %(deleted_migrations)d migrations."),
+                 dict(result, source=source_hypervisor_id))
 
-        for vm in vms:
-            vm['source_id'] = source_hypervisor_id
-            db.vm_create(context, vm)
+    def _convert_disk(self, disk, migration_target, size,
+                      progress_callback=None, profile=None):
+        """Convert disk into the target.
 
-    def _convert_disks(self, context, migration_id, disks):
+        Returns whether the converted disk was taken from the cache of
+        converted disks instead.
+        """
+        out_format, target_args = migration_target.prepare_disk(disk, size)
+        cache_key = None
+        if self.image_cache is not None and migration_target.cacheable:
+            cache_key = image_cache.ImageCache.key(
+                disk.get('checksum'), out_format,
+                profile.name if profile else None)
+            cached = self.image_cache.get(cache_key, disk['dest_path'])
+            if cached is not None:
+                disk['cache_key'] = cache_key
+                disk['size'] = cached['virtual_size']
+                disk['image_id'] = cached['image_id']
+                return True
+
+        convert_args = profile.convert_args() if profile else ()
+        utils.convert_image(disk.get('source', disk['path']),
+                            disk['dest_path'], out_format,
+                            run_as_root=migration_target.convert_as_root,
+                            progress_callback=progress_callback,
+                            convert_args=tuple(target_args) + convert_args)
+        disk['size'] = utils.qemu_img_info(disk['dest_path'],
+                                           run_as_root=True).virtual_size
+        if cache_key is not None:
+            self.image_cache.add(cache_key, disk['dest_path'], disk['size'])
+            disk['cache_key'] = cache_key
+        return False
+
+    def _convert_disk_with_progress(self, disk, migration_target,
+                                    disk_progress, profile):
+        """Convert disk into the target with profile, recording progress.
+
+        Besides the converted bytes, records the profile used and the
+        throughput of the whole conversion in disk_progress.
+        """
+        disk_id = disk['target_id']
+        total = utils.qemu_img_info(disk.get('source', disk['path']),
+                                    run_as_root=False).virtual_size
+        disk_progress.advance(disk_id, 'convert', 0, total)
+
+        def converted(fraction):
+            disk_progress.advance(disk_id, 'convert',
+                                  int(fraction * (total or 0)))
+
+        started_at = time.time()
+        cached = self._convert_disk(disk, migration_target, total, converted,
+                                    profile)
+        seconds = time.time() - started_at
+        disk_progress.finish(disk_id, 'convert')
+        if cached:
+            disk_progress.set(disk_id, cache_hit=True)
+            LOG.info(_LI("Disk %s is identical to a converted disk in the "
+                         "cache, skipped its conversion."), disk_id)
+            return
+        throughput = int(total / seconds) if total and seconds > 0 else None
+        disk_progress.set(disk_id, conversion_profile=profile.name,
+                          convert_seconds=round(seconds, 1),
+                          convert_throughput=throughput)
+        LOG.info(_LI("Converted disk %(disk)s with conversion profile "
+                     "%(profile)s in %(seconds).1f seconds."),
+                 {'disk': disk_id, 'profile': profile.name,
+                  'seconds': seconds})
+
+    def _record_fetched_disk(self, disk_progress, disk):
+        """Record the fetched and zero byte counts of disk."""
+        disk_id = disk['target_id']
+        disk_progress.finish(disk_id, 'transfer')
+        fetched = disk.get('fetched_bytes')
+        if fetched is None:
+            return
+        zero = disk.get('zero_bytes', 0)
+        zero_ratio = float(zero) / fetched if fetched else 0.0
+        disk_progress.set(disk_id, fetched_bytes=fetched, zero_bytes=zero,
+                          zero_ratio=round(zero_ratio, 4))
+
+    def _warm_copy_disks(self, context, migration_id, driver, source_vm_id,
+                         vm_conversion_dir, disk_progress):
+        """Copy the disks of a running VM until it can be powered off.
+
+        The first copy is a full one, the following ones only copy the
+        blocks changed since the previous copy. Once a copy changes less
+        than warm_migration_cutover_mb, or after warm_migration_max_passes
+        copies, the VM is powered off and the last changes copied.
+        """
+        def copy_progress(disk, done, total):
+            disk_progress.advance(disk['target_id'], 'transfer', done, total)
+
+        def copy(disks, copy_pass):
+            disks = driver.copy_vm_disks(context, source_vm_id,
+                                         vm_conversion_dir, disks,
+                                         copy_progress)
+            for disk in disks:
+                disk['fetched_bytes'] = (disk.get('fetched_bytes', 0) +
+                                         disk['copied_bytes'])
+                disk_progress.finish(disk['target_id'], 'transfer')
+                disk_progress.set(disk['target_id'], copy_passes=copy_pass,
+                                  last_copy_bytes=disk['copied_bytes'])
+            copied = sum(disk['copied_bytes'] for disk in disks)
+            LOG.info(_LI("Copy %(pass)d of the disks of migration "
+                         "%(migration)s wrote %(copied)d bytes."),
+                     {'pass': copy_pass, 'migration': migration_id,
+                      'copied': copied})
+            return disks, copied
+
+        driver.enable_change_tracking(context, source_vm_id)
         self._migration_status_update(context, migration_id,
-                                      MIGRATION_EVENT['convert'])
-        for disk in disks:
-            path = disk['path']
-            disk['dest_path'] = path.replace('.vmdk', '.qcow2')
-            utils.convert_image(path, disk['dest_path'],
-                                'qcow2', run_as_root=False)
-            disk['size'] = utils.qemu_img_info(disk['dest_path'],
-                                               run_as_root=True).virtual_size
+                                      MIGRATION_EVENT['precopy'],
+                                      MIGRATION_STATUS['inprogress'])
+        cutover_bytes = CONF.warm_migration_cutover_mb * units.Mi
+        disks = None
+        for copy_pass in range(1, CONF.warm_migration_max_passes + 1):
+            disks, copied = copy(disks, copy_pass)
+            if copy_pass > 1 and copied <= cutover_bytes:
+                break
+
+        self._migration_status_update(context, migration_id,
+                                      MIGRATION_EVENT['cutover'])
+        driver.power_off_vm(context, source_vm_id)
+        disks, __ = copy(disks, copy_pass + 1)
+        return disks
+
+    def _process_disks(self, context, migration_id, driver, source_vm_id,
+                       vm_workspace, migration_target, profile, warm=False):
+        """Fetch, convert and finish the VM disks as a per disk pipeline.
+
+        Disks of warm migrations are copied while the VM runs and are
+        converted once it is powered off and they are fully copied. Staged
+        disks are removed from vm_workspace as soon as they are converted,
+        converted disks as soon as they are finished.
+        """
+        streaming = CONF.disk_transfer_mode == 'streaming' and not warm
+        vm_conversion_dir = vm_workspace.path
+
+        def save_progress(details):
+            self.status_writer.update(
+                migration_id, {'disk_details': jsonutils.dumps(details)})
+
+        disk_progress = progress.MigrationProgress(
+            save_progress, CONF.migration_progress_interval)
+
+        def transfer_progress(disk, done, total):
+            disk_progress.advance(disk['target_id'], 'transfer', done, total)
+
+        def convert_disk(disk):
+            self._convert_disk_with_progress(disk, migration_target,
+                                             disk_progress, profile)
+            if 'source' not in disk:
+                # Streamed disks the source can't serve in place are staged
+                # outside of the reservation of the workspace.
+                vm_workspace.remove(disk['path'],
+                                    0 if streaming else disk['size'])
+
+        def finish_disk(disk):
+            disk_id = disk['target_id']
+
+            def finish_progress(done, total):
+                disk_progress.advance(disk_id, 'upload', done, total)
+
+            cached_image_id = disk.get('image_id')
+            migration_target.finish_disk(disk, finish_progress)
+            disk_progress.finish(disk_id, 'upload')
+            vm_workspace.remove(disk['dest_path'], disk['size'])
+
+            cache_key = disk.get('cache_key')
+            if cache_key is None:
+                return
+            if cached_image_id and disk.get('image_id') == cached_image_id:
+                self.image_cache.image_reused(cache_key)
+                disk_progress.set(disk_id, image_reused=True)
+            else:
+                self.image_cache.set_image(cache_key, disk.get('image_id'))
+
+        def stage_changed(stage):
+            if streaming and stage == 'convert':
+                stage = 'stream'
+            if stage == 'upload':
+                event = migration_target.finish_event
+            else:
+                event = MIGRATION_EVENT[stage]
+            self._migration_status_update(context, migration_id, event,
+                                          MIGRATION_STATUS['inprogress'])
+
+        def disk_fetched(disk):
+            self._record_fetched_disk(disk_progress, disk)
+            disk_pipeline.disk_fetched(disk)
+
+        disk_pipeline = pipeline.DiskPipeline(convert_disk,
+                                              finish_disk,
+                                              self._convert_semaphore,
+                                              self._upload_semaphore,
+                                              stage_changed)
+        try:
+            if warm:
+                disks = self._warm_copy_disks(context, migration_id, driver,
+                                              source_vm_id,
+                                              vm_conversion_dir,
+                                              disk_progress)
+                for disk in disks:
+                    disk_fetched(disk)
+            elif streaming:
+                disks = driver.stream_vm_disks(context, source_vm_id,
+                                               vm_conversion_dir,
+                                               disk_pipeline.convert_disk)
+            else:
+                disk_pipeline.start()
+                disks = driver.download_vm_disks(context, source_vm_id,
+                                                 vm_conversion_dir,
+                                                 disk_fetched,
+                                                 transfer_progress)
+            disk_pipeline.wait()
+        except Exception:
+            disk_pipeline.abort()
+            raise
+        finally:
+            disk_progress.flush()
+        return disks
 
     def _migration_status_update(self, context, id, event=None, status=None):
+        """Queue a status or event change of a migration.
+
+        Changes are written in batches by the status writer, except for
+        terminal states which are written before returning, and are
+        published to the clients watching the migration events.
+        """
         data = {}
         if event:
             data['migration_event'] = event
         if status:
             data['migration_status'] = status
         if data:
-            db.migration_update(context, id, data)
+            terminal = status in (MIGRATION_STATUS['complete'],
+                                  MIGRATION_STATUS['error'])
+            self.status_writer.update(id, data, flush=terminal)
+            self.event_publisher.publish(context, id, data)
 
-    def _upload_to_glance(self, context, migration_id, vm_id, disks):
-        self._migration_status_update(context, migration_id,
-                                      MIGRATION_EVENT['upload'])
-        gc = glance.GlanceAPI(context)
-
-        for disk in disks:
-            name = "%s-%s" % (vm_id, disk['target_id'].split('.')[0])
-            image_meta = {'name': name,
-                          'disk_format': 'qcow2',
-                          'container_format': 'bare'}
-            image = gc.create(image_meta, disk['dest_path'])
-            disk['image_id'] = image.id
-
-    def _boot_vm(self, context, migration_id, disks, vm_name, flavor):
+    def _boot_vm(self, context, migration_id, migration_target, disks,
+                 flavor):
         self._migration_status_update(context, migration_id,
                                       MIGRATION_EVENT['boot'])
-        nc = nova.NovaAPI(context)
-
-        server_id = nc.create(context, disks, vm_name, flavor)
-        return server_id
-
-    def _flavor_create(self, context, name, memory, cpus, root_gb):
-        nc = nova.NovaAPI(context)
-        flavor = nc.flavor_create(context, name, memory, cpus, root_gb)
-        return flavor
+        return migration_target.boot(disks, flavor)
 
     @wrap_exception()
     def validate_for_migration(self, context, migration_ref):
@@ -198,60 +601,88 @@ class MigrationManager(manager.Manager):
         instance_id = migration_ref.get('source_instance_id')
         vm = db.vm_get(context, instance_id)
         source = db.source_get(context, vm.get('source_id'))
-        driver = self._get_driver_from_source(context, source)
-        continue_migration, error_cls = driver.validate_for_migration(
-            vm.get('uuid_at_source')
-        )
+        with self._get_driver_from_source(context, source) as driver:
+            continue_migration, error_cls = driver.validate_for_migration(
+                vm.get('uuid_at_source'),
+                warm=bool(migration_ref.get('warm'))
+            )
         if (not continue_migration and
                 issubclass(error_cls, exception.MigrationValidationFailed)):
             raise error_cls(instance_id=instance_id)
 
-    @locked_migration_operation
     def create_migration(self, context, migration_ref):
+        """Queues the migration process of a VM."""
+        migration_id = migration_ref.get('id')
+        try:
+            vm = db.vm_get(context, migration_ref.get('source_instance_id'))
+            # Written right away, with the host that owns the queue, so
+            # the migration is queued again if this service restarts.
+            data = {'host': self.host,
+                    'migration_status': MIGRATION_STATUS['queued']}
+            db.migration_update(context, migration_id, data)
+            self.event_publisher.publish(context, migration_id,
+                                         {'migration_status':
+                                          MIGRATION_STATUS['queued']})
+            self.scheduler.submit(migration_id, vm.get('source_id'),
+                                  _estimate_staged_bytes(vm),
+                                  self._create_migration,
+                                  context, migration_ref)
+        except Exception:
+            self._migration_status_update(context, migration_id,
+                                          None, MIGRATION_STATUS['error'])
+            raise
+
+    @locked_migration_operation
+    def _create_migration(self, context, migration_ref):
         """Creates the migration process of a VM."""
+        migration_id = migration_ref.get('id')
+        migration_target = None
+        vm_workspace = None
         try:
             vm_id = migration_ref.get('source_instance_id')
             vm = db.vm_get(context, vm_id)
             source = db.source_get(context, vm.get('source_id'))
 
-            migration_id = migration_ref.get('id')
             self._migration_status_update(context, migration_id,
                                           MIGRATION_EVENT['connect'],
                                           MIGRATION_STATUS['init'])
 
-            driver = self._get_driver_from_source(context, source)
-
             source_vm_id = vm.get('uuid_at_source')
-
-            vm_conversion_dir = os.path.join(CONF.conversion_dir, vm_id)
-            utils.execute('mkdir', '-p', vm_conversion_dir,
-                          run_as_root = False)
-
-            self._migration_status_update(context, migration_id,
-                                          MIGRATION_EVENT['fetch'],
-                                          MIGRATION_STATUS['inprogress'])
-            disks = driver.download_vm_disks(context, source_vm_id,
-                                             vm_conversion_dir)
-
-            self._convert_disks(context, migration_id, disks)
+            warm = bool(migration_ref.get('warm'))
 
             image_name_prefix = vm.get('name')
 
             if not image_name_prefix:
                 image_name_prefix = vm_id
 
-            self._upload_to_glance(context, migration_id,
-                                   image_name_prefix, disks)
+            profile = conversion.get_profile(
+                migration_ref.get('conversion_profile'),
+                target.get_output_format())
+            migration_target = target.get_migration_target(
+                context, image_name_prefix)
+
+            with self._get_driver_from_source(context, source) as driver:
+                capacities = driver.get_vm_disk_capacities(context,
+                                                           source_vm_id)
+            # The driver goes back to the pool while waiting for space.
+            vm_workspace = self._reserve_workspace(vm, capacities,
+                                                   migration_target, warm)
+
+            with self._get_driver_from_source(context, source) as driver:
+                disks = self._process_disks(
+                    context, migration_id, driver, source_vm_id,
+                    vm_workspace, migration_target, profile, warm=warm)
 
             name = vm.get('id')
             memory = int(vm.get('memory'))
             cpus = int(vm.get('vcpus'))
             root_gb = int(disks[0].get('size'))/1024/1024/1024
 
-            flavor = self._flavor_create(context, name, memory, cpus, root_gb)
+            flavor = migration_target.create_flavor(name, memory, cpus,
+                                                    root_gb)
 
-            dest_id = self._boot_vm(context, migration_id,
-                                    disks, image_name_prefix, flavor)
+            dest_id = self._boot_vm(context, migration_id, migration_target,
+                                    disks, flavor)
 
             self._migration_status_update(context, migration_id,
                                           MIGRATION_EVENT['done'],
@@ -259,7 +690,12 @@ class MigrationManager(manager.Manager):
 
             db.vm_update(context, vm_id, {'migrated': True,
                                           'dest_id': dest_id})
+            vm_workspace.close(remove=True)
         except Exception:
+            if vm_workspace is not None:
+                vm_workspace.close()
+            if migration_target is not None:
+                migration_target.abort()
             self._migration_status_update(context, migration_id,
                                           None, MIGRATION_STATUS['error'])
             raise
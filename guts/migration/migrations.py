@@ -41,13 +41,16 @@ def check_policy(ctxt, action, target_obj=None):
     policy.enforce(ctxt, _action, target)
 
 
-def get_all_migrations(ctxt, inactive=0):
+def get_all_migrations(ctxt, inactive=0, filters=None, marker=None,
+                       limit=None, sort_keys=None, sort_dirs=None):
     """Get all non-deleted source hypervisors.
 
     Pass true as argument if you want deleted sources returned also.
     """
     check_policy(ctxt, 'get_all_migrations')
-    return db.migration_get_all(ctxt, inactive)
+    return db.migration_get_all(ctxt, inactive, filters=filters,
+                                marker=marker, limit=limit,
+                                sort_keys=sort_keys, sort_dirs=sort_dirs)
 
 
 def get_migration(ctxt, id):
@@ -67,7 +70,8 @@ def update_migration(ctxt, id, values):
     db.migration_update(ctxt, id, values)
 
 
-def create(ctxt, name, source_instance_id, description=None):
+def create(ctxt, name, source_instance_id, description=None,
+           conversion_profile=None, warm=False):
     """Creates migration.
 
     Raises:
@@ -80,7 +84,9 @@ def create(ctxt, name, source_instance_id, description=None):
             ctxt,
             dict(name=name,
                  source_instance_id=source_instance_id,
-                 description=description))
+                 description=description,
+                 conversion_profile=conversion_profile,
+                 warm=warm))
     except db_exc.DBError:
         LOG.exception(_LE('DB error:'))
         raise exception.MigrationCreateFailed(name=name)
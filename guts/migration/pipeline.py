@@ -0,0 +1,126 @@
+# Copyright (c) 2015 Aptira Pty Ltd.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Per disk migration pipeline.
+
+Disks of a VM move through the fetch, convert and upload stages
+independently, so one disk can be converted while the next one is still
+being fetched and the previous one is being uploaded.
+"""
+
+import sys
+import threading
+
+import eventlet
+import six
+
+
+STAGES = ('fetch', 'convert', 'upload')
+
+
+class DiskPipeline(object):
+    """Runs the convert and upload stages of every disk of a migration.
+
+    The fetch stage is driven by the migration driver, which hands each disk
+    over through disk_fetched() (staged transfers) or convert_disk()
+    (streamed transfers). Convert and upload are bounded by the given
+    semaphores, which are shared by all migrations of the service.
+    """
+
+    def __init__(self, convert_disk, upload_disk, convert_semaphore,
+                 upload_semaphore, stage_changed=None):
+        self._convert_disk = convert_disk
+        self._upload_disk = upload_disk
+        self._convert_semaphore = convert_semaphore
+        self._upload_semaphore = upload_semaphore
+        self._stage_changed = stage_changed
+        self._lock = threading.Lock()
+        self._stage = None
+        self._pool = eventlet.GreenPool()
+        self._threads = []
+        self._exc_info = None
+
+    def _enter_stage(self, stage):
+        """Report stage if no disk has reached it, or a later one, yet."""
+        with self._lock:
+            if (self._stage is not None and
+                    STAGES.index(stage) <= STAGES.index(self._stage)):
+                return
+            self._stage = stage
+        if self._stage_changed:
+            self._stage_changed(stage)
+
+    def _check_failed(self):
+        if self._exc_info:
+            six.reraise(*self._exc_info)
+
+    def _run(self, func, *args):
+        try:
+            func(*args)
+        except Exception:
+            if not self._exc_info:
+                self._exc_info = sys.exc_info()
+            raise
+
+    def _spawn(self, func, *args):
+        self._check_failed()
+        self._threads.append(self._pool.spawn(self._run, func, *args))
+
+    def _convert(self, disk):
+        with self._convert_semaphore:
+            self._enter_stage('convert')
+            self._convert_disk(disk)
+
+    def _upload(self, disk):
+        with self._upload_semaphore:
+            self._enter_stage('upload')
+            self._upload_disk(disk)
+
+    def _convert_and_upload(self, disk):
+        self._convert(disk)
+        self._upload(disk)
+
+    def start(self):
+        self._enter_stage('fetch')
+
+    def disk_fetched(self, disk):
+        """Queue a staged disk for conversion and upload.
+
+        Raises the error of an earlier disk, if any, so the driver stops
+        fetching the remaining disks.
+        """
+        self._spawn(self._convert_and_upload, disk)
+
+    def convert_disk(self, disk):
+        """Convert a streamed disk in place and queue it for upload."""
+        self._check_failed()
+        self._run(self._convert, disk)
+        self._spawn(self._upload, disk)
+
+    def abort(self):
+        """Stop all queued disks."""
+        for thread in self._threads:
+            thread.kill()
+
+    def wait(self):
+        """Wait for all queued disks, re-raising the first failure."""
+        try:
+            for thread in self._threads:
+                thread.wait()
+        except Exception:
+            self.abort()
+            self._check_failed()
+            raise
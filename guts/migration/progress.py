@@ -0,0 +1,125 @@
+# Copyright (c) 2015 Aptira Pty Ltd.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Byte level progress of the disks of a migration."""
+
+import time
+
+
+# Byte counter of each stage of a disk.
+COUNTERS = {'transfer': 'transferred_bytes',
+            'convert': 'converted_bytes',
+            'upload': 'uploaded_bytes'}
+
+
+class MigrationProgress(object):
+    """Tracks the bytes each disk of a migration went through, per stage.
+
+    Every disk records the bytes done and, when known, the total of each
+    stage it went through, along with the throughput and the ETA of the
+    stage it is in. The details are handed to save() at most once every
+    interval seconds, however often the counters move.
+    """
+
+    def __init__(self, save, interval, details=None):
+        self._save = save
+        self._interval = interval
+        self._last_save = 0
+        self._dirty = False
+        self.details = details if details is not None else {}
+        # Per disk (stage, start time, bytes done at start) of the running
+        # stage, used for the throughput.
+        self._stages = {}
+
+    def _disk(self, disk_id):
+        return self.details.setdefault(disk_id, {})
+
+    def set(self, disk_id, **values):
+        """Record other details of a disk."""
+        self._disk(disk_id).update(values)
+        self._changed()
+
+    def advance(self, disk_id, stage, done, total=None):
+        """Record the bytes of a disk done so far in a stage.
+
+        The first call for a stage starts it. total is the number of bytes
+        of the stage, when known.
+        """
+        record = self._disk(disk_id)
+        running = self._stages.get(disk_id)
+        if running is None or running[0] != stage:
+            running = self._stages[disk_id] = (stage, time.time(), done)
+            record['stage'] = stage
+            record['%s_total_bytes' % stage] = None
+        __, started_at, start_done = running
+
+        record[COUNTERS[stage]] = done
+        if total is not None:
+            record['%s_total_bytes' % stage] = total
+        total = record['%s_total_bytes' % stage]
+
+        elapsed = time.time() - started_at
+        throughput = (done - start_done) / elapsed if elapsed > 0 else 0
+        record['throughput'] = int(throughput)
+        if total is not None and throughput > 0:
+            record['eta'] = int(max(total - done, 0) / throughput)
+        else:
+            record['eta'] = None
+        self._changed()
+
+    def finish(self, disk_id, stage):
+        """Mark the end of a stage of a disk."""
+        self._stages.pop(disk_id, None)
+        record = self._disk(disk_id)
+        total = record.get('%s_total_bytes' % stage)
+        if total is not None:
+            record[COUNTERS[stage]] = total
+        record['throughput'] = 0
+        record['eta'] = 0
+        self._changed()
+
+    def _changed(self):
+        self._dirty = True
+        if time.time() - self._last_save >= self._interval:
+            self.flush()
+
+    def flush(self):
+        """Save the details now if they changed since the last save."""
+        if not self._dirty:
+            return
+        self._dirty = False
+        self._last_save = time.time()
+        self._save(self.details)
+
+
+def summarize(details):
+    """Aggregate the disk details of a migration into migration totals.
+
+    Byte counts and throughputs are summed over the disks, the ETA is the
+    one of the disk expected to finish its running stage last.
+    """
+    summary = dict((counter, 0) for counter in COUNTERS.values())
+    summary['throughput'] = 0
+    summary['eta'] = 0
+    for record in details.values():
+        for counter in COUNTERS.values():
+            summary[counter] += record.get(counter) or 0
+        summary['throughput'] += record.get('throughput') or 0
+        eta = record.get('eta', 0)
+        if eta is None or summary['eta'] is None:
+            summary['eta'] = None
+        else:
+            summary['eta'] = max(summary['eta'], eta)
+    return summary
@@ -0,0 +1,113 @@
+# Copyright (c) 2015 Aptira Pty Ltd.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Admission control for migrations run by a migration service.
+
+Migrations are queued in arrival order and started once they fit within
+the per host and per source limits. A queued migration waiting on a busy
+source does not hold back migrations of other sources.
+"""
+
+import collections
+import threading
+
+import eventlet
+from oslo_log import log as logging
+
+from guts.i18n import _LE
+
+
+LOG = logging.getLogger(__name__)
+
+
+class _Job(object):
+    def __init__(self, job_id, source_id, staged_bytes, func, args):
+        self.id = job_id
+        self.source_id = source_id
+        self.staged_bytes = staged_bytes
+        self.func = func
+        self.args = args
+
+
+class MigrationScheduler(object):
+    """Queues migrations and admits them within the configured limits.
+
+    :param max_migrations: migrations running at once on this host.
+    :param max_per_source: migrations running at once against one source.
+    :param max_staged_bytes: estimated bytes staged at once on this host,
+                             0 disables the limit.
+    """
+
+    def __init__(self, max_migrations, max_per_source, max_staged_bytes=0):
+        self.max_migrations = max_migrations
+        self.max_per_source = max_per_source
+        self.max_staged_bytes = max_staged_bytes
+        self._lock = threading.Lock()
+        self._queue = collections.deque()
+        self._running = {}
+        self._running_per_source = collections.Counter()
+        self._staged_bytes = 0
+        self._pool = eventlet.GreenPool()
+
+    def _can_admit(self, job):
+        if len(self._running) >= self.max_migrations:
+            return False
+        if self._running_per_source[job.source_id] >= self.max_per_source:
+            return False
+        # A migration larger than the whole budget still runs on its own.
+        if (self.max_staged_bytes and self._staged_bytes and
+                self._staged_bytes + job.staged_bytes >
+                self.max_staged_bytes):
+            return False
+        return True
+
+    def _dispatch(self):
+        admitted = []
+        with self._lock:
+            for job in list(self._queue):
+                if self._can_admit(job):
+                    self._queue.remove(job)
+                    self._running[job.id] = job
+                    self._running_per_source[job.source_id] += 1
+                    self._staged_bytes += job.staged_bytes
+                    admitted.append(job)
+        for job in admitted:
+            self._pool.spawn_n(self._run, job)
+
+    def _run(self, job):
+        try:
+            job.func(*job.args)
+        except Exception:
+            LOG.exception(_LE("Migration %s failed."), job.id)
+        finally:
+            with self._lock:
+                del self._running[job.id]
+                self._running_per_source[job.source_id] -= 1
+                self._staged_bytes -= job.staged_bytes
+            self._dispatch()
+
+    def submit(self, job_id, source_id, staged_bytes, func, *args):
+        """Queue func(*args) and start it as soon as the limits allow."""
+        with self._lock:
+            self._queue.append(_Job(job_id, source_id, staged_bytes,
+                                    func, args))
+        self._dispatch()
+
+    def stats(self):
+        with self._lock:
+            return {'queued': len(self._queue),
+                    'running': len(self._running),
+                    'staged_bytes': self._staged_bytes}
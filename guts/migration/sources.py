@@ -39,13 +39,16 @@ def check_policy(context, action, target_obj=None):
     policy.enforce(context, _action, target)
 
 
-def get_all_sources(context, inactive=0):
+def get_all_sources(context, inactive=0, filters=None, marker=None,
+                    limit=None, sort_keys=None, sort_dirs=None):
     """Get all non-deleted source hypervisors.
 
     Pass true as argument if you want deleted sources returned also.
     """
     check_policy(context, 'get_all_sources')
-    return db.source_get_all(context, inactive)
+    return db.source_get_all(context, inactive, filters=filters,
+                             marker=marker, limit=limit, sort_keys=sort_keys,
+                             sort_dirs=sort_dirs)
 
 
 def get_source(context, id):
@@ -57,6 +60,12 @@ def get_source(context, id):
     return db.source_get(context, id)
 
 
+def get_sources_by_ids(context, ids):
+    """Retrieves the sources with the given IDs in a single query."""
+    check_policy(context, 'get_all_sources')
+    return db.source_get_all(context, filters={'id': list(ids)})
+
+
 def create(ctxt, name, stype, connection_params, description=None):
     """Creates source."""
     try:
@@ -100,6 +109,5 @@ def get_source_by_name(context, name):
 
 
 def source_delete(context, id):
-    """Deletes specified source."""
-    db.delete_vms_by_source_id(context, id)
+    """Deletes specified source along with its VMs and their migrations."""
     return db.source_delete(context, id)
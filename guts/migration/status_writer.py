@@ -0,0 +1,93 @@
+# Copyright (c) 2015 Aptira Pty Ltd.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Background writer of migration status changes.
+"""
+
+import threading
+
+import eventlet
+from oslo_log import log as logging
+
+from guts import context as guts_context
+from guts import db
+from guts.i18n import _LE
+
+
+LOG = logging.getLogger(__name__)
+
+
+class StatusWriter(object):
+    """Coalesces migration updates and writes them in batches.
+
+    Updates are merged per migration, later values replacing earlier ones,
+    and written every interval seconds in a single transaction. flush()
+    writes everything queued right away, callers use it for changes that
+    must not wait, such as terminal states. Flushes run one at a time, so
+    a value never overwrites a later value of the same field.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = {}
+        self._thread = None
+
+    def update(self, migration_id, values, flush=False):
+        """Queue values to be set on a migration."""
+        with self._lock:
+            self._pending.setdefault(migration_id, {}).update(values)
+        if flush:
+            self.flush()
+
+    def flush(self):
+        """Write the queued updates now."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return
+            try:
+                db.migration_update_many(guts_context.get_admin_context(),
+                                         pending)
+            except Exception:
+                # Queue them again, under anything that came in meanwhile.
+                with self._lock:
+                    for migration_id, values in pending.items():
+                        values.update(self._pending.get(migration_id, {}))
+                        self._pending[migration_id] = values
+                raise
+
+    def _run(self):
+        while True:
+            eventlet.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception:
+                LOG.exception(_LE("Failed to write migration status "
+                                  "updates, retrying later."))
+
+    def start(self):
+        if self._thread is None:
+            self._thread = eventlet.spawn(self._run)
+
+    def stop(self):
+        """Stop the background writes and write what is still queued."""
+        if self._thread is not None:
+            self._thread.kill()
+            self._thread = None
+        self.flush()
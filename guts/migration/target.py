@@ -0,0 +1,115 @@
+# Copyright (c) 2015 Aptira Pty Ltd.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Targets the converted disks of a migration are written to.
+
+A target prepares where each disk is converted to, finishes each converted
+disk, and boots the migrated instance from them. The target of the
+migration service is picked with the migration_target option, naming a
+module of guts.migration.targets or any module with a
+get_migration_target(context, name) factory. Target modules set
+OUTPUT_FORMAT to the format disks are converted to, when it is always the
+same.
+"""
+
+from oslo_config import cfg
+from oslo_utils import importutils
+
+from guts.i18n import _
+
+
+migration_target_opts = [
+    cfg.StrOpt('migration_target',
+               default='guts.migration.targets.glance',
+               help='Module of the target converted disks are written to. '
+                    '"guts.migration.targets.glance" uploads them to Glance '
+                    'and boots from the images, '
+                    '"guts.migration.targets.volume" converts them straight '
+                    'into Cinder volumes and boots from the root volume, '
+                    '"guts.migration.targets.local" writes them to local '
+                    'files.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(migration_target_opts)
+
+
+class MigrationTarget(object):
+    """Base class for migration targets.
+
+    A target is created for each migration; name is the name of the
+    migrated instance.
+    """
+
+    # Migration event of the stage finishing the converted disks.
+    finish_event = 'Finishing VM Disk(s)'
+    # Whether the conversion writes to the target as root.
+    convert_as_root = False
+    # Whether converted disks are files staged in the migration workspace.
+    converts_in_workspace = False
+    # Whether converted disks are files which can be kept in the cache of
+    # converted disks, and finish_disk() reuses a disk's cached 'image_id'.
+    cacheable = False
+
+    def __init__(self, context, name):
+        self.context = context
+        self.name = name
+
+    def prepare_disk(self, disk, size):
+        """Prepare the destination of a disk of size bytes.
+
+        Sets the 'dest_path' qemu-img converts the disk to on disk and
+        returns the output format and the extra qemu-img convert arguments.
+        """
+        msg = _("Preparing a disk is not implemented by the target.")
+        raise NotImplementedError(msg)
+
+    def finish_disk(self, disk, progress=None):
+        """Finish a converted disk.
+
+        Targets moving the data again call progress(done, total), when
+        given, with the bytes moved so far and the total.
+        """
+        pass
+
+    def create_flavor(self, name, memory, cpus, root_gb):
+        """Create the flavor of the migrated instance."""
+        msg = _("Creating a flavor is not implemented by the target.")
+        raise NotImplementedError(msg)
+
+    def boot(self, disks, flavor):
+        """Boot the migrated instance from disks, returns its id."""
+        msg = _("Booting an instance is not implemented by the target.")
+        raise NotImplementedError(msg)
+
+    def abort(self):
+        """Release what was prepared for a migration which failed."""
+        pass
+
+
+def get_migration_target(context, name):
+    """Return the configured target for migrating an instance."""
+    module = importutils.import_module(CONF.migration_target)
+    return module.get_migration_target(context, name)
+
+
+def get_output_format():
+    """Return the format the configured target converts disks to, or None.
+
+    None when the target module does not tell.
+    """
+    module = importutils.import_module(CONF.migration_target)
+    return getattr(module, 'OUTPUT_FORMAT', None)
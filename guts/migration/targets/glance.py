@@ -0,0 +1,76 @@
+# Copyright (c) 2015 Aptira Pty Ltd.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Uploads converted disks to Glance and boots from the images."""
+
+import os
+
+from guts.compute import nova
+from guts.image import glance
+from guts.migration import target
+
+
+OUTPUT_FORMAT = 'qcow2'
+
+
+class GlanceTarget(target.MigrationTarget):
+    """Boots from an image of the root disk, with volumes of the others.
+
+    The volumes of the data disks are created by Cinder from their images.
+    """
+
+    finish_event = 'Uploading to Glance'
+    converts_in_workspace = True
+    cacheable = True
+
+    def __init__(self, context, name):
+        super(GlanceTarget, self).__init__(context, name)
+        self._glance = glance.GlanceAPI(context)
+
+    def prepare_disk(self, disk, size):
+        disk['dest_path'] = os.path.splitext(disk['path'])[0] + '.qcow2'
+        return OUTPUT_FORMAT, ()
+
+    def finish_disk(self, disk, progress=None):
+        if disk.get('image_id') and self._glance.is_active(disk['image_id']):
+            # Identical disk already uploaded, see image_cache.
+            return
+        name = "%s-%s" % (self.name, disk['target_id'].split('.')[0])
+        image_meta = {'name': name,
+                      'disk_format': OUTPUT_FORMAT,
+                      'container_format': 'bare'}
+        total = os.path.getsize(disk['dest_path'])
+        uploaded = [0]
+
+        def upload_progress(size):
+            uploaded[0] += size
+            if progress:
+                progress(uploaded[0], total)
+
+        image = self._glance.create(image_meta, disk['dest_path'],
+                                    upload_progress)
+        disk['image_id'] = image.id
+
+    def create_flavor(self, name, memory, cpus, root_gb):
+        nc = nova.NovaAPI(self.context)
+        return nc.flavor_create(self.context, name, memory, cpus, root_gb)
+
+    def boot(self, disks, flavor):
+        nc = nova.NovaAPI(self.context)
+        return nc.create(self.context, disks, self.name, flavor)
+
+
+def get_migration_target(context, name):
+    return GlanceTarget(context, name)
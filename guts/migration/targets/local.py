@@ -0,0 +1,96 @@
+# Copyright (c) 2015 Aptira Pty Ltd.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Writes converted disks to local files, standing in for volumes.
+
+Each disk is converted into a raw file created beforehand with the size of
+the disk, the way the volume target converts into pre-created volumes.
+Booting only records the instance, so migrations can be run end to end
+without a cloud.
+"""
+
+import os
+import uuid
+
+from oslo_config import cfg
+from oslo_serialization import jsonutils
+
+from guts.migration import target
+
+
+local_target_opts = [
+    cfg.StrOpt('local_target_dir',
+               default='$state_path/targets',
+               help='Directory the local migration target writes the '
+                    'converted disks and the booted instances to.'),
+]
+
+# Disks are converted into the existing files, with qemu-img -n.
+OUTPUT_FORMAT = 'raw'
+
+CONF = cfg.CONF
+CONF.register_opts(local_target_opts)
+
+
+class LocalTarget(target.MigrationTarget):
+    """Converts disks into pre-allocated local files."""
+
+    finish_event = 'Syncing VM Disk(s)'
+
+    def __init__(self, context, name):
+        super(LocalTarget, self).__init__(context, name)
+        self._dir = os.path.join(CONF.local_target_dir, name)
+        self._paths = []
+
+    def prepare_disk(self, disk, size):
+        if not os.path.isdir(self._dir):
+            os.makedirs(self._dir)
+        path = os.path.join(self._dir,
+                            '%s.raw' % disk['target_id'].split('.')[0])
+        with open(path, 'wb') as volume:
+            volume.truncate(size or 0)
+        self._paths.append(path)
+        disk['dest_path'] = path
+        # Convert into the existing file, as into a volume.
+        return OUTPUT_FORMAT, ('-n',)
+
+    def finish_disk(self, disk, progress=None):
+        with open(disk['dest_path'], 'rb+') as volume:
+            os.fsync(volume.fileno())
+
+    def create_flavor(self, name, memory, cpus, root_gb):
+        return {'name': name, 'memory': memory, 'cpus': cpus,
+                'root_gb': root_gb}
+
+    def boot(self, disks, flavor):
+        instance_id = str(uuid.uuid4())
+        instance = {'id': instance_id,
+                    'name': self.name,
+                    'flavor': flavor,
+                    'disks': [disk['dest_path'] for disk in disks]}
+        path = os.path.join(self._dir, 'instance-%s.json' % instance_id)
+        with open(path, 'w') as instance_file:
+            instance_file.write(jsonutils.dumps(instance))
+        return instance_id
+
+    def abort(self):
+        for path in self._paths:
+            if os.path.exists(path):
+                os.unlink(path)
+        self._paths = []
+
+
+def get_migration_target(context, name):
+    return LocalTarget(context, name)
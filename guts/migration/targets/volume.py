@@ -0,0 +1,129 @@
+# Copyright (c) 2015 Aptira Pty Ltd.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Converts disks straight into Cinder volumes and boots from them.
+
+The volumes are attached to the server running the migration service,
+given by conversion_host_id, while the disks are converted into them. No
+image is uploaded to Glance.
+"""
+
+import os
+import time
+
+from oslo_config import cfg
+from oslo_log import log as logging
+
+from guts.compute import nova
+from guts import exception
+from guts.i18n import _, _LW
+from guts.migration import target
+
+
+volume_target_opts = [
+    cfg.StrOpt('conversion_host_id',
+               help='Nova server id of the host running this migration '
+                    'service, which the volumes of the volume migration '
+                    'target are attached to for conversion.'),
+    cfg.IntOpt('volume_device_timeout',
+               default=60,
+               min=0,
+               help='Seconds to wait for the device of a volume attached '
+                    'to the conversion host to show up.'),
+]
+
+# Disks are converted into the existing volumes, with qemu-img -n.
+OUTPUT_FORMAT = 'raw'
+
+CONF = cfg.CONF
+CONF.register_opts(volume_target_opts)
+
+LOG = logging.getLogger(__name__)
+
+DEVICE_BY_ID = '/dev/disk/by-id/virtio-%s'
+
+
+class VolumeTarget(target.MigrationTarget):
+    """Converts each disk into a volume created for it."""
+
+    finish_event = 'Detaching Volume(s)'
+    convert_as_root = True
+
+    def __init__(self, context, name):
+        super(VolumeTarget, self).__init__(context, name)
+        if not CONF.conversion_host_id:
+            msg = _("conversion_host_id must be set to migrate to volumes")
+            raise exception.InvalidInput(reason=msg)
+        self._nova = nova.NovaAPI(context)
+        self._volumes = []
+        self._attached = []
+
+    def _find_device(self, volume_id, device):
+        # Virtio disks show up by the first 20 characters of the volume id,
+        # the device reported by Nova may not be the one the guest uses.
+        path = DEVICE_BY_ID % volume_id[:20]
+        deadline = time.time() + CONF.volume_device_timeout
+        while not os.path.exists(path):
+            if time.time() > deadline:
+                LOG.warning(_LW("Device of volume %(volume)s not found, "
+                                "using %(device)s."),
+                            {'volume': volume_id, 'device': device})
+                return device
+            time.sleep(1)
+        return path
+
+    def prepare_disk(self, disk, size):
+        name = "%s-%s" % (self.name, disk['target_id'].split('.')[0])
+        volume_id = self._nova.create_volume(size, name)
+        self._volumes.append(volume_id)
+        device = self._nova.attach_volume(CONF.conversion_host_id, volume_id)
+        self._attached.append(volume_id)
+        disk['volume_id'] = volume_id
+        disk['dest_path'] = self._find_device(volume_id, device)
+        # Convert into the existing volume rather than creating an image.
+        return OUTPUT_FORMAT, ('-n',)
+
+    def finish_disk(self, disk, progress=None):
+        volume_id = disk['volume_id']
+        self._nova.detach_volume(CONF.conversion_host_id, volume_id)
+        self._attached.remove(volume_id)
+
+    def create_flavor(self, name, memory, cpus, root_gb):
+        return self._nova.flavor_create(self.context, name, memory, cpus,
+                                        root_gb)
+
+    def boot(self, disks, flavor):
+        server_id = self._nova.create_from_volumes(self.context, disks,
+                                                   self.name, flavor)
+        # The volumes belong to the migrated instance from now on.
+        self._volumes = []
+        return server_id
+
+    def abort(self):
+        for volume_id in self._volumes:
+            try:
+                if volume_id in self._attached:
+                    self._nova.detach_volume(CONF.conversion_host_id,
+                                             volume_id)
+                self._nova.delete_volume(volume_id)
+            except Exception:
+                LOG.warning(_LW("Failed to delete volume %s of a failed "
+                                "migration."), volume_id, exc_info=True)
+        self._volumes = []
+        self._attached = []
+
+
+def get_migration_target(context, name):
+    return VolumeTarget(context, name)
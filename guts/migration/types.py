@@ -55,6 +55,14 @@ def get_source_type(context, id):
     return db.source_type_get(context, id)
 
 
+def get_source_types_by_ids(context, ids):
+    """Retrieves the source types with the given IDs in a single query."""
+    check_policy(context, 'get_source_type')
+    source_types = db.source_type_get_all(context,
+                                          filters={'id': list(set(ids))})
+    return list(source_types.values())
+
+
 def create(ctxt, name, driver, description=None):
     """Creates source types."""
     try:
@@ -39,13 +39,15 @@ def check_policy(context, action, target_obj=None):
     policy.enforce(context, _action, target)
 
 
-def get_all_vms(context, inactive=0):
+def get_all_vms(context, inactive=0, filters=None, marker=None, limit=None,
+                sort_keys=None, sort_dirs=None):
     """Get all non-deleted source vms.
 
     Pass true as argument if you want deleted sources returned also.
     """
     check_policy(context, 'get_all_vms')
-    return db.vm_get_all(context, inactive)
+    return db.vm_get_all(context, inactive, filters=filters, marker=marker,
+                         limit=limit, sort_keys=sort_keys, sort_dirs=sort_dirs)
 
 
 def get_vm(context, id):
@@ -0,0 +1,271 @@
+# Copyright (c) 2015 Aptira Pty Ltd.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Staging space of the migrations run by a migration service.
+
+Each migration stages its disks in a workspace directory of its VM, placed
+in the conversion directory with the most free space. The space the
+migration is expected to stage is reserved before it starts, and released
+as its staged disks are removed.
+
+Drivers that can resume a download keep a manifest next to the partial
+disk, named after it with MANIFEST_SUFFIX. Those are the only files kept
+when a migration fails, the rest of its workspace is deleted.
+"""
+
+import errno
+import os
+import shutil
+import threading
+import time
+
+from oslo_config import cfg
+from oslo_log import log as logging
+from oslo_utils import units
+
+from guts import exception
+from guts.i18n import _LI, _LW
+
+
+workspace_opts = [
+    cfg.ListOpt('conversion_dirs',
+                default=[],
+                help='Directories disks are staged and converted in, each '
+                     'migration using the one with the most free space. '
+                     'Defaults to conversion_dir.'),
+    cfg.IntOpt('conversion_dir_min_free_mb',
+               default=1024,
+               min=0,
+               help='Space, in MB, kept free in every conversion directory '
+                    'by the migrations staging disks in it.'),
+    cfg.IntOpt('workspace_reserve_timeout',
+               default=3600,
+               min=0,
+               help='Seconds a migration waits for enough space to stage '
+                    'its disks before failing.'),
+    cfg.IntOpt('workspace_orphan_ttl',
+               default=24,
+               min=0,
+               help='Hours after which the leftover workspace of an '
+                    'interrupted migration is deleted at startup, instead '
+                    'of being kept to resume its downloads on retry.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(workspace_opts)
+
+LOG = logging.getLogger(__name__)
+
+# How often a migration waiting for space checks the free space again.
+RESERVE_POLL_INTERVAL = 10
+# Suffix of the manifest recording how far the download of a disk got.
+MANIFEST_SUFFIX = '.manifest'
+
+
+def _disk_usage(path):
+    """Return the bytes allocated to the files under path."""
+    usage = 0
+    for root, __, files in os.walk(path):
+        for name in files:
+            try:
+                usage += os.lstat(os.path.join(root, name)).st_blocks * 512
+            except OSError:
+                pass
+    return usage
+
+
+def _clear_unresumable(path):
+    """Delete the files under path that no download can resume from.
+
+    A partial disk is kept with its manifest, which the driver verifies
+    against the source before resuming. Manifests without their disk are
+    deleted too.
+    """
+    for root, dirs, files in os.walk(path, topdown=False):
+        names = set(files)
+        for name in files:
+            if name.endswith(MANIFEST_SUFFIX):
+                keep = name[:-len(MANIFEST_SUFFIX)] in names
+            else:
+                keep = name + MANIFEST_SUFFIX in names
+            if keep:
+                continue
+            try:
+                os.unlink(os.path.join(root, name))
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+        for name in dirs:
+            try:
+                os.rmdir(os.path.join(root, name))
+            except OSError:
+                pass
+
+
+def _free_bytes(path):
+    stat = os.statvfs(path)
+    return stat.f_bavail * stat.f_frsize
+
+
+class Workspace(object):
+    """Workspace directory of a migration, with its reserved space."""
+
+    def __init__(self, manager, path, reserved):
+        self._manager = manager
+        self.path = path
+        self.reserved = reserved
+
+    def release(self, size):
+        """Release size bytes of the reservation, no longer needed."""
+        self._manager._release(self, size)
+
+    def remove(self, path, size=0):
+        """Remove a staged file and release size bytes of the reservation.
+
+        Files outside the workspace, such as disks converted straight into
+        their target, are left alone.
+        """
+        if os.path.dirname(os.path.abspath(path)) != self.path:
+            return
+        try:
+            os.unlink(path)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+        self.release(size)
+
+    def close(self, remove=False):
+        """Release the reservation, deleting the workspace if remove.
+
+        Otherwise only the partial downloads with a manifest are kept, so
+        they resume where they stopped when the migration is retried.
+        """
+        self._manager._close(self, remove)
+
+
+class WorkspaceManager(object):
+    """Places workspaces in the conversion directories and reserves space.
+
+    A directory can hold a new reservation if its free space, less the part
+    of the other reservations not written yet, leaves min_free bytes.
+    """
+
+    def __init__(self, dirs, min_free):
+        self.dirs = [os.path.abspath(path) for path in dirs]
+        self.min_free = min_free
+        self._lock = threading.Lock()
+        self._workspaces = []
+
+    def _pending(self, base_dir):
+        return sum(max(workspace.reserved - _disk_usage(workspace.path), 0)
+                   for workspace in self._workspaces
+                   if os.path.dirname(workspace.path) == base_dir)
+
+    def _available(self, base_dir):
+        if not os.path.isdir(base_dir):
+            os.makedirs(base_dir)
+        return (_free_bytes(base_dir) - self._pending(base_dir) -
+                self.min_free)
+
+    def _place(self, name, size):
+        # Disks staged by an earlier attempt of the migration are resumed
+        # in place, their size already taken from the free space.
+        for base_dir in self.dirs:
+            path = os.path.join(base_dir, name)
+            if os.path.isdir(path):
+                size -= _disk_usage(path)
+                if self._available(base_dir) >= size:
+                    return path
+                return None
+        available, base_dir = max((self._available(base_dir), base_dir)
+                                  for base_dir in self.dirs)
+        if available >= size:
+            return os.path.join(base_dir, name)
+        return None
+
+    def reserve(self, name, size, timeout=0):
+        """Reserve size bytes for the workspace of name, returns it.
+
+        Waits up to timeout seconds for enough space to be released.
+
+        :raises InsufficientWorkspace: if no directory has enough space
+        """
+        deadline = time.time() + timeout
+        while True:
+            with self._lock:
+                path = self._place(name, size)
+                if path is not None:
+                    if not os.path.isdir(path):
+                        os.makedirs(path)
+                    workspace = Workspace(self, path, size)
+                    self._workspaces.append(workspace)
+                    LOG.info(_LI("Reserved %(size)d bytes in workspace "
+                                 "%(path)s."), {'size': size, 'path': path})
+                    return workspace
+            if time.time() >= deadline:
+                raise exception.InsufficientWorkspace(size=size)
+            time.sleep(min(RESERVE_POLL_INTERVAL,
+                           max(deadline - time.time(), 0)))
+
+    def _release(self, workspace, size):
+        with self._lock:
+            workspace.reserved = max(workspace.reserved - size, 0)
+
+    def _close(self, workspace, remove):
+        with self._lock:
+            if workspace in self._workspaces:
+                self._workspaces.remove(workspace)
+            workspace.reserved = 0
+        if remove:
+            shutil.rmtree(workspace.path, ignore_errors=True)
+        else:
+            _clear_unresumable(workspace.path)
+
+    def reap_orphans(self, is_orphan):
+        """Delete the workspaces left behind by earlier runs.
+
+        Called at startup, before any migration runs. is_orphan(name) tells
+        whether the workspace of name can no longer be resumed. Workspaces
+        unused for workspace_orphan_ttl hours are deleted regardless. Of
+        the others, only the partial downloads with a manifest are kept.
+        Entries starting with '_' or '.', such as the image cache, are
+        skipped.
+        """
+        expired = time.time() - CONF.workspace_orphan_ttl * 3600
+        for base_dir in self.dirs:
+            if not os.path.isdir(base_dir):
+                continue
+            for name in os.listdir(base_dir):
+                path = os.path.join(base_dir, name)
+                if name[0] in '_.' or not os.path.isdir(path):
+                    continue
+                try:
+                    if (os.path.getmtime(path) >= expired and
+                            not is_orphan(name)):
+                        _clear_unresumable(path)
+                        continue
+                except Exception:
+                    LOG.warning(_LW("Failed to check workspace %s, keeping "
+                                    "it."), path, exc_info=True)
+                    continue
+                LOG.info(_LI("Deleting orphaned workspace %s."), path)
+                shutil.rmtree(path, ignore_errors=True)
+
+
+def get_workspace_manager():
+    """Return the workspace manager of the configured directories."""
+    return WorkspaceManager(CONF.conversion_dirs or [CONF.conversion_dir],
+                            CONF.conversion_dir_min_free_mb * units.Mi)
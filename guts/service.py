@@ -33,8 +33,10 @@ from osprofiler import profiler
 import osprofiler.web
 
 from guts import context
+from guts.db import cache as db_cache
 from guts import exception
 from guts.i18n import _, _LE, _LI, _LW
+from guts.migration import events as migration_events
 from guts import objects
 from guts.objects import base as objects_base
 from guts import rpc
@@ -134,6 +136,7 @@ class Service(service.Service):
 
         setup_profiler(binary, host)
         self.rpcserver = None
+        self.cache_server = None
 
     def start(self):
         version_string = version.version_string()
@@ -157,6 +160,11 @@ class Service(service.Service):
         serializer = objects_base.GutsObjectSerializer()
         self.rpcserver = rpc.get_server(target, endpoints, serializer)
         self.rpcserver.start()
+        if CONF.db_cache_ttl:
+            self.cache_server = db_cache.start_listener(self.host)
+        cache_reporter = db_cache.start_reporter()
+        if cache_reporter:
+            self.timers.append(cache_reporter)
 
         self.manager.init_host_with_rpc()
 
@@ -262,6 +270,8 @@ class Service(service.Service):
         # errors, go ahead and ignore them.. as we're shutting down anyway
         try:
             self.rpcserver.stop()
+            if self.cache_server:
+                self.cache_server.stop()
         except Exception:
             pass
         for x in self.timers:
@@ -280,6 +290,8 @@ class Service(service.Service):
                 pass
         if self.rpcserver:
             self.rpcserver.wait()
+        if self.cache_server:
+            self.cache_server.wait()
 
     def periodic_tasks(self, raise_on_error=False):
         """Tasks to be run at a periodic interval."""
@@ -366,6 +378,9 @@ class WSGIService(service.ServiceBase):
                                   self.app,
                                   host=self.host,
                                   port=self.port)
+        self.cache_server = None
+        self.events_server = None
+        self.cache_reporter = None
 
     def _get_manager(self):
         """Initialize a Manager object appropriate for this service.
@@ -399,6 +414,13 @@ class WSGIService(service.ServiceBase):
         """
         if self.manager:
             self.manager.init_host()
+        # Started here rather than in __init__ so that every forked worker
+        # listens on its own.
+        if CONF.db_cache_ttl and rpc.initialized():
+            self.cache_server = db_cache.start_listener(CONF.host)
+        if rpc.initialized():
+            self.events_server = migration_events.start_listener(CONF.host)
+        self.cache_reporter = db_cache.start_reporter()
         self.server.start()
         self.port = self.server.port
 
@@ -408,6 +430,11 @@ class WSGIService(service.ServiceBase):
         :returns: None
 
         """
+        for listener in (self.cache_server, self.events_server):
+            if listener:
+                listener.stop()
+        if self.cache_reporter:
+            self.cache_reporter.stop()
         self.server.stop()
 
     def wait(self):
@@ -416,6 +443,9 @@ class WSGIService(service.ServiceBase):
         :returns: None
 
         """
+        for listener in (self.cache_server, self.events_server):
+            if listener:
+                listener.wait()
         self.server.wait()
 
     def reset(self):
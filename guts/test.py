@@ -0,0 +1,63 @@
+# Copyright (c) 2015 Aptira Pty Ltd.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Base classes for our unit tests."""
+
+import fixtures
+from oslo_config import cfg
+from oslo_config import fixture as config_fixture
+from oslotest import base
+
+from guts.db import migration
+from guts.db.sqlalchemy import api as sqla_api
+
+
+CONF = cfg.CONF
+
+
+class Database(fixtures.Fixture):
+    """In memory SQLite database migrated to the latest schema."""
+
+    def setUp(self):
+        super(Database, self).setUp()
+        CONF.set_override('connection', 'sqlite://', group='database')
+        sqla_api._FACADE = None
+        sqla_api._CACHES.clear()
+        migration.db_sync()
+        self.addCleanup(self._reset)
+
+    def _reset(self):
+        sqla_api.dispose_engine()
+        sqla_api._FACADE = None
+        sqla_api._CACHES.clear()
+
+
+class TestCase(base.BaseTestCase):
+    """Test case base class for all unit tests."""
+
+    # Tests using the database set this to get an empty one each.
+    USES_DB = False
+
+    def setUp(self):
+        super(TestCase, self).setUp()
+        self.useFixture(config_fixture.Config(CONF))
+        if self.USES_DB:
+            self.useFixture(Database())
+
+    def flags(self, **kw):
+        """Override flag variables for a test."""
+        group = kw.pop('group', None)
+        for k, v in kw.items():
+            CONF.set_override(k, v, group)
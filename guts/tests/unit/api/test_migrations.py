@@ -0,0 +1,84 @@
+# Copyright (c) 2015 Aptira Pty Ltd.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the migrations API."""
+
+import fixtures
+import mock
+import webob
+
+from guts.api.v1 import migrations as migrations_api
+from guts import context
+from guts import exception
+from guts.migration import events
+from guts.migration import migrations
+from guts import test
+
+
+class MigrationEventsTestCase(test.TestCase):
+
+    def setUp(self):
+        super(MigrationEventsTestCase, self).setUp()
+        self.controller = migrations_api.MigrationsController(None)
+        self.event_log = events.EventLog(10, 10)
+        self.useFixture(fixtures.MockPatchObject(
+            events, 'get_event_log', return_value=self.event_log))
+        self.useFixture(fixtures.MockPatchObject(migrations, 'check_policy'))
+        self.get_migration = self.useFixture(fixtures.MockPatchObject(
+            migrations, 'get_migration')).mock
+
+    def _request(self, **params):
+        req = webob.Request.blank('/migrations/m1/events')
+        req.environ['guts.context'] = context.get_admin_context()
+        req.GET.update(params)
+        return req
+
+    def _not_found(self, migration_id):
+        self.get_migration.side_effect = exception.MigrationNotFound(
+            migration_id=migration_id)
+
+    def test_unknown_migration(self):
+        self._not_found('m1')
+        self.assertRaises(webob.exc.HTTPNotFound, self.controller.events,
+                          self._request(), 'm1')
+
+    def test_unknown_migration_since(self):
+        self._not_found('m1')
+        with mock.patch.object(self.event_log, 'wait') as wait:
+            self.assertRaises(webob.exc.HTTPNotFound,
+                              self.controller.events,
+                              self._request(since='3', timeout='30'), 'm1')
+        self.assertFalse(wait.called)
+
+    def test_initial_status(self):
+        self.get_migration.return_value = {'migration_status': 'Queued',
+                                           'migration_event': None}
+
+        result = self.controller.events(self._request(), 'm1')
+
+        self.assertEqual([{'cursor': 0, 'timestamp': None,
+                           'status': 'Queued', 'event': None}],
+                         result['events'])
+        self.assertEqual(0, result['cursor'])
+
+    def test_since(self):
+        for cursor in (1, 2):
+            self.event_log.add('m1', {'cursor': cursor})
+
+        result = self.controller.events(self._request(since='1'), 'm1')
+
+        self.assertEqual([2], [event['cursor'] for event in result['events']])
+        self.assertEqual(2, result['cursor'])
+        self.assertFalse(self.get_migration.called)
@@ -0,0 +1,176 @@
+# Copyright (c) 2015 Aptira Pty Ltd.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the sqlalchemy DB API."""
+
+from guts import context
+from guts import db
+from guts import exception
+from guts import test
+
+
+class VMSyncTestCase(test.TestCase):
+
+    USES_DB = True
+
+    def setUp(self):
+        super(VMSyncTestCase, self).setUp()
+        self.context = context.get_admin_context()
+
+    def _inventory(self, *vms):
+        return [{'uuid_at_source': uuid, 'name': name, 'memory': 1024,
+                 'vcpus': 1, 'virtual_disks': '[]'}
+                for uuid, name in vms]
+
+    def _vms(self, source_id='source-1'):
+        return dict((vm['uuid_at_source'], vm)
+                    for vm in db.vm_get_all(self.context)
+                    if vm['source_id'] == source_id)
+
+    def test_sync(self):
+        db.vm_sync_by_source_id(self.context, 'source-1', self._inventory(
+            ('uuid-1', 'vm-1'), ('uuid-2', 'vm-2'), ('uuid-3', 'vm-3')))
+        db.vm_sync_by_source_id(self.context, 'source-2', self._inventory(
+            ('uuid-9', 'vm-9')))
+        before = self._vms()
+
+        result = db.vm_sync_by_source_id(
+            self.context, 'source-1',
+            self._inventory(('uuid-1', 'vm-1'), ('uuid-2', 'renamed'),
+                            ('uuid-4', 'vm-4')))
+
+        self.assertEqual({'created': 1, 'updated': 1, 'deleted': 1,
+                          'deleted_migrations': 0}, result)
+        after = self._vms()
+        self.assertEqual(['uuid-1', 'uuid-2', 'uuid-4'], sorted(after))
+        # Updated VMs keep their id, and so their migrations.
+        self.assertEqual(before['uuid-2']['id'], after['uuid-2']['id'])
+        self.assertEqual('renamed', after['uuid-2']['name'])
+        self.assertEqual(['uuid-9'], list(self._vms('source-2')))
+
+    def test_sync_unchanged(self):
+        inventory = self._inventory(('uuid-1', 'vm-1'))
+        db.vm_sync_by_source_id(self.context, 'source-1', inventory)
+
+        result = db.vm_sync_by_source_id(self.context, 'source-1', inventory)
+
+        self.assertEqual({'created': 0, 'updated': 0, 'deleted': 0,
+                          'deleted_migrations': 0}, result)
+
+    def test_sync_deletes_migrations_of_removed_vms(self):
+        db.vm_sync_by_source_id(self.context, 'source-1', self._inventory(
+            ('uuid-1', 'vm-1'), ('uuid-2', 'vm-2')))
+        vms = self._vms()
+        for uuid in ('uuid-1', 'uuid-2'):
+            db.migration_create(self.context,
+                                {'name': uuid,
+                                 'source_instance_id': vms[uuid]['id']})
+
+        result = db.vm_sync_by_source_id(self.context, 'source-1',
+                                         self._inventory(('uuid-1', 'vm-1')))
+
+        self.assertEqual(1, result['deleted_migrations'])
+        self.assertEqual(['uuid-1'],
+                         [migration['name'] for migration in
+                          db.migration_get_all(self.context)])
+
+
+class PaginationTestCase(test.TestCase):
+
+    USES_DB = True
+
+    def setUp(self):
+        super(PaginationTestCase, self).setUp()
+        self.context = context.get_admin_context()
+        # Duplicate names check the id tie breaker.
+        for i, name in enumerate(['c', 'a', 'b', 'a', 'c', 'b']):
+            db.vm_create_many(self.context, [
+                {'name': name, 'uuid_at_source': 'uuid-%d' % i,
+                 'source_id': 'source-%d' % (i % 2), 'memory': str(i)}])
+
+    def _pages(self, limit, **kwargs):
+        pages = []
+        marker = None
+        while True:
+            page = db.vm_get_all(self.context, marker=marker, limit=limit,
+                                 **kwargs)
+            if not page:
+                return pages
+            pages.append([vm['uuid_at_source'] for vm in page])
+            marker = page[-1]['id']
+
+    def test_pages_cover_every_row_once(self):
+        pages = self._pages(4)
+        everything = [vm['uuid_at_source']
+                      for vm in db.vm_get_all(self.context)]
+
+        self.assertEqual([4, 2], [len(page) for page in pages])
+        self.assertEqual(everything, pages[0] + pages[1])
+        self.assertEqual(['a', 'a', 'b', 'b', 'c', 'c'],
+                         [vm['name'] for vm in db.vm_get_all(self.context)])
+
+    def test_sort_desc(self):
+        vms = db.vm_get_all(self.context, sort_keys=['memory'],
+                            sort_dirs=['desc'])
+
+        self.assertEqual(['5', '4', '3', '2', '1', '0'],
+                         [vm['memory'] for vm in vms])
+
+    def test_filters(self):
+        vms = db.vm_get_all(self.context, filters={'source_id': 'source-1'})
+        self.assertEqual(['uuid-1', 'uuid-3', 'uuid-5'],
+                         sorted(vm['uuid_at_source'] for vm in vms))
+
+        vms = db.vm_get_all(self.context,
+                            filters={'name': ['b', 'c'],
+                                     'source_id': 'source-1'})
+        self.assertEqual(['uuid-5'], [vm['uuid_at_source'] for vm in vms])
+
+    def test_filtered_pages(self):
+        pages = self._pages(2, filters={'source_id': 'source-1'})
+
+        self.assertEqual([2, 1], [len(page) for page in pages])
+        self.assertEqual(['uuid-1', 'uuid-3', 'uuid-5'],
+                         sorted(pages[0] + pages[1]))
+        self.assertEqual('uuid-5', pages[1][0])
+
+    def test_invalid_filter(self):
+        self.assertRaises(exception.InvalidInput, db.vm_get_all,
+                          self.context, filters={'password': 'x'})
+
+    def test_invalid_sort_key(self):
+        self.assertRaises(exception.InvalidSortKey, db.vm_get_all,
+                          self.context, sort_keys=['password'])
+
+    def test_invalid_marker(self):
+        self.assertRaises(exception.InvalidMarker, db.vm_get_all,
+                          self.context, marker='missing')
+
+
+class SourceTypeGetAllTestCase(test.TestCase):
+
+    USES_DB = True
+
+    def test_filter_by_ids(self):
+        ctxt = context.get_admin_context()
+        ids = [db.source_type_create(ctxt, {'name': name,
+                                            'driver_class_path': 'driver'})
+               ['id'] for name in ('a', 'b', 'c')]
+
+        source_types = db.source_type_get_all(ctxt,
+                                              filters={'id': ids[1:]})
+
+        self.assertEqual(sorted(ids[1:]), sorted(source_types))
+        self.assertEqual(3, len(db.source_type_get_all(ctxt)))
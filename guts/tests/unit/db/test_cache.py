@@ -0,0 +1,73 @@
+# Copyright (c) 2015 Aptira Pty Ltd.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the source and source type caches."""
+
+import mock
+
+from guts import context
+from guts import db
+from guts.db import cache as db_cache
+from guts import test
+
+
+class CacheTestCase(test.TestCase):
+
+    USES_DB = True
+
+    def setUp(self):
+        super(CacheTestCase, self).setUp()
+        self.context = context.get_admin_context()
+        self.source_type = db.source_type_create(
+            self.context, {'name': 'vsphere', 'driver_class_path': 'driver'})
+
+    def test_cached_get(self):
+        for _i in range(3):
+            source_type = db.source_type_get(self.context,
+                                             self.source_type['id'])
+            self.assertEqual('vsphere', source_type['name'])
+
+        self.assertEqual({'size': 1, 'hits': 2, 'misses': 1},
+                         db.cache_stats()['source_type'])
+
+    def test_update_invalidates(self):
+        db.source_type_get(self.context, self.source_type['id'])
+        db.source_type_update(self.context, self.source_type['id'],
+                              {'name': 'renamed', 'description': None,
+                               'driver': None})
+
+        source_type = db.source_type_get(self.context,
+                                         self.source_type['id'])
+
+        self.assertEqual('renamed', source_type['name'])
+        self.assertEqual(2, db.cache_stats()['source_type']['misses'])
+
+    def test_cache_disabled(self):
+        self.flags(db_cache_ttl=0)
+        db.source_type_get(self.context, self.source_type['id'])
+
+        self.assertEqual({}, db.cache_stats())
+        self.assertIsNone(db_cache.start_reporter())
+
+    @mock.patch.object(db_cache, 'LOG')
+    def test_report_stats(self, mock_log):
+        db.source_type_get(self.context, self.source_type['id'])
+        db.source_type_get(self.context, self.source_type['id'])
+
+        db_cache.report_stats()
+
+        mock_log.info.assert_called_once_with(
+            mock.ANY, {'kind': 'source_type', 'size': 1, 'hits': 1,
+                       'misses': 1})
@@ -0,0 +1,86 @@
+# Copyright (c) 2015 Aptira Pty Ltd.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Check that the DB API lookups are served by indexes."""
+
+from sqlalchemy import event
+
+from guts import context
+from guts.db.sqlalchemy import api as db_api
+from guts import exception
+from guts import test
+
+
+ID = '00000000-0000-0000-0000-000000000000'
+
+# Lookups expected to hit an index. The unfiltered listings are left out.
+LOOKUPS = [
+    ('source_type_get', (ID,)),
+    ('source_type_get_by_name', ('name',)),
+    ('source_get', (ID,)),
+    ('source_get_by_name', ('name',)),
+    ('vm_get', (ID,)),
+    ('vm_get_by_name', ('name',)),
+    ('vm_sync_by_source_id', (ID, [])),
+    ('migration_get', (ID,)),
+    ('migration_get_by_name', ('name',)),
+    ('migration_get_all', (False, {'host': 'host',
+                                   'migration_status': 'Queued'})),
+    ('service_get_by_host_and_topic', ('host', 'topic')),
+    ('service_get_by_args', ('host', 'binary')),
+]
+
+
+def _is_full_scan(detail):
+    # "SCAN TABLE t" on older SQLite releases, "SCAN t" on newer ones, with
+    # "USING INDEX i" when the rows are walked in the order of an index.
+    # Statements without a table, like the connection pings, scan a
+    # "CONSTANT ROW".
+    return detail.startswith('SCAN') and 'CONSTANT ROW' not in detail
+
+
+class QueryPlanTestCase(test.TestCase):
+
+    USES_DB = True
+
+    def _capture_selects(self, engine, lookup, args):
+        statements = []
+
+        def capture(conn, cursor, statement, parameters, ctxt, executemany):
+            if statement.lstrip().upper().startswith('SELECT'):
+                statements.append((statement, parameters))
+
+        event.listen(engine, 'before_cursor_execute', capture)
+        try:
+            lookup(context.get_admin_context(), *args)
+        except exception.NotFound:
+            pass
+        finally:
+            event.remove(engine, 'before_cursor_execute', capture)
+        return statements
+
+    def test_lookups_use_indexes(self):
+        engine = db_api.get_engine()
+        scans = []
+        for name, args in LOOKUPS:
+            statements = self._capture_selects(engine,
+                                               getattr(db_api, name), args)
+            self.assertNotEqual([], statements, name)
+            for statement, parameters in statements:
+                plan = engine.execute('EXPLAIN QUERY PLAN ' + statement,
+                                      parameters).fetchall()
+                scans.extend('%s: %s' % (name, row[-1])
+                             for row in plan if _is_full_scan(row[-1]))
+        self.assertEqual([], scans)
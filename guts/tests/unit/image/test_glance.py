@@ -0,0 +1,79 @@
+# Copyright (c) 2015 Aptira Pty Ltd.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the glance image API."""
+
+import os
+
+import fixtures
+from glanceclient.common import http
+from glanceclient.common import utils as glance_utils
+import mock
+
+from guts.image import glance
+from guts import test
+
+
+class FakeImage(object):
+    """Reads the image data the way glanceclient uploads it."""
+
+    size = None
+    sent = None
+
+    def update(self, data=None):
+        self.size = glance_utils.get_file_size(data)
+        self.sent = b''.join(http.HTTPClient._chunk_body(data))
+
+
+class GlanceAPITestCase(test.TestCase):
+
+    def setUp(self):
+        super(GlanceAPITestCase, self).setUp()
+        self.useFixture(fixtures.MockPatchObject(glance, 'Client'))
+        self.api = glance.GlanceAPI(mock.Mock(auth_token='token'))
+        self.image = FakeImage()
+        self.api.glance_client.images.create.return_value = self.image
+        self.data = os.urandom(3 * 65536 + 10)
+        self.path = os.path.join(self.useFixture(fixtures.TempDir()).path,
+                                 'disk.qcow2')
+        with open(self.path, 'wb') as f:
+            f.write(self.data)
+
+    def test_create(self):
+        sent = []
+
+        image = self.api.create({'name': 'disk'}, self.path, sent.append)
+
+        self.assertIs(self.image, image)
+        self.api.glance_client.images.create.assert_called_once_with(
+            name='disk')
+        self.assertEqual(self.data, image.sent)
+        self.assertEqual(len(self.data), image.size)
+        self.assertEqual(len(self.data), sum(sent))
+
+    def test_create_from_file(self):
+        with open(self.path, 'rb') as f:
+            image = self.api.create({'name': 'disk'}, f)
+
+        self.assertEqual(self.data, image.sent)
+
+    def test_progress_file_iteration(self):
+        self.flags(glance_upload_chunk_size=65536)
+        sent = []
+        with open(self.path, 'rb') as f:
+            chunks = list(glance._ProgressFile(f, sent.append))
+
+        self.assertEqual(self.data, b''.join(chunks))
+        self.assertEqual([65536, 65536, 65536, 10], sent)
@@ -0,0 +1,80 @@
+# Copyright (c) 2015 Aptira Pty Ltd.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the qemu-img conversion profiles."""
+
+from oslo_config import cfg
+
+from guts import exception
+from guts.migration import conversion
+from guts.migration import target
+from guts import test
+
+
+CONF = cfg.CONF
+
+
+class ConversionProfileTestCase(test.TestCase):
+
+    def setUp(self):
+        super(ConversionProfileTestCase, self).setUp()
+        self.flags(enabled_conversion_profiles=['fast', 'wan', 'prealloc'])
+        for name in ('fast', 'wan', 'prealloc'):
+            CONF.register_opts(conversion.profile_opts, group=name)
+        self.flags(coroutines=8, out_of_order_writes=True, cache_mode='none',
+                   group='fast')
+        self.flags(compress=True, group='wan')
+        self.flags(preallocation='falloc', group='prealloc')
+
+    def test_no_profile(self):
+        profile = conversion.get_profile()
+        self.assertIsNone(profile.name)
+        self.assertEqual((), profile.convert_args())
+
+    def test_default_profile(self):
+        self.flags(default_conversion_profile='fast')
+        self.assertEqual(('-m', '8', '-W', '-t', 'none'),
+                         conversion.get_profile().convert_args())
+
+    def test_profile_not_enabled(self):
+        self.assertRaises(exception.InvalidInput, conversion.get_profile,
+                          'other')
+
+    def test_compress_and_preallocate(self):
+        self.flags(preallocation='full', group='wan')
+        self.assertRaises(exception.InvalidInput, conversion.get_profile,
+                          'wan')
+
+    def test_qcow2_destination(self):
+        self.assertEqual(('-c',),
+                         conversion.get_profile('wan', 'qcow2').convert_args())
+        self.assertEqual(('-o', 'preallocation=falloc'),
+                         conversion.get_profile('prealloc',
+                                                'qcow2').convert_args())
+
+    def test_raw_destination(self):
+        self.assertRaises(exception.InvalidInput, conversion.get_profile,
+                          'wan', 'raw')
+        self.assertRaises(exception.InvalidInput, conversion.get_profile,
+                          'prealloc', 'raw')
+        self.assertEqual('fast', conversion.get_profile('fast', 'raw').name)
+
+    def test_target_output_format(self):
+        self.assertEqual('qcow2', target.get_output_format())
+        for name in ('volume', 'local'):
+            self.flags(migration_target='guts.migration.targets.%s' % name)
+            self.assertEqual('raw', target.get_output_format())
+        self.flags(migration_target='guts.migration.conversion')
+        self.assertIsNone(target.get_output_format())
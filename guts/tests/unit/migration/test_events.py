@@ -0,0 +1,77 @@
+# Copyright (c) 2015 Aptira Pty Ltd.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the in memory log of migration events."""
+
+import threading
+import time
+
+from guts.migration import events
+from guts import test
+
+
+def _event(cursor, status='Inprogress'):
+    return {'cursor': cursor, 'migration_status': status}
+
+
+class EventLogTestCase(test.TestCase):
+
+    def setUp(self):
+        super(EventLogTestCase, self).setUp()
+        self.log = events.EventLog(2, 3)
+
+    def test_wait_since(self):
+        for cursor in (1, 2, 3):
+            self.log.add('m1', _event(cursor))
+
+        self.assertEqual([_event(3)], self.log.wait('m1'))
+        self.assertEqual([_event(2), _event(3)], self.log.wait('m1', 1))
+        self.assertEqual([], self.log.wait('m1', 3))
+
+    def test_keeps_recent_events(self):
+        for cursor in (1, 2, 3, 4):
+            self.log.add('m1', _event(cursor))
+
+        self.assertEqual([2, 3, 4],
+                         [event['cursor'] for event in self.log.wait('m1', 0)])
+
+    def test_drops_late_events(self):
+        self.log.add('m1', _event(2, 'Completed'))
+        self.log.add('m1', _event(1))
+        self.log.add('m1', _event(2))
+
+        self.assertEqual([_event(2, 'Completed')], self.log.wait('m1', 0))
+
+    def test_evicts_least_recently_used_migration(self):
+        self.log.add('m1', _event(1))
+        self.log.add('m2', _event(1))
+        self.log.wait('m1')
+        self.log.add('m3', _event(1))
+
+        self.assertTrue(self.log.has_events('m1'))
+        self.assertFalse(self.log.has_events('m2'))
+        self.assertTrue(self.log.has_events('m3'))
+
+    def test_wait_times_out(self):
+        start = time.time()
+        self.assertEqual([], self.log.wait('m1', 0, timeout=0.1))
+        self.assertGreaterEqual(time.time() - start, 0.1)
+
+    def test_wait_wakes_up_on_event(self):
+        timer = threading.Timer(0.1, self.log.add, ('m1', _event(1)))
+        timer.start()
+        self.addCleanup(timer.cancel)
+
+        self.assertEqual([_event(1)], self.log.wait('m1', 0, timeout=10))
@@ -0,0 +1,91 @@
+# Copyright (c) 2015 Aptira Pty Ltd.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for warm copies of the disks of running VMs by the fake driver."""
+
+import os
+
+import fixtures
+from oslo_utils import units
+
+from guts import exception
+from guts.migration.drivers import fake
+from guts import test
+
+
+class WarmCopyTestCase(test.TestCase):
+
+    def setUp(self):
+        super(WarmCopyTestCase, self).setUp()
+        self.base_path = self.useFixture(fixtures.TempDir()).path
+        host_name = self.id()
+        self.vm = fake.get_fake_host(host_name).add_vm(
+            'vm-1', [4 * units.Mi, 2 * units.Mi])
+        self.driver = fake.get_migration_driver(None)
+        self.driver.initialize({'host': host_name})
+
+    def _assertCopied(self, disks):
+        self.assertEqual(len(self.vm.disks), len(disks))
+        for disk in disks:
+            with open(disk['path'], 'rb') as f:
+                data = f.read()
+            self.assertEqual(bytes(self.vm.disks[disk['key']]), data)
+
+    def test_pre_copy_then_delta_copy(self):
+        self.vm.write(0, 0, os.urandom(300 * units.Ki))
+        self.vm.write(1, units.Mi, os.urandom(units.Ki))
+        self.driver.enable_change_tracking(None, 'vm-1')
+
+        disks = self.driver.copy_vm_disks(None, 'vm-1', self.base_path)
+        self._assertCopied(disks)
+        self.assertEqual([5 * fake.BLOCK_SIZE, fake.BLOCK_SIZE],
+                         [disk['copied_bytes'] for disk in disks])
+
+        # The guest keeps writing between the copies.
+        self.vm.write(0, 3 * units.Mi, os.urandom(100))
+        self.vm.write(0, 10, b'\0' * 100)
+        disks = self.driver.copy_vm_disks(None, 'vm-1', self.base_path,
+                                          disks)
+        self._assertCopied(disks)
+        self.assertEqual([2 * fake.BLOCK_SIZE, 0],
+                         [disk['copied_bytes'] for disk in disks])
+
+    def test_unchanged_delta_copy(self):
+        self.vm.write(0, 0, os.urandom(units.Ki))
+        self.driver.enable_change_tracking(None, 'vm-1')
+        disks = self.driver.copy_vm_disks(None, 'vm-1', self.base_path)
+
+        disks = self.driver.copy_vm_disks(None, 'vm-1', self.base_path,
+                                          disks)
+        self._assertCopied(disks)
+        self.assertEqual([0, 0], [disk['copied_bytes'] for disk in disks])
+
+    def test_writes_before_change_tracking_are_copied(self):
+        self.vm.write(1, 5 * fake.BLOCK_SIZE, os.urandom(units.Ki))
+        self.driver.enable_change_tracking(None, 'vm-1')
+
+        disks = self.driver.copy_vm_disks(None, 'vm-1', self.base_path)
+        self._assertCopied(disks)
+
+    def test_copy_without_change_tracking(self):
+        self.assertRaises(exception.WarmMigrationNotSupported,
+                          self.driver.copy_vm_disks, None, 'vm-1',
+                          self.base_path)
+        self.assertEqual([], self.vm.snapshots)
+
+    def test_snapshot_removed(self):
+        self.driver.enable_change_tracking(None, 'vm-1')
+        self.driver.copy_vm_disks(None, 'vm-1', self.base_path)
+        self.assertEqual([], self.vm.snapshots)
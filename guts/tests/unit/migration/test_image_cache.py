@@ -0,0 +1,111 @@
+# Copyright (c) 2015 Aptira Pty Ltd.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the cache of converted disks."""
+
+import os
+
+import fixtures
+
+from guts.migration import image_cache
+from guts import test
+
+
+class ImageCacheTestCase(test.TestCase):
+
+    def setUp(self):
+        super(ImageCacheTestCase, self).setUp()
+        self.dir = self.useFixture(fixtures.TempDir()).path
+        self.cache_dir = os.path.join(self.dir, '_cache')
+        self.cache = image_cache.ImageCache(self.cache_dir, 2048)
+
+    def _disk(self, name, size=1024):
+        path = os.path.join(self.dir, name)
+        with open(path, 'wb') as f:
+            f.write(os.urandom(size))
+        return path
+
+    def test_key(self):
+        self.assertEqual('sha256-ab-qcow2-default',
+                         image_cache.ImageCache.key('sha256:ab', 'qcow2',
+                                                    None))
+        self.assertEqual('sha256-ab-raw-wan',
+                         image_cache.ImageCache.key('sha256:ab', 'raw',
+                                                    'wan'))
+        self.assertIsNone(image_cache.ImageCache.key(None, 'qcow2', None))
+
+    def test_add_and_get(self):
+        path = self._disk('disk-0.qcow2')
+        with open(path, 'rb') as f:
+            data = f.read()
+        self.cache.add('k1', path, 10240)
+        # The migration removes its converted disk once finished.
+        os.unlink(path)
+
+        dest_path = os.path.join(self.dir, 'disk-1.qcow2')
+        disk = self.cache.get('k1', dest_path)
+
+        self.assertEqual(10240, disk['virtual_size'])
+        self.assertEqual(1024, disk['file_size'])
+        self.assertIsNone(disk['image_id'])
+        with open(dest_path, 'rb') as f:
+            self.assertEqual(data, f.read())
+        self.assertIsNone(self.cache.get('k2', dest_path))
+
+        stats = self.cache.stats()
+        self.assertEqual(1, stats['hits'])
+        self.assertEqual(1, stats['misses'])
+        self.assertEqual(10240, stats['converted_bytes_saved'])
+        self.assertEqual(0.5, stats['hit_rate'])
+
+    def test_image_id(self):
+        self.cache.add('k1', self._disk('disk-0.qcow2'), 10240)
+        self.cache.set_image('k1', 'image-1')
+        self.cache.image_reused('k1')
+
+        disk = self.cache.get('k1', os.path.join(self.dir, 'disk-1.qcow2'))
+
+        self.assertEqual('image-1', disk['image_id'])
+        self.assertEqual(1024, self.cache.stats()['uploaded_bytes_saved'])
+
+    def test_evicts_least_recently_used(self):
+        self.cache.add('k1', self._disk('disk-1'), 1024)
+        self.cache.add('k2', self._disk('disk-2'), 1024)
+        self.cache.get('k1', os.path.join(self.dir, 'used-1'))
+        self.cache.add('k3', self._disk('disk-3'), 1024)
+
+        self.assertIsNotNone(self.cache.get('k1', os.path.join(self.dir, 'a')))
+        self.assertIsNone(self.cache.get('k2', os.path.join(self.dir, 'b')))
+        self.assertIsNotNone(self.cache.get('k3', os.path.join(self.dir, 'c')))
+        self.assertFalse(os.path.exists(os.path.join(self.cache_dir, 'k2')))
+        self.assertEqual(2048, self.cache.stats()['size'])
+
+    def test_disk_larger_than_cache(self):
+        self.cache.add('k1', self._disk('disk-1', 4096), 4096)
+
+        self.assertIsNone(self.cache.get('k1', os.path.join(self.dir, 'a')))
+
+    def test_index_survives_restart(self):
+        self.cache.add('k1', self._disk('disk-1'), 1024)
+        self.cache.set_image('k1', 'image-1')
+
+        cache = image_cache.ImageCache(self.cache_dir, 2048)
+        disk = cache.get('k1', os.path.join(self.dir, 'a'))
+
+        self.assertEqual('image-1', disk['image_id'])
+
+    def test_disabled(self):
+        self.flags(image_cache_max_gb=0)
+        self.assertIsNone(image_cache.get_image_cache())
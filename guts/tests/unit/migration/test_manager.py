@@ -0,0 +1,71 @@
+# Copyright (c) 2015 Aptira Pty Ltd.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the migration manager."""
+
+import fixtures
+import mock
+
+from guts import context
+from guts import db
+from guts.migration import manager
+from guts import test
+
+
+class RecoverMigrationsTestCase(test.TestCase):
+
+    USES_DB = True
+
+    def setUp(self):
+        super(RecoverMigrationsTestCase, self).setUp()
+        self.flags(state_path=self.useFixture(fixtures.TempDir()).path)
+        self.context = context.get_admin_context()
+        self.manager = manager.MigrationManager(host='host-1')
+        self.manager.create_migration = mock.Mock()
+        self.manager.status_writer = mock.Mock()
+        self.manager.event_publisher = mock.Mock()
+
+    def _create(self, name, status, host='host-1'):
+        return db.migration_create(
+            self.context, {'name': name, 'source_instance_id': 'vm-1',
+                           'migration_status': status, 'host': host})
+
+    def test_recover_migrations(self):
+        queued = self._create('queued', 'Queued')
+        running = self._create('running', 'Inprogress')
+        self._create('other-host', 'Queued', host='host-2')
+        self._create('done', 'Completed')
+
+        self.manager._recover_migrations(self.context)
+
+        self.manager.create_migration.assert_called_once_with(
+            self.context, mock.ANY)
+        migration_ref = self.manager.create_migration.call_args[0][1]
+        self.assertEqual(queued['id'], migration_ref['id'])
+        self.manager.status_writer.update.assert_called_once_with(
+            running['id'], {'migration_status': 'Error'}, flush=True)
+
+    def test_create_migration_records_host(self):
+        migration = self._create('new', None, host=None)
+        vm = {'id': 'vm-1', 'source_id': 'source-1'}
+        self.manager.scheduler = mock.Mock()
+        with mock.patch.object(db, 'vm_get', return_value=vm):
+            manager.MigrationManager.create_migration(
+                self.manager, self.context, migration)
+
+        migration = db.migration_get(self.context, migration['id'])
+        self.assertEqual('host-1', migration['host'])
+        self.assertEqual('Queued', migration['migration_status'])
+        self.assertTrue(self.manager.scheduler.submit.called)
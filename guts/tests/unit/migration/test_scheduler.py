@@ -0,0 +1,107 @@
+# Copyright (c) 2015 Aptira Pty Ltd.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the migration admission control."""
+
+import eventlet
+
+from guts.migration import scheduler
+from guts import test
+
+
+class MigrationSchedulerTestCase(test.TestCase):
+
+    def setUp(self):
+        super(MigrationSchedulerTestCase, self).setUp()
+        self.started = []
+        self.events = {}
+
+    def _job(self, job_id):
+        self.events[job_id] = eventlet.event.Event()
+
+        def run():
+            self.started.append(job_id)
+            self.events[job_id].wait()
+        return run
+
+    def _submit(self, sched, job_id, source_id, staged_bytes=0):
+        sched.submit(job_id, source_id, staged_bytes, self._job(job_id))
+
+    def _finish(self, job_id):
+        self.events[job_id].send()
+        eventlet.sleep(0)
+        eventlet.sleep(0)
+
+    def test_max_migrations(self):
+        sched = scheduler.MigrationScheduler(2, 2)
+        for job_id in ('m1', 'm2', 'm3'):
+            self._submit(sched, job_id, job_id)
+        eventlet.sleep(0)
+
+        self.assertEqual(['m1', 'm2'], self.started)
+        self.assertEqual({'queued': 1, 'running': 2, 'staged_bytes': 0},
+                         sched.stats())
+
+        self._finish('m1')
+        self.assertEqual(['m1', 'm2', 'm3'], self.started)
+
+    def test_busy_source_does_not_block_others(self):
+        sched = scheduler.MigrationScheduler(4, 1)
+        self._submit(sched, 'm1', 'source-a')
+        self._submit(sched, 'm2', 'source-a')
+        self._submit(sched, 'm3', 'source-b')
+        eventlet.sleep(0)
+
+        self.assertEqual(['m1', 'm3'], self.started)
+
+        self._finish('m1')
+        self.assertEqual(['m1', 'm3', 'm2'], self.started)
+
+    def test_max_staged_bytes(self):
+        sched = scheduler.MigrationScheduler(4, 4, max_staged_bytes=100)
+        self._submit(sched, 'm1', 'source', 60)
+        self._submit(sched, 'm2', 'source', 60)
+        self._submit(sched, 'm3', 'source', 40)
+        eventlet.sleep(0)
+
+        self.assertEqual(['m1', 'm3'], self.started)
+        self.assertEqual(100, sched.stats()['staged_bytes'])
+
+        self._finish('m1')
+        self.assertEqual(['m1', 'm3', 'm2'], self.started)
+
+    def test_oversized_migration_runs_alone(self):
+        sched = scheduler.MigrationScheduler(4, 4, max_staged_bytes=100)
+        self._submit(sched, 'm1', 'source', 500)
+        self._submit(sched, 'm2', 'source', 10)
+        eventlet.sleep(0)
+
+        self.assertEqual(['m1'], self.started)
+
+        self._finish('m1')
+        self.assertEqual(['m1', 'm2'], self.started)
+
+    def test_failed_job_releases_its_slot(self):
+        sched = scheduler.MigrationScheduler(1, 1)
+
+        def fail():
+            raise Exception('boom')
+
+        sched.submit('m1', 'source', 0, fail)
+        self._submit(sched, 'm2', 'source')
+        eventlet.sleep(0)
+        eventlet.sleep(0)
+
+        self.assertEqual(['m2'], self.started)
@@ -0,0 +1,95 @@
+# Copyright (c) 2015 Aptira Pty Ltd.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the migration status writer."""
+
+import mock
+
+from guts import context
+from guts import db
+from guts.migration import status_writer
+from guts import test
+
+
+class StatusWriterTestCase(test.TestCase):
+
+    USES_DB = True
+
+    def setUp(self):
+        super(StatusWriterTestCase, self).setUp()
+        self.context = context.get_admin_context()
+        self.migrations = [
+            db.migration_create(self.context,
+                                {'name': name,
+                                 'source_instance_id': 'vm-1'})['id']
+            for name in ('m1', 'm2')]
+        self.writer = status_writer.StatusWriter(3600)
+
+    def _get(self, migration_id, field):
+        return db.migration_get(self.context, migration_id)[field]
+
+    def test_updates_are_coalesced(self):
+        m1, m2 = self.migrations
+        self.writer.update(m1, {'migration_status': 'Initiating'})
+        self.writer.update(m1, {'migration_event': 'Connecting'})
+        self.writer.update(m1, {'migration_status': 'Inprogress'})
+        self.writer.update(m2, {'migration_status': 'Initiating'})
+
+        self.assertIsNone(self._get(m1, 'migration_status'))
+
+        with mock.patch.object(db, 'migration_update_many',
+                               wraps=db.migration_update_many) as update:
+            self.writer.flush()
+
+        update.assert_called_once_with(mock.ANY, {
+            m1: {'migration_status': 'Inprogress',
+                 'migration_event': 'Connecting'},
+            m2: {'migration_status': 'Initiating'}})
+        self.assertEqual('Inprogress', self._get(m1, 'migration_status'))
+        self.assertEqual('Connecting', self._get(m1, 'migration_event'))
+        self.assertEqual('Initiating', self._get(m2, 'migration_status'))
+
+    def test_flush_on_update(self):
+        m1 = self.migrations[0]
+        self.writer.update(m1, {'migration_status': 'Error'}, flush=True)
+
+        self.assertEqual('Error', self._get(m1, 'migration_status'))
+
+    def test_failed_flush_keeps_later_updates(self):
+        m1 = self.migrations[0]
+        self.writer.update(m1, {'migration_status': 'Inprogress',
+                                'migration_event': 'Converting'})
+
+        def fail(ctxt, updates):
+            # A newer status arrives while the write fails.
+            self.writer.update(m1, {'migration_status': 'Completed'})
+            raise Exception('database gone')
+
+        with mock.patch.object(db, 'migration_update_many',
+                               side_effect=fail):
+            self.assertRaises(Exception, self.writer.flush)
+        self.writer.flush()
+
+        self.assertEqual('Completed', self._get(m1, 'migration_status'))
+        self.assertEqual('Converting', self._get(m1, 'migration_event'))
+
+    def test_stop_flushes(self):
+        m1 = self.migrations[0]
+        self.writer.start()
+        self.writer.update(m1, {'migration_status': 'Inprogress'})
+
+        self.writer.stop()
+
+        self.assertEqual('Inprogress', self._get(m1, 'migration_status'))
@@ -0,0 +1,373 @@
+# Copyright (c) 2015 Aptira Pty Ltd.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the vSphere migration driver."""
+
+import hashlib
+import io
+import os
+
+import eventlet
+import fixtures
+import mock
+
+from guts.migration.drivers import vsphere
+from guts import test
+
+
+class FakeResponse(object):
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    def close(self):
+        pass
+
+
+class StreamProbeTestCase(test.TestCase):
+
+    def setUp(self):
+        super(StreamProbeTestCase, self).setUp()
+        self.driver = vsphere.VSphereDriver(None)
+        self.driver.http_session = mock.Mock()
+        self.url = 'https://esx/nfc/disk-0.vmdk'
+
+    def _head(self, status_code=200, **headers):
+        self.driver.http_session.head.return_value = FakeResponse(
+            status_code, headers)
+
+    def test_can_stream(self):
+        self._head(**{'content-length': '1024', 'accept-ranges': 'bytes'})
+        self.driver.http_session.get.return_value = FakeResponse(206)
+
+        self.assertTrue(self.driver._can_stream_disk(self.url))
+        self.driver.http_session.get.assert_called_once_with(
+            self.url, headers={'Range': 'bytes=1023-1023'}, stream=True,
+            verify=False)
+
+    def test_no_content_length(self):
+        self._head(**{'accept-ranges': 'bytes'})
+        self.assertFalse(self.driver._can_stream_disk(self.url))
+
+    def test_no_range_support(self):
+        self._head(**{'content-length': '1024'})
+        self.assertFalse(self.driver._can_stream_disk(self.url))
+
+    def test_range_ignored(self):
+        self._head(**{'content-length': '1024', 'accept-ranges': 'bytes'})
+        self.driver.http_session.get.return_value = FakeResponse(200)
+        self.assertFalse(self.driver._can_stream_disk(self.url))
+
+    def test_head_fails(self):
+        self.driver.http_session.head.side_effect = (
+            vsphere.requests.ConnectionError())
+        self.assertFalse(self.driver._can_stream_disk(self.url))
+
+    def test_stream_falls_back_to_download(self):
+        device_url = mock.Mock(url=self.url, key='/vm-1/VirtualLsiLogic0:0')
+        disk = {'path': '/tmp/disk-0'}
+        converted = []
+
+        def export(vm_uuid, base_path, disk_handler):
+            disk_handler(device_url, disk)
+            return [disk]
+
+        self.driver._export_vm_disks = export
+        self.driver._can_stream_disk = mock.Mock(return_value=False)
+        self.driver._get_vm_disk = mock.Mock(
+            return_value=(1024, 512, 'sha256:0'))
+
+        self.driver.stream_vm_disks(None, 'vm-1', '/tmp', converted.append)
+
+        self.driver._get_vm_disk.assert_called_once_with(
+            device_url, '/tmp/disk-0', change_version=None)
+        self.assertEqual([disk], converted)
+        self.assertNotIn('source', disk)
+        self.assertEqual(1024, disk['fetched_bytes'])
+
+
+class ExportVMDisksTestCase(test.TestCase):
+
+    def setUp(self):
+        super(ExportVMDisksTestCase, self).setUp()
+        self.driver = vsphere.VSphereDriver(None)
+        self.driver.host = 'esx'
+        self.driver._find_vm_by_uuid = mock.Mock()
+        self.lease = mock.Mock(state=vsphere.vim.HttpNfcLease.State.ready)
+        self.lease.info.deviceUrl = [
+            mock.Mock(targetId='disk-%d.vmdk' % i,
+                      key='/vm-1/VirtualLsiLogic0:%d' % i,
+                      url='https://esx/nfc/disk-%d.vmdk' % i)
+            for i in range(2)]
+        self.driver._get_vm_lease = mock.Mock(return_value=self.lease)
+        self.useFixture(fixtures.MockPatchObject(vsphere, 'Thread'))
+
+    def test_export(self):
+        handled = []
+
+        def handler(device_url, disk):
+            handled.append(disk['target_id'])
+
+        disks = self.driver._export_vm_disks('vm-1', '/tmp', handler)
+
+        self.assertEqual(['disk-0.vmdk', 'disk-1.vmdk'],
+                         [disk['target_id'] for disk in disks])
+        self.assertEqual(['disk-0.vmdk', 'disk-1.vmdk'], sorted(handled))
+        self.lease.HttpNfcLeaseComplete.assert_called_once_with()
+        self.assertFalse(self.lease.HttpNfcLeaseAbort.called)
+
+    def test_failure_aborts_running_exports(self):
+        finished = []
+
+        def handler(device_url, disk):
+            if disk['target_id'] == 'disk-1.vmdk':
+                raise IOError('connection reset')
+            eventlet.sleep(30)
+            finished.append(disk['target_id'])
+
+        with eventlet.Timeout(5):
+            self.assertRaises(IOError, self.driver._export_vm_disks,
+                              'vm-1', '/tmp', handler)
+
+        # The first disk is still being fetched when the second fails.
+        self.assertEqual([], finished)
+        self.lease.HttpNfcLeaseAbort.assert_called_once_with()
+        self.assertFalse(self.lease.HttpNfcLeaseComplete.called)
+
+
+class FakeDiskResponse(FakeResponse):
+    def __init__(self, data, start=None):
+        headers = {}
+        if start is None:
+            status_code = 200
+            start = 0
+        else:
+            status_code = 206
+            headers['content-range'] = 'bytes %d-%d/%d' % (
+                start, len(data) - 1, len(data))
+        headers['content-length'] = str(len(data) - start)
+        super(FakeDiskResponse, self).__init__(status_code, headers)
+        self.raw = io.BytesIO(data[start:])
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        return iter(lambda: self.raw.read(chunk_size), b'')
+
+
+class FakeDiskSession(object):
+    """Serves data at every URL, honouring open ended ranges."""
+
+    def __init__(self, data):
+        self.data = data
+        self.ranges = []
+
+    def get(self, url, headers=None, stream=False, verify=True):
+        byte_range = (headers or {}).get('Range')
+        self.ranges.append(byte_range)
+        if byte_range is None:
+            return FakeDiskResponse(self.data)
+        start = int(byte_range.split('=')[1].rstrip('-'))
+        return FakeDiskResponse(self.data, start)
+
+
+class ResumeDownloadTestCase(test.TestCase):
+
+    def setUp(self):
+        super(ResumeDownloadTestCase, self).setUp()
+        self.useFixture(fixtures.MockPatchObject(vsphere, 'RESUME_OVERLAP',
+                                                 64))
+        self.path = os.path.join(self.useFixture(fixtures.TempDir()).path,
+                                 'disk-0.vmdk')
+        self.manifest_path = self.path + vsphere.MANIFEST_SUFFIX
+        self.data = os.urandom(1024) + b'\0' * 1024 + os.urandom(1024)
+        self.driver = vsphere.VSphereDriver(None)
+        self.driver.http_session = FakeDiskSession(self.data)
+        self.device_url = mock.Mock(targetId='disk-0.vmdk',
+                                    url='https://esx/nfc/lease-2/disk-0.vmdk')
+
+    def _partial(self, data, offset, change_version='1'):
+        with open(self.path, 'wb') as f:
+            f.write(data[:offset])
+        source = {'target_id': 'disk-0.vmdk',
+                  'change_version': change_version}
+        vsphere._save_manifest(self.manifest_path,
+                               'https://esx/nfc/lease-1/disk-0.vmdk', source,
+                               len(data), offset, 0)
+
+    def _get_vm_disk(self):
+        result = self.driver._get_vm_disk(self.device_url, self.path,
+                                          change_version='1')
+        with open(self.path, 'rb') as f:
+            self.assertEqual(self.data, f.read())
+        self.assertFalse(os.path.exists(self.manifest_path))
+        size, zero_bytes, checksum = result
+        self.assertEqual(len(self.data), size)
+        self.assertEqual('sha256:%s' % hashlib.sha256(self.data).hexdigest(),
+                         checksum)
+
+    def test_download(self):
+        self._get_vm_disk()
+        self.assertEqual([None], self.driver.http_session.ranges)
+
+    def test_resume(self):
+        self._partial(self.data, 1536)
+        self._get_vm_disk()
+        self.assertEqual(['bytes=1472-'], self.driver.http_session.ranges)
+
+    def test_resume_other_disk_restarts(self):
+        self._partial(os.urandom(len(self.data)), 1536)
+        self._get_vm_disk()
+        self.assertEqual(['bytes=1472-', None],
+                         self.driver.http_session.ranges)
+
+    def test_resume_other_size_restarts(self):
+        self._partial(self.data + b'\0' * 512, 1536)
+        self._get_vm_disk()
+        self.assertEqual(['bytes=1472-', None],
+                         self.driver.http_session.ranges)
+
+    def test_resume_other_change_version_restarts(self):
+        self._partial(self.data, 1536, change_version='2')
+        self._get_vm_disk()
+        self.assertEqual([None], self.driver.http_session.ranges)
+
+
+DESCRIPTOR = '''# Disk DescriptorFile
+version=1
+createType="%(create_type)s"
+
+# Extent description
+%(extents)s
+
+# The Disk Data Base
+ddb.adapterType = "lsilogic"
+'''
+
+
+class FlatFileTestCase(test.TestCase):
+
+    def setUp(self):
+        super(FlatFileTestCase, self).setUp()
+        self.driver = vsphere.VSphereDriver(None)
+        self.driver.host = 'vcenter'
+        self.driver.port = 8443
+        self.driver.con = mock.Mock()
+        self.driver.http_session = mock.Mock()
+        datacenter = mock.Mock(spec=vsphere.vim.Datacenter)
+        datacenter.name = 'dc 1'
+        self.vm = mock.Mock()
+        self.vm.parent = datacenter
+
+    def _backing(self, file_name='[ds1] vm-1/vm-1.vmdk', parent=None,
+                 datastore_type='VMFS'):
+        backing = mock.Mock(
+            spec=vsphere.vim.vm.device.VirtualDisk.FlatVer2BackingInfo,
+            fileName=file_name)
+        backing.parent = parent
+        backing.datastore = mock.Mock()
+        backing.datastore.summary.type = datastore_type
+        return backing
+
+    def _descriptor(self, extents, create_type='vmfs'):
+        self.driver.http_session.get.return_value = mock.Mock(
+            text=DESCRIPTOR % {'create_type': create_type,
+                               'extents': '\n'.join(extents)})
+
+    def test_datastore_url(self):
+        self.assertEqual(
+            'https://vcenter:8443/folder/vm%201/vm-1.vmdk?'
+            'dcPath=dc+1&dsName=ds1',
+            self.driver._get_datastore_url(self.vm,
+                                           '[ds1] vm 1/vm-1.vmdk'))
+
+    def test_flat_file_url(self):
+        self._descriptor(['RW 2097152 VMFS "vm-1-data.vmdk"'])
+        url = self.driver._get_flat_file_url(self.vm, self._backing())
+        self.assertEqual('https://vcenter:8443/folder/vm-1/vm-1-data.vmdk?'
+                         'dcPath=dc+1&dsName=ds1', url)
+        self.driver.http_session.get.assert_called_once_with(
+            'https://vcenter:8443/folder/vm-1/vm-1.vmdk?'
+            'dcPath=dc+1&dsName=ds1',
+            headers={'Cookie': self.driver.con._stub.cookie}, verify=False)
+
+    def test_flat_file_url_datastore_root(self):
+        self._descriptor(['RW 2097152 FLAT "vm-1-flat.vmdk"'],
+                         create_type='monolithicFlat')
+        url = self.driver._get_flat_file_url(
+            self.vm, self._backing(file_name='[ds1] vm-1.vmdk'))
+        self.assertEqual('https://vcenter:8443/folder/vm-1-flat.vmdk?'
+                         'dcPath=dc+1&dsName=ds1', url)
+
+    def test_delta_backing_rejected(self):
+        backing = self._backing(file_name='[ds1] vm-1/vm-1-000001.vmdk',
+                                parent=self._backing())
+        self.assertRaises(vsphere.exception.WarmMigrationNotSupported,
+                          self.driver._get_flat_file_url, self.vm, backing)
+        self.assertFalse(self.driver.http_session.get.called)
+
+    def test_sparse_extent_rejected(self):
+        self._descriptor(['RW 2097152 SESPARSE "vm-1-sesparse.vmdk"'],
+                         create_type='seSparse')
+        self.assertRaises(vsphere.exception.WarmMigrationNotSupported,
+                          self.driver._get_flat_file_url, self.vm,
+                          self._backing())
+
+    def test_split_extents_rejected(self):
+        self._descriptor(['RW 4192256 FLAT "vm-1-f001.vmdk"',
+                          'RW 4192256 FLAT "vm-1-f002.vmdk"'],
+                         create_type='twoGbMaxExtentFlat')
+        self.assertRaises(vsphere.exception.WarmMigrationNotSupported,
+                          self.driver._get_flat_file_url, self.vm,
+                          self._backing())
+
+    def _validate_warm(self, backing):
+        disk = mock.Mock(spec=vsphere.vim.vm.device.VirtualDisk,
+                         backing=backing, deviceInfo=mock.Mock())
+        self.vm.capability.changeTrackingSupported = True
+        self.vm.config.hardware.device = [disk]
+        with mock.patch.object(self.driver, '_find_vm_by_uuid',
+                               return_value=self.vm):
+            return self.driver.validate_for_migration('vm-1', warm=True)
+
+    def test_validate_warm_flat_disk(self):
+        self.assertEqual((True, None), self._validate_warm(self._backing()))
+
+    def test_validate_warm_nfs_disk(self):
+        self.assertEqual((True, None),
+                         self._validate_warm(
+                             self._backing(datastore_type='NFS41')))
+
+    def test_validate_warm_delta_disk(self):
+        backing = self._backing(parent=self._backing())
+        self.assertEqual((False, vsphere.exception.WarmMigrationNotSupported),
+                         self._validate_warm(backing))
+
+    def test_validate_warm_vsan_disk(self):
+        self.assertEqual((False, vsphere.exception.WarmMigrationNotSupported),
+                         self._validate_warm(
+                             self._backing(datastore_type='vsan')))
+
+    def test_validate_warm_vvol_disk(self):
+        self.assertEqual((False, vsphere.exception.WarmMigrationNotSupported),
+                         self._validate_warm(
+                             self._backing(datastore_type='VVOL')))
+
+    def test_validate_warm_rdm_disk(self):
+        rdm = vsphere.vim.vm.device.VirtualDisk.RawDiskMappingVer1BackingInfo
+        backing = mock.Mock(spec=rdm)
+        self.assertEqual((False, vsphere.exception.WarmMigrationNotSupported),
+                         self._validate_warm(backing))
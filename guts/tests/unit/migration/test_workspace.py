@@ -0,0 +1,174 @@
+# Copyright (c) 2015 Aptira Pty Ltd.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the workspaces migrations stage their disks in."""
+
+import os
+
+import fixtures
+import mock
+
+from guts import exception
+from guts.migration import workspace
+from guts import test
+
+
+class WorkspaceManagerTestCase(test.TestCase):
+
+    def setUp(self):
+        super(WorkspaceManagerTestCase, self).setUp()
+        root = self.useFixture(fixtures.TempDir()).path
+        self.dirs = [os.path.join(root, 'a'), os.path.join(root, 'b')]
+        self.free = {self.dirs[0]: 1000, self.dirs[1]: 2000}
+        self.useFixture(fixtures.MockPatchObject(
+            workspace, '_free_bytes', side_effect=self.free.get))
+        self.manager = workspace.WorkspaceManager(self.dirs, 100)
+
+    def _write(self, path, data=b'x'):
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    def test_reserve_most_free_dir(self):
+        ws = self.manager.reserve('vm-1', 1500)
+        self.assertEqual(os.path.join(self.dirs[1], 'vm-1'), ws.path)
+        self.assertTrue(os.path.isdir(ws.path))
+        self.assertEqual(1500, ws.reserved)
+
+    def test_reservations_count_against_free_space(self):
+        self.manager.reserve('vm-1', 1500)
+        ws = self.manager.reserve('vm-2', 800)
+        self.assertEqual(os.path.join(self.dirs[0], 'vm-2'), ws.path)
+        self.assertRaises(exception.InsufficientWorkspace,
+                          self.manager.reserve, 'vm-3', 500)
+
+    def test_min_free_kept(self):
+        self.assertRaises(exception.InsufficientWorkspace,
+                          self.manager.reserve, 'vm-1', 1950)
+
+    def test_release(self):
+        ws = self.manager.reserve('vm-1', 1800)
+        self.assertRaises(exception.InsufficientWorkspace,
+                          self.manager.reserve, 'vm-2', 1000)
+        ws.release(1000)
+        self.assertEqual(800, ws.reserved)
+        self.manager.reserve('vm-2', 1000)
+
+    def test_reserve_waits_for_space(self):
+        ws = self.manager.reserve('vm-1', 1800)
+
+        def sleep(interval):
+            ws.close(remove=True)
+
+        with mock.patch.object(workspace.time, 'sleep',
+                               side_effect=sleep) as mock_sleep:
+            other = self.manager.reserve('vm-2', 1800, timeout=60)
+        self.assertEqual(1, mock_sleep.call_count)
+        self.assertEqual(os.path.join(self.dirs[1], 'vm-2'), other.path)
+
+    def test_reserve_resumes_in_place(self):
+        path = os.path.join(self.dirs[0], 'vm-1')
+        os.makedirs(path)
+        ws = self.manager.reserve('vm-1', 500)
+        self.assertEqual(path, ws.path)
+        # The earlier attempt is in a directory without the space left.
+        self.free[self.dirs[0]] = 0
+        ws.close()
+        self.assertRaises(exception.InsufficientWorkspace,
+                          self.manager.reserve, 'vm-1', 500)
+
+    def test_remove(self):
+        ws = self.manager.reserve('vm-1', 1000)
+        staged = os.path.join(ws.path, 'disk-0.vmdk')
+        self._write(staged)
+        outside = os.path.join(self.dirs[0], 'disk-0.raw')
+        self._write(outside)
+
+        ws.remove(staged, 400)
+        ws.remove(outside, 400)
+        ws.remove(os.path.join(ws.path, 'missing'))
+
+        self.assertFalse(os.path.exists(staged))
+        self.assertTrue(os.path.exists(outside))
+        self.assertEqual(600, ws.reserved)
+
+    def test_close_remove(self):
+        ws = self.manager.reserve('vm-1', 1800)
+        self._write(os.path.join(ws.path, 'disk-0.qcow2'))
+        ws.close(remove=True)
+        self.assertFalse(os.path.exists(ws.path))
+        self.assertEqual(0, ws.reserved)
+        self.manager.reserve('vm-2', 1800)
+
+    def test_close_keeps_only_resumable_downloads(self):
+        ws = self.manager.reserve('vm-1', 1000)
+        names = ['disk-0.vmdk', 'disk-0.vmdk.manifest', 'disk-1.vmdk',
+                 'disk-1.qcow2', 'disk-2.vmdk.manifest', 'disk-3.raw']
+        for name in names:
+            self._write(os.path.join(ws.path, name))
+        os.makedirs(os.path.join(ws.path, 'tmp'))
+        self._write(os.path.join(ws.path, 'tmp', 'part'))
+
+        ws.close()
+
+        self.assertEqual(['disk-0.vmdk', 'disk-0.vmdk.manifest'],
+                         sorted(os.listdir(ws.path)))
+
+
+class ReapOrphansTestCase(test.TestCase):
+
+    def setUp(self):
+        super(ReapOrphansTestCase, self).setUp()
+        self.base_dir = self.useFixture(fixtures.TempDir()).path
+        self.manager = workspace.WorkspaceManager(
+            [self.base_dir, os.path.join(self.base_dir, 'missing')], 0)
+
+    def _workspace(self, name, files=('disk-0.vmdk',)):
+        path = os.path.join(self.base_dir, name)
+        os.makedirs(path)
+        for file_name in files:
+            with open(os.path.join(path, file_name), 'wb') as f:
+                f.write(b'x')
+        return path
+
+    def test_reap_orphans(self):
+        orphan = self._workspace('vm-1')
+        kept = self._workspace('vm-2', ['disk-0.vmdk',
+                                        'disk-0.vmdk.manifest',
+                                        'disk-1.qcow2'])
+        cache = self._workspace('_image_cache')
+
+        self.manager.reap_orphans(lambda name: name == 'vm-1')
+
+        self.assertFalse(os.path.exists(orphan))
+        self.assertEqual(['disk-0.vmdk', 'disk-0.vmdk.manifest'],
+                         sorted(os.listdir(kept)))
+        self.assertEqual(['disk-0.vmdk'], os.listdir(cache))
+
+    def test_reap_expired(self):
+        self.flags(workspace_orphan_ttl=1)
+        expired = self._workspace('vm-1')
+        os.utime(expired, (0, 0))
+        is_orphan = mock.Mock(return_value=False)
+
+        self.manager.reap_orphans(is_orphan)
+
+        self.assertFalse(os.path.exists(expired))
+        self.assertFalse(is_orphan.called)
+
+    def test_reap_keeps_unchecked(self):
+        path = self._workspace('vm-1', ['disk-0.vmdk',
+                                        'disk-0.vmdk.manifest'])
+        self.manager.reap_orphans(mock.Mock(side_effect=Exception))
+        self.assertEqual(2, len(os.listdir(path)))
@@ -0,0 +1,135 @@
+# Copyright (c) 2015 Aptira Pty Ltd.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for guts utilities."""
+
+import os
+
+import fixtures
+import mock
+from oslo_serialization import jsonutils
+
+from guts import test
+from guts import utils
+
+
+SNAPSHOT = {'id': '1', 'name': 'snap', 'vm-state-size': 0,
+            'date-sec': 1, 'date-nsec': 0, 'vm-clock-sec': 0,
+            'vm-clock-nsec': 0}
+
+
+class QemuImgInfoTestCase(test.TestCase):
+
+    def test_parse_json_backing_chain(self):
+        output = jsonutils.dumps([
+            {'filename': 'disk.qcow2', 'format': 'qcow2',
+             'virtual-size': 10737418240, 'actual-size': 1048576,
+             'cluster-size': 65536,
+             'backing-filename': 'base.qcow2',
+             'full-backing-filename': '/images/base.qcow2',
+             'snapshots': [SNAPSHOT]},
+            {'filename': '/images/base.qcow2', 'format': 'qcow2',
+             'virtual-size': 10737418240, 'actual-size': 4194304,
+             'cluster-size': 65536, 'snapshots': [SNAPSHOT],
+             'encrypted': True},
+        ])
+
+        info = utils.QemuImgInfo(output, format='json')
+
+        self.assertEqual('disk.qcow2', info.image)
+        self.assertEqual('/images/base.qcow2', info.backing_file)
+        self.assertEqual(10737418240, info.virtual_size)
+        self.assertEqual(1048576, info.disk_size)
+        self.assertEqual([SNAPSHOT], info.snapshots)
+        self.assertIsNone(info.encrypted)
+
+        self.assertEqual(1, len(info.backing_chain))
+        base = info.backing_chain[0]
+        self.assertEqual('/images/base.qcow2', base.image)
+        self.assertEqual(4194304, base.disk_size)
+        self.assertEqual([SNAPSHOT], base.snapshots)
+        self.assertEqual('yes', base.encrypted)
+        self.assertEqual([], base.backing_chain)
+        self.assertFalse(hasattr(base, 'snapshot_list'))
+
+    def test_parse_json_single_image(self):
+        output = jsonutils.dumps({'filename': 'disk.raw', 'format': 'raw',
+                                  'virtual-size': 1024})
+
+        info = utils.QemuImgInfo(output, format='json')
+
+        self.assertEqual('raw', info.file_format)
+        self.assertEqual([], info.snapshots)
+        self.assertEqual([], info.backing_chain)
+
+
+class QemuImgInfoCacheTestCase(test.TestCase):
+
+    def setUp(self):
+        super(QemuImgInfoCacheTestCase, self).setUp()
+        self.useFixture(fixtures.MockPatchObject(
+            utils, '_QEMU_IMG_INFO_CACHE', utils.LRUCache(10, 3600)))
+        self.execute = self.useFixture(fixtures.MockPatchObject(
+            utils, 'execute',
+            return_value=('{"filename": "disk", "format": "raw"}', ''))).mock
+        self.path = os.path.join(self.useFixture(fixtures.TempDir()).path,
+                                 'disk')
+        with open(self.path, 'wb') as f:
+            f.write(b'\0' * 512)
+
+    def test_cached_until_changed(self):
+        utils.qemu_img_info(self.path)
+        utils.qemu_img_info(self.path)
+        self.assertEqual(1, self.execute.call_count)
+
+        with open(self.path, 'ab') as f:
+            f.write(b'\0' * 512)
+        utils.qemu_img_info(self.path)
+        self.assertEqual(2, self.execute.call_count)
+
+    def test_remote_source_not_cached(self):
+        utils.qemu_img_info('json:{}')
+        utils.qemu_img_info('json:{}')
+        self.assertEqual(2, self.execute.call_count)
+
+
+class LRUCacheTestCase(test.TestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = utils.LRUCache(2, 3600)
+        cache.get('a', lambda: 1)
+        cache.get('b', lambda: 2)
+        cache.get('a', mock.Mock())
+        cache.get('c', lambda: 3)
+
+        self.assertEqual(1, cache.get('a', mock.Mock()))
+        self.assertEqual(4, cache.get('b', lambda: 4))
+        self.assertEqual({'size': 2, 'hits': 2, 'misses': 4}, cache.stats())
+
+    def test_expires(self):
+        cache = utils.LRUCache(2, 0)
+        cache.get('a', lambda: 1)
+
+        self.assertEqual(2, cache.get('a', lambda: 2))
+
+    def test_invalidate_during_load(self):
+        cache = utils.LRUCache(2, 3600)
+
+        def load():
+            cache.invalidate('a')
+            return 1
+
+        self.assertEqual(1, cache.get('a', load))
+        self.assertEqual(2, cache.get('a', lambda: 2))
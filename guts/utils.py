@@ -15,16 +15,23 @@
 
 """Utilities and helper functions."""
 
+import collections
 import inspect
 import os
 import pyclbr
 import re
+import shlex
 import sys
+import threading
+import time
 
+from eventlet.green import subprocess
+from eventlet import hubs
 from oslo_concurrency import lockutils
 from oslo_concurrency import processutils
 from oslo_config import cfg
 from oslo_log import log as logging
+from oslo_serialization import jsonutils
 from oslo_utils import importutils
 from oslo_utils import strutils
 from oslo_utils import timeutils
@@ -39,6 +46,9 @@ LOG = logging.getLogger(__name__)
 
 synchronized = lockutils.synchronized_with_prefix('guts-')
 
+# Progress printed by "qemu-img convert -p", e.g. "    (42.17/100%)".
+QEMU_IMG_PROGRESS_RE = re.compile(r"\((\d+(?:\.\d+)?)/100%\)")
+
 
 class QemuImgInfo(object):
     BACKING_FILE_RE = re.compile((r"^(.*?)\s*\(actual\s+path\s*:"
@@ -47,8 +57,22 @@ class QemuImgInfo(object):
     SIZE_RE = re.compile(r"(\d*\.?\d+)(\w+)?(\s*\(\s*(\d+)\s+bytes\s*\))?",
                          re.I)
 
-    def __init__(self, cmd_output=None):
-        details = self._parse(cmd_output or '')
+    def __init__(self, cmd_output=None, format='human'):
+        """Parse the output of qemu-img info.
+
+        :param format: 'human' for the default output, 'json' for the
+                       output of --output=json. With --backing-chain, the
+                       JSON output lists the image and its backing files,
+                       which are parsed into backing_chain.
+        """
+        self.backing_chain = []
+        if format == 'json':
+            details = self._parse_json(cmd_output or '{}')
+        else:
+            details = self._parse(cmd_output or '')
+        self._set_details(details)
+
+    def _set_details(self, details):
         self.image = details.get('image')
         self.backing_file = details.get('backing_file')
         self.file_format = details.get('file_format')
@@ -142,15 +166,35 @@ class QemuImgInfo(object):
                 })
         return real_details
 
+    def _parse_json(self, cmd_output):
+        images = jsonutils.loads(cmd_output)
+        if isinstance(images, list):
+            # --backing-chain output, the image comes first followed by
+            # its backing files, from the closest to the base image.
+            for backing_image in images[1:]:
+                backing_info = QemuImgInfo()
+                backing_info._set_details(self._json_details(backing_image))
+                self.backing_chain.append(backing_info)
+            images = images[0] if images else {}
+        return self._json_details(images)
+
+    def _json_details(self, image):
+        return {'image': image.get('filename'),
+                'backing_file': (image.get('full-backing-filename') or
+                                 image.get('backing-filename')),
+                'file_format': image.get('format'),
+                'virtual_size': image.get('virtual-size'),
+                'cluster_size': image.get('cluster-size'),
+                'disk_size': image.get('actual-size'),
+                'snapshot_list': image.get('snapshots', []),
+                'encrypted': 'yes' if image.get('encrypted') else None}
+
     def _parse(self, cmd_output):
         # Analysis done of qemu-img.c to figure out what is going on here
         # Find all points start with some chars and then a ':' then a newline
         # and then handle the results of those 'top level' items in a separate
         # function.
         #
-        # TODO(harlowja): newer versions might have a json output format
-        #                 we should switch to that whenever possible.
-        #                 see: http://bit.ly/XLJXDX
         contents = {}
         lines = [x for x in cmd_output.splitlines() if x.strip()]
         while lines:
@@ -166,6 +210,100 @@ class QemuImgInfo(object):
         return contents
 
 
+class SparseFileWriter(object):
+    """Write to a file, leaving holes where the data is all zeros.
+
+    All-zero chunks are skipped with a seek instead of being written, so
+    they take no space on filesystems supporting sparse files. close() must
+    be called to set the final file size when the data ends with zeros.
+    """
+
+    def __init__(self, fileobj):
+        self._file = fileobj
+        self._zero_blocks = {}
+        self.data_bytes = 0
+        self.zero_bytes = 0
+
+    def _is_zero(self, chunk):
+        size = len(chunk)
+        zero_block = self._zero_blocks.get(size)
+        if zero_block is None:
+            zero_block = self._zero_blocks[size] = b'\0' * size
+        return chunk == zero_block
+
+    def write(self, chunk):
+        if self._is_zero(chunk):
+            self._file.seek(len(chunk), os.SEEK_CUR)
+            self.zero_bytes += len(chunk)
+        else:
+            self._file.write(chunk)
+            self.data_bytes += len(chunk)
+
+    def close(self):
+        # Extends the file over a trailing hole, a no-op otherwise.
+        self._file.truncate()
+        self._file.flush()
+
+
+class LRUCache(object):
+    """Thread safe mapping with least recently used eviction and a TTL.
+
+    Holds at most max_size entries, each for at most ttl seconds. The number
+    of lookups that found an entry and of those that had to load it are
+    counted in hits and misses.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped by every invalidation, so that a value loaded while an
+        # invalidation ran is returned but not cached.
+        self._generation = 0
+
+    def get(self, key, load):
+        """Return the entry of key, calling load() to fill it if missing."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None and entry[0] > time.time():
+                self._entries[key] = entry
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            generation = self._generation
+
+        # Loaded outside of the lock, so a slow load does not hold up
+        # lookups of other keys.
+        value = load()
+        with self._lock:
+            if generation != self._generation:
+                return value
+            self._entries.pop(key, None)
+            self._entries[key] = (time.time() + self.ttl, value)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, key):
+        with self._lock:
+            self._generation += 1
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._entries),
+                    'hits': self.hits,
+                    'misses': self.misses}
+
+
 def get_root_helper():
     return 'sudo guts-rootwrap %s' % CONF.rootwrap_config
 
@@ -283,20 +421,64 @@ def check_string_length(value, name, min_length=0, max_length=None):
         raise exception.InvalidInput(reason=msg)
 
 
-def convert_image(source, dest, out_format, run_as_root=True):
-    """Convert image to other format."""
+def _execute_with_progress(cmd, progress_callback, run_as_root=True):
+    """Run a "qemu-img -p" command, passing its progress to the callback.
 
-    cmd = ('qemu-img', 'convert',
-           '-O', out_format, source, dest)
+    progress_callback is called with the completed fraction, between 0 and
+    1, each time qemu-img reports progress.
+    """
+    if run_as_root:
+        cmd = tuple(shlex.split(get_root_helper())) + tuple(cmd)
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE,
+                            stderr=subprocess.STDOUT, close_fds=True)
+    fd = proc.stdout.fileno()
+    output = []
+    while True:
+        # Progress lines end with a carriage return and never fill the
+        # pipe buffer, so read whatever is there once the pipe is readable.
+        hubs.trampoline(fd, read=True)
+        data = os.read(fd, 4096)
+        if not data:
+            break
+        data = data.decode('utf-8', 'replace')
+        output.append(QEMU_IMG_PROGRESS_RE.sub('', data))
+        reports = QEMU_IMG_PROGRESS_RE.findall(data)
+        if reports:
+            progress_callback(float(reports[-1]) / 100)
+    exit_code = proc.wait()
+    if exit_code:
+        raise processutils.ProcessExecutionError(
+            exit_code=exit_code, stdout=''.join(output).strip(),
+            cmd=' '.join(cmd))
+
+
+def convert_image(source, dest, out_format, run_as_root=True,
+                  progress_callback=None, convert_args=()):
+    """Convert image to other format.
+
+    progress_callback, when given, is called with the converted fraction of
+    the image as the conversion goes. convert_args are extra qemu-img
+    convert options, such as those of a conversion profile.
+    """
+
+    cmd = (('qemu-img', 'convert') + tuple(convert_args) +
+           ('-O', out_format, source, dest))
 
     start_time = timeutils.utcnow()
-    execute(*cmd, run_as_root=run_as_root)
+    if progress_callback:
+        _execute_with_progress(cmd[:2] + ('-p',) + cmd[2:],
+                               progress_callback, run_as_root=run_as_root)
+    else:
+        execute(*cmd, run_as_root=run_as_root)
     duration = timeutils.delta_seconds(start_time, timeutils.utcnow())
 
     if duration < 1:
         duration = 1
+    # Streamed sources are remote, the converted image has the same
+    # virtual size and can be inspected locally.
+    info_path = source if os.path.exists(source) else dest
     try:
-        image_size = qemu_img_info(source, run_as_root=True).virtual_size
+        image_size = qemu_img_info(info_path, run_as_root=True).virtual_size
     except ValueError as e:
         msg = _LI("The image was successfully converted, but image size "
                   "is unavailable. src %(src)s, dest %(dest)s. %(error)s")
@@ -318,10 +500,38 @@ def convert_image(source, dest, out_format, run_as_root=True):
     LOG.info(msg, {"sz": fsz_mb, "mbps": mbps})
 
 
+_QEMU_IMG_INFO_CACHE = LRUCache(256, 3600)
+
+
+def _qemu_img_info_key(path):
+    """Key identifying the current content of a local image, or None.
+
+    An image rewritten in place changes mtime or size, and one replaced
+    by another file changes inode, so a stale entry is never matched.
+    """
+    try:
+        st = os.stat(path)
+    except (OSError, TypeError):
+        # Not a local file, e.g. a json: source read over the network.
+        return None
+    return (path, st.st_ino, st.st_mtime, st.st_size)
+
+
 def qemu_img_info(path, run_as_root=True):
-    """Return an object containing the parsed output from qemu-img info."""
-    cmd = ('env', 'LC_ALL=C', 'qemu-img', 'info', path)
-    if os.name == 'nt':
-        cmd = cmd[2:]
-    out, _err = execute(*cmd, run_as_root=run_as_root)
-    return QemuImgInfo(out)
+    """Return an object containing the parsed output from qemu-img info.
+
+    Results for local images are cached until the image changes, so
+    inspecting the same image again costs no qemu-img process.
+    """
+    def load():
+        cmd = ('env', 'LC_ALL=C', 'qemu-img', 'info', '--output=json',
+               '--backing-chain', path)
+        if os.name == 'nt':
+            cmd = cmd[2:]
+        out, _err = execute(*cmd, run_as_root=run_as_root)
+        return QemuImgInfo(out, format='json')
+
+    key = _qemu_img_info_key(path)
+    if key is None:
+        return load()
+    return _QEMU_IMG_INFO_CACHE.get(key, load)
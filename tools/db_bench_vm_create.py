@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# Copyright (c) 2015 Aptira Pty Ltd.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Compare per row and bulk VM inserts.
+
+Usage: tools/db_bench_vm_create.py [--connection URL] [SIZE ...]
+
+Creates the guts schema in the given database (an in-memory SQLite database
+by default) and times db.vm_create called once per VM against
+db.vm_create_many for each SIZE (1000, 10000 and 100000 by default).
+"""
+
+from __future__ import print_function
+
+import argparse
+import sys
+import time
+import uuid
+
+from oslo_config import cfg
+
+from guts import context
+from guts.db.sqlalchemy import api as db_api
+from guts.db.sqlalchemy import models
+
+
+CONF = cfg.CONF
+
+
+def _make_vms(source_id, count):
+    return [{'name': 'vm-%d' % i,
+             'uuid_at_source': str(uuid.uuid4()),
+             'memory': '2048',
+             'vcpus': '2',
+             'virtual_disks': 'Hard disk 1 | 40.0GB | Thin: True | disk.vmdk',
+             'source_id': source_id}
+            for i in range(count)]
+
+
+def _timed(func, *args):
+    start = time.time()
+    func(*args)
+    return time.time() - start
+
+
+def _per_row(ctxt, vms):
+    for vm in vms:
+        db_api.vm_create(ctxt, vm)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--connection', default='sqlite://')
+    parser.add_argument('sizes', nargs='*', type=int,
+                        default=[1000, 10000, 100000])
+    args = parser.parse_args()
+
+    CONF([], project='guts')
+    CONF.set_override('connection', args.connection, group='database')
+    models.BASE.metadata.create_all(db_api.get_engine())
+
+    ctxt = context.get_admin_context()
+    source_id = str(uuid.uuid4())
+
+    print('%10s %14s %14s %10s' % ('rows', 'vm_create (s)',
+                                   'create_many (s)', 'speedup'))
+    for size in args.sizes:
+        per_row = _timed(_per_row, ctxt, _make_vms(source_id, size))
+        bulk = _timed(db_api.vm_create_many, ctxt,
+                      _make_vms(source_id, size))
+        print('%10d %14.3f %14.3f %9.1fx' % (size, per_row, bulk,
+                                             per_row / max(bulk, 1e-6)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())